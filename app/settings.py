@@ -47,6 +47,11 @@ SIMPLE_JWT = {
     "ALGORITHM": "HS512",
 }
 
+# Where rotated refresh tokens are blacklisted: "database" (the token blacklist tables) or "cache" (a denylist in the
+# cache keyed by JTI, so refreshing runs no token queries)
+REFRESH_TOKEN_DENYLIST = os.getenv('REFRESH_TOKEN_DENYLIST', 'database')
+TOKEN_DENYLIST_CACHE_ALIAS = os.getenv('TOKEN_DENYLIST_CACHE_ALIAS', 'default')
+
 # Authentication settings
 ACCOUNT_USER_MODEL_USERNAME_FIELD = None
 ACCOUNT_EMAIL_REQUIRED = True
@@ -64,6 +69,56 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Keyset pagination settings for list endpoints
+PAGINATION_PAGE_SIZE = int(os.getenv('PAGINATION_PAGE_SIZE', 50))
+PAGINATION_MAX_PAGE_SIZE = int(os.getenv('PAGINATION_MAX_PAGE_SIZE', 500))
+
+# Serialize list endpoints from values() rows and encode them with orjson, instead of through DRF serializers
+FAST_SERIALIZATION = os.getenv('FAST_SERIALIZATION', 'True') == 'True'
+
+# Number of rows read from the database and encoded at a time by NDJSON export endpoints
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+
+# Measure the SQL, serialization and total time of each request, for the Server-Timing header and the /metrics endpoint
+REQUEST_METRICS = os.getenv('REQUEST_METRICS', 'True') == 'True'
+
+# Bearer token required to read /metrics. Without one, /metrics is open in development and refused in production
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+METRICS_OPEN_WITHOUT_TOKEN = DEBUG or os.getenv('ENV') != 'PRODUCTION'
+
+# How often (in seconds) each worker checks whether its in-memory location indexes are stale
+REFERENCE_INDEX_CHECK_INTERVAL = int(os.getenv('REFERENCE_INDEX_CHECK_INTERVAL', 30))
+
+# Coordinates further than this from every city are left without a city
+NEAREST_CITY_MAX_DISTANCE_KM = float(os.getenv('NEAREST_CITY_MAX_DISTANCE_KM', 300))
+
+# Radius (in kilometers) of nearby experience searches when none is given, and the largest radius accepted
+NEARBY_DEFAULT_RADIUS_KM = float(os.getenv('NEARBY_DEFAULT_RADIUS_KM', 10))
+NEARBY_MAX_RADIUS_KM = float(os.getenv('NEARBY_MAX_RADIUS_KM', 100))
+
+# Cache backends: a shared Redis cache when REDIS_URL is set (production), local memory otherwise (development, tests)
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Cache used for read responses, and how long (in seconds) a response is kept
+RESPONSE_CACHE_ALIAS = os.getenv('RESPONSE_CACHE_ALIAS', 'default')
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+# Cache used for users resolved from JWT access tokens, and how long (in seconds) a user is kept
+AUTH_USER_CACHE_ALIAS = os.getenv('AUTH_USER_CACHE_ALIAS', 'default')
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', 60))
+
 # Only allow the following origins to access the API
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:8000",
@@ -100,6 +155,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     'storages',
     
@@ -107,7 +163,9 @@ INSTALLED_APPS = [
     
     'rest_framework',
     'rest_framework.authtoken',
+    'adrf',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',
     
     'allauth',
     'allauth.account',
@@ -124,6 +182,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'wayfinder.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -133,7 +192,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'wayfinder.middleware.StaticFilesMiddleware',
 ]
 
 ROOT_URLCONF = 'wayfinder.urls'
@@ -158,10 +217,12 @@ WSGI_APPLICATION = 'app.wsgi.application'
 
 # Database
 if os.getenv('ENV') == 'PRODUCTION':
+    # Under ASGI each request's queries run in a new thread with its own connection, so persistent connections
+    # would pile up rather than be reused; keep them off unless the workers are sync (or a pooler is in front)
     DATABASES = {
         'default': dj_database_url.config(
             default=os.getenv('DATABASE_URL'),
-            conn_max_age=600,
+            conn_max_age=int(os.getenv('CONN_MAX_AGE', 0)),
             ssl_require=True
         )
     }
@@ -225,6 +286,25 @@ AWS_S3_OBJECT_PARAMETERS = {
     'CacheControl': 'max-age=86400',  # Cache files for 1 day
 }
 
+# Background task queue: whether tasks run as soon as they are enqueued instead of by `run_worker` (the test runner
+# turns this on), and how long to wait before retrying a failed task, doubled after every failure up to the maximum
+TASKS_RUN_INLINE = os.getenv('TASKS_RUN_INLINE', 'False') == 'True'
+TASK_RETRY_DELAY = int(os.getenv('TASK_RETRY_DELAY', 10))
+TASK_MAX_RETRY_DELAY = int(os.getenv('TASK_MAX_RETRY_DELAY', 3600))
+TEST_RUNNER = 'wayfinder.test_runner.InlineTasksTestRunner'
+
+# Decimal places coordinates are rounded to for a location's grid key: points closer than this share a Location
+# (5 is about a meter). Run `merge_locations --rekey` after changing it
+LOCATION_GRID_PRECISION = int(os.getenv('LOCATION_GRID_PRECISION', 5))
+
+# Rows per transaction of bulk experience imports, and the most rows the import endpoint accepts in one request
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', 10000))
+
+# How long (in seconds) presigned upload URLs are valid, and the largest file they accept
+UPLOAD_URL_EXPIRY = int(os.getenv('UPLOAD_URL_EXPIRY', 600))
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 15 * 1024 * 1024))
+
 # MEDIA_URL = '/media/'
 # MEDIA_ROOT = BASE_DIR / 'media'
 
@@ -0,0 +1,22 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module is the gunicorn configuration, loaded automatically from the working directory. Workers
+run the ASGI application (`app.asgi`) with uvicorn's worker class, so the async read views can serve many requests
+per worker while they wait on the database or S3. Set GUNICORN_WORKER_CLASS=sync and serve `app.wsgi` to go back to
+sync workers.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = 5
+
+def child_exit(server, worker):
+    # Drop the metrics files of dead workers when Prometheus multiprocess mode is on
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
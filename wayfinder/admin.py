@@ -2,13 +2,13 @@
 Author: Matthew Hilliard
 Email: mch2003@bu.edu
 Description: This module registers the application's models (Location, User, Experience, Tip, 
-Wishlist, WishlistItem, Rating, and Tag) with the Django admin site, enabling their management 
+Wishlist, WishlistItem, Rating, Tag, and Task) with the Django admin site, enabling their management 
 through the admin interface.
 """
 
 from django.contrib import admin
 
-from .models import Location, User, Experience, Tip, Wishlist, WishlistItem, Rating, Tag
+from .models import Location, User, Experience, Tip, Wishlist, WishlistItem, Rating, Tag, Task
 
 '''Registering the models with the admin site'''
 admin.site.register(Location)
@@ -18,4 +18,5 @@ admin.site.register(Tip)
 admin.site.register(Wishlist)
 admin.site.register(WishlistItem)
 admin.site.register(Rating)
-admin.site.register(Tag)
\ No newline at end of file
+admin.site.register(Tag)
+admin.site.register(Task)
\ No newline at end of file
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class WayfinderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'wayfinder'
+
+    def ready(self):
+        # Connect the signal receivers and register the background tasks
+        from wayfinder import signals, tasks
@@ -0,0 +1,57 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines `CachedJWTAuthentication`, a JWT authentication class that resolves the token's user
+from a short-lived cache instead of loading the user row on every request. Saving or deleting a user (which covers
+password and `is_active` changes) removes them from the cache, and the timeout bounds how long a change made
+without signals, such as a queryset update, can go unnoticed.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+USER_KEY = 'wayfinder:auth-user:{}'
+
+def get_user_cache():
+    """
+    Get the cache backend for authenticated users, the default cache unless AUTH_USER_CACHE_ALIAS is set.
+    """
+    return caches[getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')]
+
+def invalidate_cached_user(user_id):
+    """
+    Remove a user from the authentication cache, so their next request loads them from the database.
+    """
+    get_user_cache().delete(USER_KEY.format(user_id))
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps the users it loads in the cache for AUTH_USER_CACHE_TIMEOUT seconds. Cached users
+    go through the same active and revoked token checks as users loaded from the database.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        cache = get_user_cache()
+        key = USER_KEY.format(user_id)
+        user = cache.get(key)
+        if user is None:
+            # Only users that pass the checks are cached
+            user = super().get_user(validated_token)
+            cache.set(key, user, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60))
+            return user
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
@@ -0,0 +1,321 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module declares the endpoint benchmarks run by the `run_benchmarks` management command. Every URL
+in `wayfinder/urls` has a benchmark with the request to send and a query budget, the most SQL statements one
+request may run. Requests are sent through the Django test client against the current database (normally the
+synthetic dataset from `seed_synthetic_data`), inside a transaction that is rolled back afterwards, and the
+response cache is bypassed so the uncached path is measured. Uploads are benchmarked against an S3 bucket mocked
+by moto.
+"""
+
+import json
+import math
+import time
+from contextlib import contextmanager, nullcontext
+from functools import cached_property
+import boto3
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from wayfinder.models import Experience, Location, Tag, Tip, User, Wishlist
+from wayfinder.tokens import uses_cache_denylist
+from wayfinder.uploads import create_presigned_upload, load_upload_token
+
+# Savepoints are transaction bookkeeping (including the benchmark's own), not queries of the endpoint
+SAVEPOINT_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+# Bucket the upload benchmarks store files in, which only exists in moto
+BENCHMARK_BUCKET = 'wayfinder-benchmark'
+
+class BenchmarkData:
+    """
+    Sample rows from the database that the benchmarked requests refer to, looked up once.
+    """
+
+    @cached_property
+    def user(self):
+        # A user with experiences and wishlists, so their list endpoints return rows
+        users = User.objects.annotate(wishlist_count=Count('wishlists')).filter(
+            wishlist_count__gt=0, created_experiences__isnull=False
+        ).order_by('-wishlist_count')
+        user = users.first() or User.objects.order_by('date_joined').first()
+        if user is None:
+            raise LookupError('The database has no users, seed it with seed_synthetic_data first.')
+        return user
+
+    @cached_property
+    def auth_header(self):
+        return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    @cached_property
+    def experience(self):
+        return Experience.objects.order_by('-number_of_ratings').first()
+
+    @cached_property
+    def other_experience(self):
+        # An experience that is not in the user's wishlist yet
+        wishlisted = self.wishlist.items.values('experience_id') if self.wishlist else []
+        return Experience.objects.exclude(pk__in=wishlisted).order_by('-average_rating').first()
+
+    @cached_property
+    def wishlist(self):
+        return Wishlist.objects.filter(user=self.user).annotate(item_count=Count('items')).order_by('-item_count').first()
+
+    @cached_property
+    def city_id(self):
+        return Location.objects.filter(city__isnull=False).values_list('city_id', flat=True).first()
+
+    @cached_property
+    def point(self):
+        # Coordinates of a location with experiences, for radius searches
+        return Location.objects.filter(experiences__isnull=False, latitude__isnull=False).values_list(
+            'latitude', 'longitude'
+        ).first()
+
+    @cached_property
+    def tip_city_id(self):
+        return Tip.objects.filter(city__isnull=False).values_list('city_id', flat=True).first()
+
+    @cached_property
+    def tag_names(self):
+        return list(Tag.objects.annotate(uses=Count('experiences')).order_by('-uses').values_list('name', flat=True)[:3])
+
+    @cached_property
+    def search_word(self):
+        title = self.experience.title if self.experience else ''
+        return title.split()[0] if title else 'museum'
+
+    @cached_property
+    def own_experience(self):
+        # An experience created by the user, which they may attach images to
+        return Experience.objects.filter(creator=self.user).order_by('pk').first()
+
+    def uploaded_image(self):
+        """
+        Upload a file for an experience image the way a client does, returning the request that confirms it.
+        Must run inside mock_s3_storage.
+        """
+        upload = create_presigned_upload(self.user, 'experience_image', 'image/jpeg')
+        default_storage.save(load_upload_token(upload['upload_token'])['name'], ContentFile(b'benchmark image'))
+        return {'upload_token': upload['upload_token'], 'experience_id': str(self.own_experience.pk)}
+
+    def export_chunks(self, queryset):
+        """
+        Get the number of chunks an export of the queryset is streamed in, as each chunk loads its relations.
+        """
+        return max(math.ceil(queryset.count() / getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)), 1)
+
+@contextmanager
+def mock_s3_storage():
+    """
+    Store files in an S3 bucket mocked by moto, for the upload endpoints, which only work with S3 storage.
+    """
+    # moto is a development dependency, like the benchmarks themselves
+    from moto import mock_aws
+
+    with mock_aws():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BENCHMARK_BUCKET)
+        storages = {**settings.STORAGES, 'default': {
+            'BACKEND': 'storages.backends.s3.S3Storage',
+            'OPTIONS': {'bucket_name': BENCHMARK_BUCKET, 'region_name': 'us-east-1', 'access_key': 'benchmark',
+                        'secret_key': 'benchmark'},
+        }}
+        with override_settings(STORAGES=storages):
+            yield
+
+class EndpointBenchmark:
+    """
+    Benchmark of one URL.
+
+    Parameters:
+        url_name (str): Name of the URL pattern
+        query_budget: Most SQL statements one request may run, or a function of the BenchmarkData returning it
+        method (str): HTTP method
+        expected_status (int): Status code every request must return
+        url_kwargs: Function of the BenchmarkData returning the URL's keyword arguments
+        params: Function of the BenchmarkData and request number returning the query parameters or request body
+        authenticated (bool): Whether to send the sample user's access token
+        iterations (int): Number of measured requests, defaults to the run's --iterations
+        headers (dict): Extra request headers, e.g. {"HTTP_AUTHORIZATION": ...}
+        settings (dict): Settings overridden while the requests run
+        context: Function returning a context manager the requests (and the building of their parameters) run in,
+                 e.g. mock_s3_storage
+    """
+
+    def __init__(self, url_name, query_budget, method='GET', expected_status=200, url_kwargs=None, params=None,
+                 authenticated=False, iterations=None, headers=None, settings=None, context=None):
+        self.url_name = url_name
+        self.query_budget = query_budget
+        self.method = method
+        self.expected_status = expected_status
+        self.url_kwargs = url_kwargs or (lambda data: {})
+        self.params = params or (lambda data, number: {})
+        self.authenticated = authenticated
+        self.iterations = iterations
+        self.headers = headers or {}
+        self.settings = settings or {}
+        self.context = context or nullcontext
+
+    def budget(self, data):
+        """
+        Get the query budget of this endpoint for the database's data.
+        """
+        return self.query_budget(data) if callable(self.query_budget) else self.query_budget
+
+    @contextmanager
+    def environment(self):
+        """
+        Enter the context and settings the benchmark's requests run with.
+        """
+        with self.context(), override_settings(**self.settings):
+            yield
+
+    def request(self, client, data, number):
+        """
+        Send one request and read the whole response. Must run inside `environment`.
+
+        Returns:
+            tuple: (response, elapsed seconds, number of SQL statements)
+        """
+        url = reverse(self.url_name, kwargs=self.url_kwargs(data))
+        extra = {**(data.auth_header if self.authenticated else {}), **self.headers}
+
+        params = self.params(data, number)
+
+        with CaptureQueriesContext(client.connection) as queries:
+            start = time.perf_counter()
+            if self.method == 'GET':
+                response = client.get(url, params, **extra)
+            else:
+                response = client.generic(self.method, url, json.dumps(params), 'application/json', **extra)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+
+        statements = [query for query in queries.captured_queries if not query['sql'].startswith(SAVEPOINT_PREFIXES)]
+        return response, elapsed, len(statements)
+
+class BenchmarkClient(APIClient):
+    """
+    Test client that knows the database connection its requests run on.
+    """
+
+    def __init__(self, connection, **kwargs):
+        super().__init__(**kwargs)
+        self.connection = connection
+
+# Benchmarks of every URL in wayfinder/urls, with their query budgets. Authenticated requests after the warmup
+# find the sample user in the authentication cache, so budgets of views using CachedJWTAuthentication exclude it
+BENCHMARKS = [
+    # Authentication
+    EndpointBenchmark('register', 12, method='POST', expected_status=201, params=lambda data, number: {
+        'name': 'Benchmark User', 'email': f'benchmark-{number}-{time.time_ns()}@example.com',
+        'password1': 'benchmark-password', 'password2': 'benchmark-password',
+        'location_type': 'city', 'location_id': data.city_id or 0,
+    }),
+    # Logins store the issued refresh tokens as outstanding tokens
+    EndpointBenchmark('login', 8, method='POST', params=lambda data, number: {
+        'email': data.user.email, 'password': 'synthetic-password',
+    }),
+    # Logout and rotation check and blacklist the refresh token in the database, unless the cache denylist is used
+    EndpointBenchmark('logout', lambda data: 0 if uses_cache_denylist() else 5, method='POST',
+                      params=lambda data, number: {'refresh': str(RefreshToken.for_user(data.user))}),
+    EndpointBenchmark('token_refresh', lambda data: 1 if uses_cache_denylist() else 9, method='POST',
+                      params=lambda data, number: {'refresh': str(RefreshToken.for_user(data.user))}),
+
+    # Experiences
+    # Locations created without a city queue a task to find their nearest city
+    EndpointBenchmark('create_experience', 6, method='POST', expected_status=201, authenticated=True,
+                      params=lambda data, number: {
+                          'title': 'Benchmark walk', 'description': 'A walk through the benchmark',
+                          'latitude': 42.35 + number / 1000, 'longitude': -71.06, 'price': 'free',
+                      }),
+    # Lookups of the tags, existing locations and nearest cities, then one insert each for locations, experiences
+    # and tag links, whatever the number of rows
+    EndpointBenchmark('import_experiences', 6, method='POST', authenticated=True,
+                      params=lambda data, number: {'experiences': [
+                          {'title': f'Imported walk {row}', 'description': 'An imported walk',
+                           'latitude': 42.35 + number / 1000, 'longitude': -71.06 + row / 1000,
+                           'tags': data.tag_names[:2], 'price': 'free'}
+                          for row in range(50)
+                      ]}),
+    EndpointBenchmark('get_experiences', 4),
+    EndpointBenchmark('get_experiences_with_filters', 4, params=lambda data, number: {
+        'tags': ','.join(data.tag_names[:1]), 'search_query': data.search_word, 'tag_mode': 'any',
+    }),
+    EndpointBenchmark('get_nearby_experiences', 4, params=lambda data, number: {
+        'latitude': data.point[0], 'longitude': data.point[1], 'radius_km': 50,
+    }),
+    EndpointBenchmark('get_experience_by_id', 4, url_kwargs=lambda data: {'experience_id': data.experience.pk}),
+    EndpointBenchmark('get_experiences_by_user_id', 4, url_kwargs=lambda data: {'user_id': data.user.pk}),
+    # One query for the experiences, then one per chunk for each of tags, creator groups and creator permissions
+    EndpointBenchmark('export_experiences', lambda data: 1 + 3 * data.export_chunks(Experience.objects.all()),
+                      iterations=1),
+
+    # Locations and tags
+    EndpointBenchmark('city_search', 0, params=lambda data, number: {'q': 'bos'}),
+    EndpointBenchmark('get_tags', 1),
+
+    # Users
+    EndpointBenchmark('get_user_by_id', 3, url_kwargs=lambda data: {'user_id': data.user.pk}),
+    EndpointBenchmark('update_user', 4, method='PUT', authenticated=True,
+                      url_kwargs=lambda data: {'user_id': data.user.pk},
+                      params=lambda data, number: {'name': data.user.name}),
+
+    # Ratings
+    # The rating aggregates are updated by a queued task
+    EndpointBenchmark('create_rating', 13, method='POST', expected_status=201, authenticated=True,
+                      params=lambda data, number: {
+                          'experience_id': str(data.experience.pk), 'rating_value': number % 5 + 1,
+                          'comment': 'Benchmark rating',
+                      }),
+    EndpointBenchmark('get_experience_ratings', 7, url_kwargs=lambda data: {'experience_id': data.experience.pk}),
+
+    # Wishlists
+    EndpointBenchmark('create_wishlist', 3, method='POST', expected_status=201, authenticated=True,
+                      params=lambda data, number: {'user_id': str(data.user.pk), 'title': 'Benchmark trip'}),
+    EndpointBenchmark('create_wishlist_item', 12, method='POST', expected_status=201, authenticated=True,
+                      url_kwargs=lambda data: {'wishlist_id': data.wishlist.pk},
+                      params=lambda data, number: {
+                          'user_id': str(data.user.pk), 'experience_id': str(data.other_experience.pk),
+                      }),
+    EndpointBenchmark('get_user_wishlists', 4, authenticated=True, url_kwargs=lambda data: {'user_id': data.user.pk}),
+    EndpointBenchmark('get_wishlist_items', 5, authenticated=True,
+                      url_kwargs=lambda data: {'wishlist_id': data.wishlist.pk}),
+
+    # Tips
+    EndpointBenchmark('create_tip', 3, method='POST', expected_status=201, authenticated=True,
+                      params=lambda data, number: {
+                          'content': 'Benchmark tip', 'location_type': 'city', 'location_id': data.tip_city_id,
+                      }),
+    EndpointBenchmark('get_tips_with_filters', 4, params=lambda data, number: {
+        'location_type': 'city', 'location_id': data.tip_city_id,
+    }),
+    EndpointBenchmark('get_tips_by_user_id', 3, url_kwargs=lambda data: {'user_id': data.user.pk}),
+    # One query for the tips, then one per chunk for each of creator groups and creator permissions
+    EndpointBenchmark('export_tips', lambda data: 1 + 2 * data.export_chunks(Tip.objects.filter(city=data.tip_city_id)),
+                      iterations=1, params=lambda data, number: {
+        'location_type': 'city', 'location_id': data.tip_city_id,
+    }),
+
+    # Uploads, against an S3 bucket mocked by moto. Presigning is signed locally; confirming loads the experience
+    # with its relations (one query and three prefetches), sends a HEAD to S3, saves the image and queues its variants
+    EndpointBenchmark('create_upload', 0, method='POST', expected_status=201, authenticated=True,
+                      context=mock_s3_storage,
+                      params=lambda data, number: {'target': 'experience_image', 'content_type': 'image/jpeg'}),
+    EndpointBenchmark('confirm_upload', 6, method='POST', authenticated=True, context=mock_s3_storage,
+                      params=lambda data, number: data.uploaded_image()),
+
+    # Response cache
+    EndpointBenchmark('get_cache_stats', 1, authenticated=True, expected_status=403),
+
+    # Metrics, read with a token as production requires
+    EndpointBenchmark('get_metrics', 0, settings={'METRICS_TOKEN': 'benchmark-token'},
+                      headers={'HTTP_AUTHORIZATION': 'Bearer benchmark-token'}),
+]
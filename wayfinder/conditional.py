@@ -0,0 +1,107 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module adds conditional GET support (ETag / Last-Modified) to list endpoints. Instead of hashing
+the serialized body, a view supplies a cheap fingerprint of its result set, the row count and the latest
+date_posted/date_added, read with one aggregate query, plus the response cache versions of the listed model and of
+the models embedded in its rows, which change without the count or newest date moving (e.g. a deleted row, or a
+creator renaming themselves). Last-Modified is the latest of the newest row's date and those models' last changes.
+If-None-Match and If-Modified-Since requests that match the fingerprint get a 304 response before the view queries or
+serializes anything. Both sync and async views are supported.
+"""
+
+import datetime
+import hashlib
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+from wayfinder.response_cache import get_cache_versions, get_last_change_time
+
+class ListState:
+    """
+    Fingerprint of a list endpoint's result.
+
+    Parameters:
+        parts (list): Values that change whenever the response body would change (e.g. row count, latest date)
+        last_modified (datetime): When the newest row was created, or None
+    """
+
+    def __init__(self, parts, last_modified):
+        self.parts = parts
+        self.last_modified = last_modified
+
+def queryset_state(queryset, date_field, *extra_parts, depends_on=()):
+    """
+    Fingerprint a queryset with one aggregate query over its row count and latest date.
+
+    Parameters:
+        queryset (QuerySet): The filtered (not paginated) queryset the view lists
+        date_field (str): The creation date field, e.g. "date_posted"
+        extra_parts: Other values the response depends on
+        depends_on (tuple): Lowercase names of the models embedded in each row (e.g. "user" for creator info),
+                            whose response cache versions are part of the fingerprint
+
+    Returns:
+        ListState: The fingerprint of the queryset
+    """
+    result = queryset.order_by().aggregate(count=Count('pk'), latest=Max(date_field))
+    latest = result['latest']
+    parts = [result['count'], latest.isoformat() if latest else None, *extra_parts]
+    if latest is not None:
+        # Deletes and edits of the listed rows, and changes to the rows embedded in them, move neither the count
+        # nor the newest date, so the times the models last changed count as modifications too
+        model_names = (queryset.model._meta.model_name, *depends_on)
+        parts.extend(get_cache_versions(model_names))
+        changed = datetime.datetime.fromtimestamp(get_last_change_time(model_names), tz=datetime.timezone.utc)
+        latest = max(latest, changed)
+    return ListState(parts, latest)
+
+def conditional_list(state_func):
+    """
+    Add ETag and Last-Modified headers to a list view and answer matching conditional requests with 304.
+
+    Parameters:
+        state_func: Called with the view's arguments, returns a ListState, or None to skip conditional handling
+                    (e.g. when the request will be rejected or the resource does not exist)
+
+    Usage:
+        @api_view(['GET'])
+        @authentication_classes([])
+        @permission_classes([AllowAny])
+        @conditional_list(tips_state)
+        def get_tips_with_filters(request):
+    """
+    def get_state(request, *args, **kwargs):
+        # Computed once per request and shared by the ETag and Last-Modified functions
+        if not hasattr(request, '_list_state'):
+            request._list_state = state_func(request, *args, **kwargs)
+        return request._list_state
+
+    def etag_func(request, *args, **kwargs):
+        state = get_state(request, *args, **kwargs)
+        if state is None:
+            return None
+        # The full path includes pagination and filter parameters, so each page has its own ETag
+        fingerprint = '|'.join([request.get_full_path()] + [str(part) for part in state.parts])
+        return '"%s"' % hashlib.md5(fingerprint.encode('utf-8')).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        state = get_state(request, *args, **kwargs)
+        return state.last_modified if state is not None else None
+
+    conditional = condition(etag_func=etag_func, last_modified_func=last_modified_func)
+
+    def decorator(view):
+        conditional_view = conditional(view)
+        if not iscoroutinefunction(view):
+            return conditional_view
+
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            # Query the state in a worker thread, the condition decorator then reads it from the request
+            if not hasattr(request, '_list_state'):
+                request._list_state = await sync_to_async(state_func)(request, *args, **kwargs)
+            return await conditional_view(request, *args, **kwargs)
+        return async_wrapper
+    return decorator
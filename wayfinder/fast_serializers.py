@@ -0,0 +1,392 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module provides a fast read path for list endpoints. A DRF serializer class is compiled once into
+a projection: the flat list of `.values()` columns it reads, and a function that builds its exact output from one
+row of those columns. Rows are fetched as dictionaries instead of model instances, many-to-many fields are loaded
+with one query on their through table, and the response is encoded with orjson. Every value still goes through the
+serializer field's own `to_representation`, so the JSON is the same as the serializer's. For exports, whole querysets
+are streamed as newline-delimited JSON, chunk by chunk over a server-side cursor. Every entry point has an async
+counterpart (prefixed with "a") that queries through the async ORM, for async views.
+"""
+
+from functools import lru_cache
+import orjson
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from rest_framework import serializers
+from wayfinder.metrics import timed_serialization
+
+def _encode_default(value):
+    # orjson handles str, numbers, UUIDs and containers itself, anything else is encoded like JsonResponse does
+    return DjangoJSONEncoder().default(value)
+
+class FastJsonResponse(HttpResponse):
+    """
+    JSON response encoded with orjson, a drop-in replacement for JsonResponse on hot read paths.
+    """
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        with timed_serialization():
+            content = orjson.dumps(data, default=_encode_default)
+        super().__init__(content=content, **kwargs)
+
+class ManyRelation:
+    """
+    A many-to-many field of a projection, loaded with one query on its through table.
+
+    Parameters:
+        owner_key (str): Row column holding the primary key of the object that owns the relation
+        model_field (ManyToManyField): The model field of the relation
+        child (Projection): Projection of the related objects, or None to return their primary keys
+    """
+
+    def __init__(self, owner_key, model_field, child):
+        self.owner_key = owner_key
+        self.model_field = model_field
+        self.child = child
+
+    def load(self, rows):
+        """
+        Load the related objects of every row.
+
+        Returns:
+            dict: Mapping of owner primary key to the list of serialized related objects (or primary keys)
+        """
+        owner_ids = {row[self.owner_key] for row in rows if row[self.owner_key] is not None}
+        if not owner_ids:
+            return {}
+        return self.collect(owner_ids, self.through_rows(owner_ids))
+
+    async def aload(self, rows):
+        """
+        Load the related objects of every row with the async ORM, like `load`.
+        """
+        owner_ids = {row[self.owner_key] for row in rows if row[self.owner_key] is not None}
+        if not owner_ids:
+            return {}
+        return self.collect(owner_ids, [through_row async for through_row in self.through_rows(owner_ids)])
+
+    def through_rows(self, owner_ids):
+        """
+        Get the through table rows of the owners, with the columns of the related objects.
+        """
+        through = self.model_field.remote_field.through
+        source = self.model_field.m2m_field_name()
+        target = self.model_field.m2m_reverse_field_name()
+        target_model = self.model_field.remote_field.model
+
+        # Match the order of the related manager, which follows the related model's default ordering
+        ordering = [
+            f'-{target}__{name[1:]}' if name.startswith('-') else f'{target}__{name}'
+            for name in target_model._meta.ordering
+        ] + ['pk']
+        if self.child is None:
+            columns = [source, target]
+        else:
+            columns = [source] + self.child.columns
+        return through.objects.filter(**{f'{source}__in': owner_ids}).order_by(*ordering).values(*columns)
+
+    def collect(self, owner_ids, through_rows):
+        """
+        Group the related objects of the fetched through table rows by owner.
+        """
+        source = self.model_field.m2m_field_name()
+        target = self.model_field.m2m_reverse_field_name()
+        related = {owner_id: [] for owner_id in owner_ids}
+        for through_row in through_rows:
+            if self.child is None:
+                value = through_row[target]
+            else:
+                value = self.child.build(through_row)
+            related[through_row[source]].append(value)
+        return related
+
+class Projection:
+    """
+    Compiled form of a DRF model serializer that builds its output from `.values()` rows.
+
+    Parameters:
+        serializer_class: The ModelSerializer class to compile
+        prefix (str): Lookup prefix of the serializer's model within the rows (e.g. "location__")
+
+    Raises:
+        TypeError: When the serializer nests a many-to-many field inside another (e.g. the experiences of each of an
+                   experience's tags), which would take one query per row
+    """
+
+    def __init__(self, serializer_class, prefix=''):
+        self.columns = []
+        self.relations = []
+        self.builders = self._compile(serializer_class(), prefix)
+
+    def _add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+        return column
+
+    def _compile(self, serializer, prefix):
+        """
+        Add the columns of each field of a serializer and return their builders, recursing into nested serializers.
+        """
+        builders = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            source = field.source
+            model_field = serializer.Meta.model._meta.get_field(source)
+
+            if isinstance(field, serializers.ListSerializer):
+                # Nested many-to-many serializer, e.g. tags
+                child = Projection(type(field.child), prefix=f'{model_field.m2m_reverse_field_name()}__')
+                if child.relations:
+                    raise TypeError(
+                        f'{type(serializer).__name__}.{name} nests many-to-many fields, which projections cannot '
+                        f'load. Use a serializer without them for "{name}", or disable FAST_SERIALIZATION.'
+                    )
+                relation = ManyRelation(self._add_column(prefix + self._pk_name(serializer)), model_field, child)
+                self.relations.append(relation)
+                builders.append(self._relation_builder(name, relation))
+            elif isinstance(field, serializers.BaseSerializer):
+                # Nested foreign key serializer, e.g. location_info, None when the foreign key is null
+                key = self._add_column(prefix + source)
+                builders.append(self._nested_builder(name, key, self._compile(field, f'{prefix}{source}__')))
+            elif isinstance(field, serializers.ManyRelatedField):
+                # Many-to-many primary keys, e.g. groups
+                relation = ManyRelation(self._add_column(prefix + self._pk_name(serializer)), model_field, None)
+                self.relations.append(relation)
+                builders.append(self._relation_builder(name, relation))
+            elif isinstance(field, serializers.RelatedField):
+                # Foreign key primary key, which the values() column already holds
+                builders.append(self._raw_builder(name, self._add_column(prefix + source)))
+            elif isinstance(field, serializers.FileField):
+                key = self._add_column(prefix + source)
+                builders.append(self._file_builder(name, key, model_field.storage))
+            else:
+                key = self._add_column(prefix + source)
+                builders.append(self._field_builder(name, key, field.to_representation))
+        return builders
+
+    def _pk_name(self, serializer):
+        return serializer.Meta.model._meta.pk.name
+
+    def _raw_builder(self, name, key):
+        def build(row, data, related):
+            data[name] = row[key]
+        return build
+
+    def _field_builder(self, name, key, to_representation):
+        def build(row, data, related):
+            value = row[key]
+            data[name] = None if value is None else to_representation(value)
+        return build
+
+    def _file_builder(self, name, key, storage):
+        def build(row, data, related):
+            value = row[key]
+            data[name] = storage.url(value) if value else None
+        return build
+
+    def _nested_builder(self, name, key, builders):
+        def build(row, data, related):
+            if row[key] is None:
+                data[name] = None
+                return
+            nested = {}
+            for builder in builders:
+                builder(row, nested, related)
+            data[name] = nested
+        return build
+
+    def _relation_builder(self, name, relation):
+        def build(row, data, related):
+            data[name] = related[relation].get(row[relation.owner_key], [])
+        return build
+
+    def build(self, row, related=None):
+        """
+        Build the serialized output of one row.
+        """
+        data = {}
+        for builder in self.builders:
+            builder(row, data, related)
+        return data
+
+    def fetch(self, queryset, extra_columns=()):
+        """
+        Fetch the rows of a queryset with every column this projection reads.
+
+        Parameters:
+            queryset (QuerySet): The queryset to fetch, which may be ordered and sliced
+            extra_columns (iterable): Other columns or annotations to include, e.g. pagination sort keys
+
+        Returns:
+            list: One dictionary per row
+        """
+        return list(self.values(queryset, extra_columns))
+
+    async def afetch(self, queryset, extra_columns=()):
+        """
+        Fetch the rows of a queryset with the async ORM, like `fetch`.
+        """
+        return [row async for row in self.values(queryset, extra_columns)]
+
+    def values(self, queryset, extra_columns=()):
+        columns = list(dict.fromkeys(list(self.columns) + list(extra_columns)))
+        return queryset.prefetch_related(None).values(*columns)
+
+    def render(self, rows):
+        """
+        Serialize fetched rows, loading the many-to-many fields of all of them together.
+
+        Returns:
+            list: The serialized rows, the same as `serializer_class(instances, many=True).data`
+        """
+        related = {relation: relation.load(rows) for relation in self.relations}
+        return self.build_rows(rows, related)
+
+    async def arender(self, rows):
+        """
+        Serialize fetched rows, loading their many-to-many fields with the async ORM, like `render`.
+        """
+        related = {relation: await relation.aload(rows) for relation in self.relations}
+        return self.build_rows(rows, related)
+
+    def build_rows(self, rows, related):
+        with timed_serialization():
+            return [self.build(row, related) for row in rows]
+
+    def stream(self, queryset, chunk_size):
+        """
+        Serialize a queryset of any size chunk by chunk, reading it through a server-side cursor so only one chunk
+        of rows is held in memory at a time.
+
+        Parameters:
+            queryset (QuerySet): The queryset to serialize
+            chunk_size (int): Number of rows fetched from the cursor, and serialized together, at a time
+
+        Yields:
+            list: The serialized rows of each chunk
+        """
+        chunk = []
+        for row in self.values(queryset).iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield self.render(chunk)
+                chunk = []
+        if chunk:
+            yield self.render(chunk)
+
+    async def astream(self, queryset, chunk_size):
+        """
+        Serialize a queryset of any size chunk by chunk with the async ORM, like `stream`.
+        """
+        chunk = []
+        async for row in self.values(queryset).aiterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield await self.arender(chunk)
+                chunk = []
+        if chunk:
+            yield await self.arender(chunk)
+
+@lru_cache(maxsize=None)
+def get_projection(serializer_class):
+    """
+    Get the compiled projection of a serializer class, compiling it on first use.
+    """
+    return Projection(serializer_class)
+
+def serialize_page(serializer_class, queryset, paginator):
+    """
+    Fetch and serialize one page of a queryset, through the fast path unless FAST_SERIALIZATION is disabled.
+
+    Parameters:
+        serializer_class: The serializer of the listed model
+        queryset (QuerySet): The filtered queryset to paginate
+        paginator (KeysetPaginator): The paginator of the request, whose next_cursor is set
+
+    Returns:
+        list: The serialized rows on the page
+    """
+    if not getattr(settings, 'FAST_SERIALIZATION', True):
+        rows = paginator.paginate(serializer_class.setup_eager_loading(queryset))
+        return serializer_class(rows, many=True).data
+
+    projection = get_projection(serializer_class)
+    sort_keys = [field.lstrip('-') for field in paginator.ordering]
+    rows = paginator.build_page(projection.fetch(paginator.page_queryset(queryset), sort_keys))
+    return projection.render(rows)
+
+async def aserialize_page(serializer_class, queryset, paginator):
+    """
+    Fetch and serialize one page of a queryset with the async ORM, like `serialize_page`.
+    """
+    if not getattr(settings, 'FAST_SERIALIZATION', True):
+        return await sync_to_async(serialize_page)(serializer_class, queryset, paginator)
+
+    projection = get_projection(serializer_class)
+    sort_keys = [field.lstrip('-') for field in paginator.ordering]
+    rows = paginator.build_page(await projection.afetch(paginator.page_queryset(queryset), sort_keys))
+    return await projection.arender(rows)
+
+def paginated_response(serializer_class, queryset, paginator, empty_404=False):
+    """
+    Respond with one serialized page of a queryset and the cursor for the next page.
+
+    Parameters:
+        serializer_class: The serializer of the listed model
+        queryset (QuerySet): The filtered queryset to paginate
+        paginator (KeysetPaginator): The paginator of the request
+        empty_404 (bool): Whether to respond 404 when the page is empty
+
+    Returns:
+        HttpResponse: {"data": [...], "next_cursor": ...}
+    """
+    data = serialize_page(serializer_class, queryset, paginator)
+    return page_response(data, queryset, paginator, empty_404)
+
+async def apaginated_response(serializer_class, queryset, paginator, empty_404=False):
+    """
+    Respond with one serialized page of a queryset, fetched with the async ORM, like `paginated_response`.
+    """
+    data = await aserialize_page(serializer_class, queryset, paginator)
+    return page_response(data, queryset, paginator, empty_404)
+
+def page_response(data, queryset, paginator, empty_404):
+    if empty_404 and not data:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+    response_class = FastJsonResponse if getattr(settings, 'FAST_SERIALIZATION', True) else JsonResponse
+    return response_class({'data': data, 'next_cursor': paginator.next_cursor})
+
+def ndjson_response(serializer_class, queryset, request=None):
+    """
+    Stream every row of a queryset as newline-delimited JSON, one serialized object per line.
+
+    Parameters:
+        serializer_class: The serializer of the exported model
+        queryset (QuerySet): The filtered queryset to export, in the order it should be streamed
+        request: The request, whose server decides how rows are read. Under ASGI they are read with the async ORM
+                 into an async iterator, otherwise with a sync iterator (Django would buffer an iterator of the
+                 other kind in memory)
+
+    Returns:
+        StreamingHttpResponse: application/x-ndjson response, encoded one chunk of rows at a time
+    """
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    projection = get_projection(serializer_class)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        async def lines():
+            async for chunk in projection.astream(queryset, chunk_size):
+                yield encode_lines(chunk)
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+    lines = (encode_lines(chunk) for chunk in projection.stream(queryset, chunk_size))
+    return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+def encode_lines(items):
+    return b''.join(orjson.dumps(item, default=_encode_default) + b'\n' for item in items)
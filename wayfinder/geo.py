@@ -0,0 +1,69 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module holds the geometry behind radius searches. `bounding_box` gives the latitude/longitude
+ranges that contain every point within a distance of a coordinate, which the coordinate index answers cheaply, and
+`distance_km` builds the exact great-circle (haversine) distance as a database expression, which is only evaluated
+for the rows inside the box.
+"""
+
+import math
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+# Mean radius of the earth in kilometers
+EARTH_RADIUS_KM = 6371.0088
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Get the smallest latitude/longitude box containing every point within a distance of a coordinate.
+
+    Parameters:
+        latitude (float): Latitude of the center, in degrees
+        longitude (float): Longitude of the center, in degrees
+        radius_km (float): Distance from the center, in kilometers
+
+    Returns:
+        tuple: (min_latitude, max_latitude, longitude_ranges), where longitude_ranges is a list of
+               (min_longitude, max_longitude) pairs: two when the box crosses the antimeridian, one otherwise
+    """
+    angular_radius = radius_km / EARTH_RADIUS_KM
+    min_latitude = latitude - math.degrees(angular_radius)
+    max_latitude = latitude + math.degrees(angular_radius)
+    # A circle around a pole covers every longitude
+    if min_latitude <= -90 or max_latitude >= 90:
+        return max(min_latitude, -90.0), min(max_latitude, 90.0), [(-180.0, 180.0)]
+
+    longitude_delta = math.degrees(math.asin(min(1.0, math.sin(angular_radius) / math.cos(math.radians(latitude)))))
+    min_longitude = longitude - longitude_delta
+    max_longitude = longitude + longitude_delta
+    if max_longitude - min_longitude >= 360:
+        return min_latitude, max_latitude, [(-180.0, 180.0)]
+    if min_longitude < -180:
+        return min_latitude, max_latitude, [(min_longitude + 360, 180.0), (-180.0, max_longitude)]
+    if max_longitude > 180:
+        return min_latitude, max_latitude, [(min_longitude, 180.0), (-180.0, max_longitude - 360)]
+    return min_latitude, max_latitude, [(min_longitude, max_longitude)]
+
+def distance_km(latitude_field, longitude_field, latitude, longitude):
+    """
+    Build the great-circle distance between the coordinates in two fields and a fixed coordinate, in kilometers.
+
+    Parameters:
+        latitude_field (str): Name of the latitude field, e.g. "location__latitude"
+        longitude_field (str): Name of the longitude field
+        latitude (float): Latitude of the fixed coordinate, in degrees
+        longitude (float): Longitude of the fixed coordinate, in degrees
+
+    Returns:
+        Expression: The distance, as a float
+    """
+    row_latitude = Radians(F(latitude_field))
+    half_latitude_delta = (row_latitude - Value(math.radians(latitude))) / 2
+    half_longitude_delta = (Radians(F(longitude_field)) - Value(math.radians(longitude))) / 2
+    haversine = (
+        Power(Sin(half_latitude_delta), 2)
+        + Value(math.cos(math.radians(latitude))) * Cos(row_latitude) * Power(Sin(half_longitude_delta), 2)
+    )
+    # Rounding can take the square root just past 1, outside the domain of asin
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Least(Sqrt(haversine), Value(1.0)), output_field=FloatField())
@@ -1,31 +1,118 @@
 """
 Author: Matthew Hilliard
 Email: mch2003@bu.edu
-Description: This module provides helper functions, currently just `find_nearest_city`, which attempts to locate 
-the nearest city to a given latitude and longitude by incrementally expanding the search range.
+Description: This module provides helper functions: `find_nearest_city` and `find_nearest_cities`, which
+locate the city nearest to one or many latitude/longitude pairs using the in-memory nearest-city index, and
+`resolve_location_names` and `resolve_location_id`, which resolve the place names or IDs sent to the write endpoints
+using the in-memory location index, and `location_instances`, which loads the places they resolved to.
 """
 
-from cities_light.models import City
+from django.conf import settings
+from cities_light.models import City, Country
+from wayfinder.indexes.locations import ResolvedLocation, location_index
+from wayfinder.indexes.nearest_city import nearest_city_index
 
-def find_nearest_city(latitude, longitude, max_attempts=5, increment=0.5):
+def _max_distance(max_distance_km):
+    if max_distance_km is None:
+        return getattr(settings, 'NEAREST_CITY_MAX_DISTANCE_KM', None)
+    return max_distance_km
+
+def find_nearest_city(latitude, longitude, max_distance_km=None):
     """
-    Attempt to find the nearest city by incrementally expanding the search range.
+    Find the city nearest to a coordinate by great-circle (haversine) distance.
 
     Parameters:
         latitude (float): The latitude to search from.
         longitude (float): The longitude to search from.
-        max_attempts (int): The maximum number of incremental search attempts.
-        increment (float): The amount to expand the search range on each attempt.
+        max_distance_km (float): Ignore cities further away than this, defaults to NEAREST_CITY_MAX_DISTANCE_KM.
+
+    Returns:
+        City or None: The nearest city, or None if no city is within the maximum distance.
+    """
+    max_distance_km = _max_distance(max_distance_km)
+    city_id, distance = nearest_city_index.nearest(latitude, longitude)
+    if city_id is None or (max_distance_km is not None and distance > max_distance_km):
+        return None
+    return City.objects.filter(id=city_id).first()
+
+def find_nearest_cities(coordinates, max_distance_km=None):
+    """
+    Find the nearest city for each of many coordinates, loading all of the matched cities in one query.
+
+    Parameters:
+        coordinates (iterable): (latitude, longitude) pairs to search from.
+        max_distance_km (float): Ignore cities further away than this, defaults to NEAREST_CITY_MAX_DISTANCE_KM.
+
+    Returns:
+        list: The nearest City (or None) for each coordinate, in the same order.
+    """
+    max_distance_km = _max_distance(max_distance_km)
+    city_ids = []
+    for city_id, distance in nearest_city_index.nearest_many(coordinates):
+        if city_id is not None and max_distance_km is not None and distance > max_distance_km:
+            city_id = None
+        city_ids.append(city_id)
+
+    cities = City.objects.in_bulk([city_id for city_id in city_ids if city_id is not None])
+    return [cities.get(city_id) for city_id in city_ids]
+
+def resolve_location_names(country_name=None, region_name=None, city_name=None):
+    """
+    Resolve a country, region and city by name, ignoring case, accents and extra whitespace, and matching alternate
+    names. The region is looked for in the country, and the city in the region or country.
+
+    Parameters:
+        country_name (str): Name of the country, if any.
+        region_name (str): Name of the region, if any.
+        city_name (str): Name of the city, if any.
 
     Returns:
-        City or None: The nearest city found within the search range, or None if no city is found.
-    """
-    for attempt in range(max_attempts):
-        range_increment = increment * (attempt + 1)
-        city = City.objects.filter(
-            latitude__range=(latitude - range_increment, latitude + range_increment),
-            longitude__range=(longitude - range_increment, longitude + range_increment)
-        ).first()
-        if city:
-            return city
-    return None
\ No newline at end of file
+        ResolvedLocation: The country_id, region_id and city_id found, each None if no place matched.
+    """
+    if not (country_name or region_name or city_name):
+        return ResolvedLocation(None, None, None)
+    return location_index.resolve_names(country_name, region_name, city_name)
+
+def resolve_location_id(location_type, location_id):
+    """
+    Resolve a "country" or "city" ID, as sent by registration and tips, to the country and city it stands for.
+    Places added since the index was last built are looked up in the database.
+
+    Parameters:
+        location_type (str): "country" or "city".
+        location_id: ID of the country or city, as an int or a string.
+
+    Returns:
+        ResolvedLocation or None: The country_id, region_id and city_id (the city's country and region for a city),
+        or None if there is no such place.
+    """
+    try:
+        location_id = int(location_id)
+    except (TypeError, ValueError):
+        return None
+
+    if location_type == 'country':
+        if location_index.country(location_id) is not None or Country.objects.filter(id=location_id).exists():
+            return ResolvedLocation(location_id, None, None)
+    elif location_type == 'city':
+        city = location_index.city(location_id)
+        if city is None:
+            city = City.objects.filter(id=location_id).values('id', 'country_id', 'region_id').first()
+            if city is None:
+                return None
+            return ResolvedLocation(city['country_id'], city['region_id'], city['id'])
+        return ResolvedLocation(city.country_id, city.region_id, city.id)
+    return None
+
+def location_instances(resolved):
+    """
+    Get the places of a resolved location as Country, Region and City instances, from the in-memory location index.
+    Only their ID, name and parent IDs are loaded, which is all the serializers read.
+
+    Parameters:
+        resolved (ResolvedLocation): Result of resolve_location_names or resolve_location_id.
+
+    Returns:
+        tuple: (Country, Region, City), each None if not resolved.
+    """
+    return location_index.instances(resolved)
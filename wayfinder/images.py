@@ -0,0 +1,141 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module generates resized variants of uploaded images, so clients can download a thumbnail or a
+card sized image instead of the original photo. Every variant is encoded as WebP and JPEG without the original's
+metadata (EXIF, including GPS position), and the variants' file names and dimensions are recorded in the
+`<field>_variants` JSON field next to the image field. Processing is queued as a background task when a new image
+is saved, so the request that uploaded the image does not wait for it, and failed attempts (e.g. S3 errors) are
+retried by the task queue. Images saved without signals (e.g. by bulk updates) are picked up by `process_images`.
+"""
+
+from io import BytesIO
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+from wayfinder.task_queue import task
+
+# Boxes the variants are scaled down to fit in, keeping the image's aspect ratio
+IMAGE_VARIANTS = {
+    'thumbnail': (320, 320),
+    'card': (960, 640),
+}
+
+# Encoder options of each format every variant is saved in
+IMAGE_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+# Image fields that have resized variants, by model label
+IMAGE_FIELDS = {
+    'wayfinder.experience': 'image',
+    'wayfinder.user': 'profile_picture',
+}
+
+# EXIF orientations that rotate the image by 90 degrees, swapping its width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+ORIENTATION_TAG = 0x0112
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+def variant_name(source, variant, extension):
+    """
+    Get the file name of a variant, next to the original: "experience_images/walk.jpg" gives
+    "experience_images/variants/walk-thumbnail.webp".
+    """
+    directory, _, filename = source.rpartition('/')
+    prefix = f'{directory}/' if directory else ''
+    return f'{prefix}variants/{filename.rsplit(".", 1)[0]}-{variant}.{extension}'
+
+def render_variants(file):
+    """
+    Decode an image and encode each of its variants in every format.
+
+    Parameters:
+        file: Open binary file of the original image
+
+    Returns:
+        tuple: ((width, height) of the original, {variant: ((width, height), {extension: bytes})})
+    """
+    image = Image.open(file)
+    width, height = image.size
+    if image.getexif().get(ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+
+    # Let JPEGs decode at a reduced scale that still covers the largest variant, which is much faster
+    longest = max(max(box) for box in IMAGE_VARIANTS.values())
+    image.draft('RGB', (longest, longest))
+    icc_profile = image.info.get('icc_profile')
+    image = ImageOps.exif_transpose(image)
+
+    # Flatten transparency onto white, as JPEG has no alpha channel
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    variants = {}
+    for variant, box in IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(box, Image.Resampling.LANCZOS)
+        # Only the color profile is kept, the rest of the metadata is dropped
+        resized.info = {}
+        encoded = {}
+        for extension, options in IMAGE_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, icc_profile=icc_profile, **options)
+            encoded[extension] = buffer.getvalue()
+        variants[variant] = (resized.size, encoded)
+    return (width, height), variants
+
+@task(max_attempts=3)
+def process_image(model_label, pk, field_name):
+    """
+    Generate and store the variants of an instance's image, and record them on the instance. Nothing is recorded
+    when the image was replaced or removed in the meantime, as its new image has been scheduled itself.
+
+    Parameters:
+        model_label (str): Label of the model, e.g. "wayfinder.experience"
+        pk: Primary key of the instance
+        field_name (str): Name of the image field
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).only(field_name).first()
+    field_file = getattr(instance, field_name, None)
+    if not field_file:
+        return
+
+    source = field_file.name
+    try:
+        with field_file.open('rb') as file:
+            size, rendered = render_variants(file)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as error:
+        # Unreadable images are marked so they are not retried
+        variants = {'source': source, 'error': str(error)}
+    else:
+        variants = {'source': source, 'width': size[0], 'height': size[1]}
+        for variant, ((width, height), encoded) in rendered.items():
+            variants[variant] = {'width': width, 'height': height}
+            for extension, content in encoded.items():
+                name = variant_name(source, variant, extension)
+                variants[variant][extension] = field_file.storage.save(name, ContentFile(content))
+
+    with transaction.atomic():
+        instance = model.objects.select_for_update().filter(pk=pk).only(field_name).first()
+        if instance is None or getattr(instance, field_name).name != source:
+            return
+        setattr(instance, variants_field(field_name), variants)
+        # Saving sends the usual signals, which invalidate cached responses and users
+        instance.save(update_fields=[variants_field(field_name)])
+
+def schedule_image_processing(instance, field_name):
+    """
+    Queue the generation of the variants of an instance's image, which starts once the current transaction commits.
+    """
+    process_image.enqueue(model_label=instance._meta.label_lower, pk=str(instance.pk), field_name=field_name)
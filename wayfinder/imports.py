@@ -0,0 +1,254 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module imports experiences in bulk, for onboarding partner content thousands of experiences at a
+time. Rows are read from JSON or CSV and imported in batches: each batch resolves its country, region and city names
+from the in-memory location index, finds the nearest city for every location left without one in a single pass over
+the nearest-city index, upserts its locations by grid key (reusing existing locations at the same point), and inserts
+the experiences and tag links with one bulk_create each. Invalid rows are reported with their row number and
+skipped, and the other rows of their batch are still imported. Used by the `import_experiences` view and command.
+"""
+
+import csv
+import io
+import itertools
+import json
+from django.conf import settings
+from django.db import transaction
+from wayfinder.helpers import find_nearest_cities, resolve_location_names
+from wayfinder.managers import location_grid_key
+from wayfinder.models import Experience, Location, Tag
+from wayfinder.response_cache import bump_cache_version
+
+IMPORT_FORMATS = ('json', 'csv')
+
+# Rows have the fields of a create_experience request, except that tags are given by name (comma-separated in CSV):
+# title, description, latitude, longitude, country_name, region_name, city_name, tags, price
+
+class ImportFileError(ValueError):
+    """
+    Raised when an import file cannot be read at all, as opposed to errors in single rows.
+    """
+
+def read_rows(file, file_format):
+    """
+    Read the rows of an import file.
+
+    Parameters:
+        file: Open binary or text file
+        file_format (str): "json" (a list of objects, or an object with an "experiences" list) or "csv" (with a
+                           header row)
+
+    Returns:
+        iterable: One dict per row
+
+    Raises:
+        ImportFileError: When the file is not valid JSON or CSV
+    """
+    if file_format not in IMPORT_FORMATS:
+        raise ImportFileError(f'Format must be one of: {", ".join(IMPORT_FORMATS)}.')
+    content = file.read()
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ImportFileError('The file must be UTF-8 encoded.')
+
+    if file_format == 'csv':
+        return csv.DictReader(io.StringIO(content))
+    try:
+        rows = json.loads(content)
+    except json.JSONDecodeError as error:
+        raise ImportFileError(f'The file is not valid JSON: {error}.')
+    if isinstance(rows, dict):
+        rows = rows.get('experiences')
+    if not isinstance(rows, list):
+        raise ImportFileError('The JSON must be a list of experiences, or an object with an "experiences" list.')
+    return rows
+
+class ExperienceImport:
+    """
+    Import of experiences created by one user. Call `run` with the rows to import, then read the counts and
+    errors from `result()`.
+
+    Parameters:
+        creator (User): The user the experiences are created by
+        batch_size (int): Number of rows imported per transaction, defaults to IMPORT_BATCH_SIZE
+    """
+
+    def __init__(self, creator, batch_size=None):
+        self.creator = creator
+        self.batch_size = batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', 1000)
+        self.created = 0
+        self.locations_created = 0
+        self.errors = []
+        self.rows = 0
+        # Tags already looked up in this import, including names that matched nothing
+        self.tags = {}
+
+    def run(self, rows):
+        """
+        Import rows in batches. Each batch is committed on its own, so an import that is cut off keeps the batches
+        it finished.
+
+        Parameters:
+            rows (iterable): Dicts with the fields of an experience, e.g. from read_rows
+
+        Returns:
+            dict: The result of the import (see `result`)
+        """
+        iterator = iter(rows)
+        while True:
+            batch = list(itertools.islice(iterator, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch, first_row=self.rows + 1)
+            self.rows += len(batch)
+
+        if self.created:
+            # Bulk inserts do not send save signals, so invalidate cached responses directly
+            transaction.on_commit(lambda: bump_cache_version('experience', 'location'))
+        return self.result()
+
+    def result(self):
+        """
+        Get the number of rows read, experiences and locations created, and the errors of the skipped rows (each
+        with its 1-based row number, not counting a CSV header).
+        """
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'locations_created': self.locations_created,
+            'errors': self.errors,
+        }
+
+    def import_batch(self, batch, first_row):
+        """
+        Validate and import one batch of rows in a single transaction.
+        """
+        valid = []
+        for row_number, row in enumerate(batch, start=first_row):
+            try:
+                valid.append((row_number, self.clean_row(row)))
+            except ValueError as error:
+                self.errors.append({'row': row_number, 'error': str(error)})
+        self.resolve_tags(valid)
+        if not valid:
+            return
+
+        # Resolve the place names, then the nearest city of coordinates whose city was not found by name
+        for _, row in valid:
+            row['country_id'], row['region_id'], row['city_id'] = resolve_location_names(
+                row['country_name'], row['region_name'], row['city_name']
+            )
+        unresolved = [row for _, row in valid if row['city_id'] is None]
+        cities = find_nearest_cities([(row['latitude'], row['longitude']) for row in unresolved])
+        for row, city in zip(unresolved, cities):
+            row['city_id'] = city.id if city else None
+
+        with transaction.atomic():
+            locations = self.get_locations([row for _, row in valid])
+            experiences = []
+            tag_links = []
+            for _, row in valid:
+                experience = Experience(
+                    title=row['title'],
+                    description=row['description'],
+                    location=locations[(row['latitude'], row['longitude'])],
+                    creator=self.creator,
+                    price=row['price'],
+                )
+                experiences.append(experience)
+                tag_links.extend(
+                    Experience.tags.through(experience_id=experience.pk, tag_id=tag_id) for tag_id in row['tag_ids']
+                )
+            Experience.objects.bulk_create(experiences)
+            Experience.tags.through.objects.bulk_create(tag_links)
+        self.created += len(experiences)
+
+    def clean_row(self, row):
+        """
+        Check a row's fields like create_experience does, and convert them to their Python types.
+
+        Raises:
+            ValueError: With the reason the row is invalid
+        """
+        if not isinstance(row, dict):
+            raise ValueError('Each experience must be an object.')
+        title = str(row.get('title') or '').strip()
+        description = str(row.get('description') or '').strip()
+        latitude = row.get('latitude')
+        longitude = row.get('longitude')
+        if not title or not description or latitude in (None, '') or longitude in (None, ''):
+            raise ValueError('Title, description, latitude, and longitude are required.')
+        if len(title) > Experience._meta.get_field('title').max_length:
+            raise ValueError('Title is too long.')
+        try:
+            latitude = float(latitude)
+            longitude = float(longitude)
+        except (TypeError, ValueError):
+            raise ValueError('Latitude and longitude must be valid floating-point numbers.')
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError('Latitude and longitude are out of range.')
+
+        price = row.get('price') or None
+        prices = [value for value, _ in Experience._meta.get_field('price').choices]
+        if price is not None and price not in prices:
+            raise ValueError(f'Price must be one of: {", ".join(prices)}.')
+
+        tags = row.get('tags') or []
+        if isinstance(tags, str):
+            tags = tags.split(',')
+        if not isinstance(tags, list):
+            raise ValueError('Tags must be a list of tag names.')
+
+        return {
+            'title': title,
+            'description': description,
+            'latitude': latitude,
+            'longitude': longitude,
+            'country_name': str(row.get('country_name') or '').strip(),
+            'region_name': str(row.get('region_name') or '').strip(),
+            'city_name': str(row.get('city_name') or '').strip(),
+            'tag_names': {str(name).strip() for name in tags} - {''},
+            'price': price,
+        }
+
+    def resolve_tags(self, valid):
+        """
+        Look up the tags of a batch's rows by name, and move rows with unknown tags to the errors.
+        """
+        missing = {name for _, row in valid for name in row['tag_names']} - self.tags.keys()
+        if missing:
+            found = dict(Tag.objects.filter(name__in=missing).values_list('name', 'tag_id'))
+            self.tags.update({name: found.get(name) for name in missing})
+
+        for row_number, row in list(valid):
+            unknown = sorted(name for name in row['tag_names'] if self.tags[name] is None)
+            if unknown:
+                valid.remove((row_number, row))
+                self.errors.append({'row': row_number, 'error': f'Unknown tags: {", ".join(unknown)}.'})
+            else:
+                row['tag_ids'] = [self.tags[name] for name in row['tag_names']]
+
+    def get_locations(self, rows):
+        """
+        Get the location of each distinct point of a batch, reusing existing locations with the same grid key and
+        creating the others, in one upsert.
+
+        Returns:
+            dict: Location by (latitude, longitude)
+        """
+        new_locations = {}
+        for row in rows:
+            key = location_grid_key(row['latitude'], row['longitude'])
+            new_locations.setdefault(key, Location(
+                latitude=row['latitude'], longitude=row['longitude'], country_id=row['country_id'],
+                region_id=row['region_id'], city_id=row['city_id'],
+            ))
+        locations = Location.objects.upsert_many(list(new_locations.values()))
+        self.locations_created += sum(1 for key, location in new_locations.items() if locations[key].pk == location.pk)
+        return {
+            (row['latitude'], row['longitude']): locations[location_grid_key(row['latitude'], row['longitude'])]
+            for row in rows
+        }
@@ -0,0 +1,3 @@
+# indexes/__init__.py
+
+# In-process indexes over the cities_light reference tables, built once per worker
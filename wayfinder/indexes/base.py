@@ -0,0 +1,117 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module provides the shared machinery for in-process indexes built from the django-cities-light
+reference tables. Each index is built lazily once per worker, and rebuilt when the reference data changes: saving or
+deleting a Country, Region or City bumps a version stored in the shared cache, which workers compare against the
+version their index was built from at most once every `REFERENCE_INDEX_CHECK_INTERVAL` seconds.
+"""
+
+import threading
+import time
+import unicodedata
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+# Cache key holding the current version of the cities_light reference data
+REFERENCE_DATA_VERSION_KEY = 'wayfinder:reference-data-version'
+
+def normalize_name(name):
+    """
+    Normalize a place name for matching: strip accents, fold case and collapse whitespace.
+
+    Parameters:
+        name (str): The name to normalize
+
+    Returns:
+        str: The normalized name, e.g. "São Paulo" -> "sao paulo"
+    """
+    if not name:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+def split_alternate_names(alternate_names):
+    """
+    Split the semicolon-separated alternate_names field of a cities_light model into a list of names.
+    """
+    if not alternate_names:
+        return []
+    return [name for name in alternate_names.split(';') if name.strip()]
+
+def get_reference_data_version():
+    """
+    Get the current version of the reference data, initializing it if the cache has none.
+    """
+    return cache.get_or_set(REFERENCE_DATA_VERSION_KEY, uuid.uuid4().hex, None)
+
+def mark_reference_data_changed():
+    """
+    Record that the cities_light tables changed so every worker rebuilds its indexes.
+    """
+    cache.set(REFERENCE_DATA_VERSION_KEY, uuid.uuid4().hex, None)
+    ReferenceDataIndex.invalidate_all()
+
+class ReferenceDataIndex:
+    """
+    Base class for a lazily built, per-worker index over the cities_light tables.
+    Subclasses implement `build()`, which returns the index data served by `get()`.
+    """
+    _instances = []
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._version = None
+        self._checked_at = 0.0
+        ReferenceDataIndex._instances.append(self)
+
+    @classmethod
+    def invalidate_all(cls):
+        """
+        Make every index in this worker check the reference data version on its next use.
+        """
+        for index in cls._instances:
+            index._checked_at = 0.0
+
+    def build(self):
+        """
+        Build the index data from the database. Implemented by subclasses.
+        """
+        raise NotImplementedError
+
+    def get(self):
+        """
+        Get the index data, building it on first use and rebuilding it if the reference data changed.
+        While a rebuild is running, other threads keep using the previous data.
+        """
+        data = self._data
+        if data is not None and time.monotonic() - self._checked_at < self._check_interval():
+            return data
+
+        if data is None:
+            # Nothing to serve yet, so wait for the first build
+            with self._lock:
+                if self._data is None:
+                    self._refresh()
+                return self._data
+
+        if self._lock.acquire(blocking=False):
+            try:
+                self._checked_at = time.monotonic()
+                if get_reference_data_version() != self._version:
+                    self._refresh()
+            finally:
+                self._lock.release()
+        return self._data
+
+    def _refresh(self):
+        version = get_reference_data_version()
+        self._data = self.build()
+        self._version = version
+        self._checked_at = time.monotonic()
+
+    def _check_interval(self):
+        return getattr(settings, 'REFERENCE_INDEX_CHECK_INTERVAL', 30)
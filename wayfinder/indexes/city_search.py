@@ -0,0 +1,167 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the in-memory autocomplete index behind `city_search`. Country and city names,
+including their alternate names, are normalized and indexed twice: a sorted list of names for prefix lookups on short
+queries (topped up with a scan over every name when too few names start with the query), and trigram posting lists
+for substring lookups on longer ones. Matches are ranked by population (countries use the total population of their
+cities), with names that start with the query ranked first.
+"""
+
+import bisect
+import heapq
+import itertools
+from array import array
+from django.db.models import Sum
+from cities_light.models import City, Country
+from .base import ReferenceDataIndex, normalize_name, split_alternate_names
+
+# Queries shorter than this are answered from the prefix list, longer ones from the trigram postings
+TRIGRAM_SIZE = 3
+
+def trigrams(text):
+    """
+    Get the set of three-character substrings of a normalized name.
+    """
+    return {text[i:i + TRIGRAM_SIZE] for i in range(len(text) - TRIGRAM_SIZE + 1)}
+
+class NameIndex:
+    """
+    Prefix and trigram index over a list of named records.
+
+    Parameters:
+        records (list): The records returned by `search`, in the same order as `names` and `scores`
+        names (list): For each record, the list of names it can be found by
+        scores (list): For each record, the ranking score (population)
+    """
+
+    def __init__(self, records, names, scores):
+        self.records = records
+        self.scores = scores
+        self.names = [tuple({normalize_name(name) for name in record_names} - {''}) for record_names in names]
+
+        # Sorted (name, position) pairs for prefix lookups
+        self.prefixes = sorted(
+            (name, position) for position, record_names in enumerate(self.names) for name in record_names
+        )
+        self.prefix_keys = [name for name, _ in self.prefixes]
+
+        # Trigram posting lists for substring lookups
+        postings = {}
+        for position, record_names in enumerate(self.names):
+            for gram in set().union(*(trigrams(name) for name in record_names)):
+                postings.setdefault(gram, []).append(position)
+        self.trigrams = {gram: array('I', positions) for gram, positions in postings.items()}
+
+        # Positions ordered by score, used when the query is empty
+        self.by_score = sorted(range(len(records)), key=lambda position: -scores[position])
+
+        # Every record's names in one string, each record starting at its offset, for substring scans of queries too
+        # short for trigrams. Normalized names hold no newlines, so a match never spans two names
+        texts = [''.join(f'{name}\n' for name in record_names) for record_names in self.names]
+        self.offsets = list(itertools.accumulate((len(text) for text in texts[:-1]), initial=0)) if texts else []
+        self.haystack = ''.join(texts)
+
+    def _prefix_matches(self, query):
+        start = bisect.bisect_left(self.prefix_keys, query)
+        end = bisect.bisect_left(self.prefix_keys, query + '\uffff')
+        return {position for _, position in self.prefixes[start:end]}
+
+    def _scan_matches(self, query):
+        # Find each record containing the query once, skipping to the next record after every match
+        matches = set()
+        start = self.haystack.find(query)
+        while start != -1:
+            position = bisect.bisect_right(self.offsets, start) - 1
+            matches.add(position)
+            if position + 1 == len(self.offsets):
+                break
+            start = self.haystack.find(query, self.offsets[position + 1])
+        return matches
+
+    def _substring_matches(self, query):
+        postings = sorted((self.trigrams.get(gram, ()) for gram in trigrams(query)), key=len)
+        if not postings or not postings[0]:
+            return set()
+        candidates = set(postings[0])
+        for positions in postings[1:]:
+            candidates.intersection_update(positions)
+            if not candidates:
+                return candidates
+        # Trigrams can match out of order, so confirm the query really is a substring
+        return {position for position in candidates if any(query in name for name in self.names[position])}
+
+    def search(self, query, limit):
+        """
+        Find the records whose names contain the query.
+
+        Parameters:
+            query (str): The search text
+            limit (int): The maximum number of records to return
+
+        Returns:
+            list: Up to `limit` matching records, best first
+        """
+        query = normalize_name(query)
+        if not query:
+            return [self.records[position] for position in self.by_score[:limit]]
+
+        if len(query) < TRIGRAM_SIZE:
+            matches = self._prefix_matches(query)
+            # Names starting with the query rank first, so other substrings are only needed to fill the page
+            if len(matches) < limit:
+                matches |= self._scan_matches(query)
+        else:
+            matches = self._substring_matches(query)
+
+        def rank(position):
+            starts_with_query = any(name.startswith(query) for name in self.names[position])
+            return (starts_with_query, self.scores[position])
+
+        return [self.records[position] for position in heapq.nlargest(limit, matches, key=rank)]
+
+class CitySearchIndex(ReferenceDataIndex):
+    """
+    Autocomplete index over cities_light countries and cities.
+    """
+
+    def build(self):
+        # Rank countries by the total population of their cities, as countries have no population of their own
+        country_population = dict(
+            City.objects.order_by().values('country_id').annotate(total=Sum('population')).values_list('country_id', 'total')
+        )
+        country_records, country_names, country_scores = [], [], []
+        countries = Country.objects.order_by().values_list('id', 'name', 'alternate_names')
+        for country_id, name, alternate_names in countries:
+            country_records.append({'id': country_id, 'name': name})
+            country_names.append([name] + split_alternate_names(alternate_names))
+            country_scores.append(country_population.get(country_id) or 0)
+
+        city_records, city_names, city_scores = [], [], []
+        cities = City.objects.order_by().values_list(
+            'id', 'name', 'alternate_names', 'population', 'region__name', 'country__name'
+        ).iterator(chunk_size=5000)
+        for city_id, name, alternate_names, population, region_name, country_name in cities:
+            city_records.append({'id': city_id, 'name': name, 'region': region_name, 'country': country_name})
+            city_names.append([name] + split_alternate_names(alternate_names))
+            city_scores.append(population or 0)
+
+        return {
+            'countries': NameIndex(country_records, country_names, country_scores),
+            'cities': NameIndex(city_records, city_names, city_scores),
+        }
+
+    def search_countries(self, query, limit=5):
+        """
+        Find countries whose name or alternate names contain the query, most populous first.
+        """
+        return self.get()['countries'].search(query, limit)
+
+    def search_cities(self, query, limit=10):
+        """
+        Find cities whose name or alternate names contain the query, most populous first.
+        """
+        return self.get()['cities'].search(query, limit)
+
+# Shared index for this worker
+city_search_index = CitySearchIndex()
@@ -0,0 +1,190 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the in-memory index behind location resolution on the write paths. It holds every
+cities_light country, region and city with its parent IDs and normalized names (including alternate names), so a
+country -> region -> city hierarchy of names, or a country or city ID, is resolved without querying the reference
+tables. Names are matched exactly first, then as a prefix, then as a substring (like the `icontains` lookups it
+replaces), and resolved names are memoized until the index is rebuilt. Resolved places can be loaded as model
+instances with only their ID, name and parent IDs set, the fields the serializers read, without a query.
+"""
+
+from collections import namedtuple
+from cities_light.models import City, Country, Region
+from .base import ReferenceDataIndex, normalize_name, split_alternate_names
+
+# A place of the reference data: its name, normalized names, parent IDs and population (0 for countries and regions)
+Place = namedtuple('Place', ['id', 'name', 'names', 'country_id', 'region_id', 'population'])
+
+# IDs of the country, region and city a location resolved to, each None if it was not found
+ResolvedLocation = namedtuple('ResolvedLocation', ['country_id', 'region_id', 'city_id'])
+
+# Most resolved names kept per build of the index
+MEMO_SIZE = 10000
+
+class PlaceGroup:
+    """
+    Places sharing a parent (e.g. the cities of a region), with an exact lookup of their normalized names.
+    """
+
+    def __init__(self):
+        self.places = []
+        self.by_name = {}
+
+    def add(self, place):
+        self.places.append(place)
+        for name in place.names:
+            self.by_name.setdefault(name, []).append(place)
+
+    def match(self, query):
+        """
+        Find the best place named by a normalized query: exact matches first, then prefix and substring matches.
+        Ties go to the most populous place, then the shortest name.
+        """
+        def rank(place):
+            return (-place.population, len(place.name), place.id)
+
+        exact = self.by_name.get(query)
+        if exact:
+            return min(exact, key=rank)
+        prefixed, contained = [], []
+        for place in self.places:
+            if any(name.startswith(query) for name in place.names):
+                prefixed.append(place)
+            elif any(query in name for name in place.names):
+                contained.append(place)
+        candidates = prefixed or contained
+        return min(candidates, key=rank) if candidates else None
+
+class LocationIndex(ReferenceDataIndex):
+    """
+    Index of the cities_light countries, regions and cities by ID and by name within their parents.
+    """
+
+    def build(self):
+        countries, regions, cities = {}, {}, {}
+        all_countries = PlaceGroup()
+        regions_by_country, cities_by_region, cities_by_country = {}, {}, {}
+
+        def names(name, alternate_names):
+            return tuple({normalize_name(name) for name in [name] + split_alternate_names(alternate_names)} - {''})
+
+        for country_id, name, alternate_names in Country.objects.order_by().values_list('id', 'name', 'alternate_names'):
+            place = Place(country_id, name, names(name, alternate_names), country_id, None, 0)
+            countries[country_id] = place
+            all_countries.add(place)
+
+        region_rows = Region.objects.order_by().values_list('id', 'name', 'alternate_names', 'country_id')
+        for region_id, name, alternate_names, country_id in region_rows.iterator(chunk_size=5000):
+            place = Place(region_id, name, names(name, alternate_names), country_id, region_id, 0)
+            regions[region_id] = place
+            regions_by_country.setdefault(country_id, PlaceGroup()).add(place)
+
+        city_rows = City.objects.order_by().values_list(
+            'id', 'name', 'alternate_names', 'country_id', 'region_id', 'population'
+        )
+        for city_id, name, alternate_names, country_id, region_id, population in city_rows.iterator(chunk_size=5000):
+            place = Place(city_id, name, names(name, alternate_names), country_id, region_id, population or 0)
+            cities[city_id] = place
+            cities_by_region.setdefault(region_id, PlaceGroup()).add(place)
+            cities_by_country.setdefault(country_id, PlaceGroup()).add(place)
+
+        return {
+            'countries': countries,
+            'regions': regions,
+            'cities': cities,
+            'all_countries': all_countries,
+            'regions_by_country': regions_by_country,
+            'cities_by_region': cities_by_region,
+            'cities_by_country': cities_by_country,
+            'memo': {},
+        }
+
+    def resolve_names(self, country_name=None, region_name=None, city_name=None):
+        """
+        Resolve a country, region and city by name. The region is looked for in the country and the city in the
+        region, or in the country when no region was found. A city is only looked for within a country or region,
+        as a city name alone is too ambiguous.
+
+        Parameters:
+            country_name (str): Name of the country, if any
+            region_name (str): Name of the region, if any
+            city_name (str): Name of the city, if any
+
+        Returns:
+            ResolvedLocation: The IDs of the places found
+        """
+        data = self.get()
+        key = (normalize_name(country_name), normalize_name(region_name), normalize_name(city_name))
+        resolved = data['memo'].get(key)
+        if resolved is not None:
+            return resolved
+
+        country_query, region_query, city_query = key
+        country = data['all_countries'].match(country_query) if country_query else None
+        region = None
+        if region_query and country is not None:
+            group = data['regions_by_country'].get(country.id)
+            region = group.match(region_query) if group else None
+        city = None
+        if city_query and (region is not None or country is not None):
+            if region is not None:
+                group = data['cities_by_region'].get(region.id)
+            else:
+                group = data['cities_by_country'].get(country.id)
+            city = group.match(city_query) if group else None
+
+        resolved = ResolvedLocation(
+            country.id if country else None, region.id if region else None, city.id if city else None,
+        )
+        if len(data['memo']) >= MEMO_SIZE:
+            data['memo'].clear()
+        data['memo'][key] = resolved
+        return resolved
+
+    def country(self, country_id):
+        """
+        Get a country by ID, or None if the index has no such country.
+        """
+        return self.get()['countries'].get(country_id)
+
+    def region(self, region_id):
+        """
+        Get a region by ID, or None if the index has no such region.
+        """
+        return self.get()['regions'].get(region_id)
+
+    def city(self, city_id):
+        """
+        Get a city by ID, or None if the index has no such city.
+        """
+        return self.get()['cities'].get(city_id)
+
+    def instances(self, resolved):
+        """
+        Get the Country, Region and City of a resolved location as model instances with only their ID, name and
+        parent IDs loaded, like a queryset's `only()`: any other field is loaded from the database when read. Places
+        added since the index was built are loaded from the database.
+
+        Returns:
+            tuple: (Country, Region, City), each None if not resolved
+        """
+        data = self.get()
+        return (
+            _load_place(Country, resolved.country_id, data['countries']),
+            _load_place(Region, resolved.region_id, data['regions']),
+            _load_place(City, resolved.city_id, data['cities']),
+        )
+
+def _load_place(model, place_id, places):
+    if place_id is None:
+        return None
+    fields = [field.attname for field in model._meta.concrete_fields
+              if field.attname in ('id', 'name', 'country_id', 'region_id')]
+    place = places.get(place_id)
+    if place is None:
+        return model.objects.only(*fields).filter(pk=place_id).first()
+    return model.from_db('default', fields, [getattr(place, field) for field in fields])
+
+# Shared index for this worker
+location_index = LocationIndex()
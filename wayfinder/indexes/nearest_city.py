@@ -0,0 +1,150 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines an in-memory spatial index for finding the city nearest to a coordinate. Each
+cities_light city is stored as a point on the unit sphere in a 3-d KD-tree. The straight-line (chord) distance between
+two points on the sphere grows with the great-circle distance, so the nearest point in the tree is exactly the
+haversine-nearest city, found in O(log n) time.
+"""
+
+import math
+from .base import ReferenceDataIndex
+from cities_light.models import City
+from wayfinder.geo import EARTH_RADIUS_KM
+
+def to_unit_vector(latitude, longitude):
+    """
+    Convert a latitude and longitude in degrees to a point on the unit sphere.
+    """
+    lat = math.radians(latitude)
+    lng = math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lng), cos_lat * math.sin(lng), math.sin(lat))
+
+def chord_to_km(squared_chord):
+    """
+    Convert a squared chord length on the unit sphere to a great-circle distance in kilometers.
+    """
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(squared_chord) / 2))
+
+class KDTree:
+    """
+    Static 3-d KD-tree stored implicitly in arrays: the node of the range [lo, hi) is at (lo + hi) // 2,
+    its left subtree is [lo, mid) and its right subtree is [mid + 1, hi).
+
+    Parameters:
+        ids (list): Identifier of each point
+        points (list): (x, y, z) coordinates of each point
+    """
+
+    def __init__(self, ids, points):
+        order = list(range(len(points)))
+        self._partition(order, points, 0, len(order), 0)
+        self.ids = [ids[i] for i in order]
+        self.points = [points[i] for i in order]
+
+    def _partition(self, order, points, lo, hi, axis):
+        # Iterative to avoid deep recursion while building
+        stack = [(lo, hi, axis)]
+        while stack:
+            lo, hi, axis = stack.pop()
+            if hi - lo <= 1:
+                continue
+            order[lo:hi] = sorted(order[lo:hi], key=lambda i: points[i][axis])
+            mid = (lo + hi) // 2
+            next_axis = (axis + 1) % 3
+            stack.append((lo, mid, next_axis))
+            stack.append((mid + 1, hi, next_axis))
+
+    def nearest(self, target):
+        """
+        Find the point closest to the target.
+
+        Parameters:
+            target (tuple): (x, y, z) coordinates to search from
+
+        Returns:
+            tuple: (id, squared distance) of the closest point, or (None, inf) if the tree is empty
+        """
+        points = self.points
+        best_distance = math.inf
+        best_position = None
+        # Each entry is a subtree and the squared distance from the target to its splitting plane
+        stack = [(0, len(points), 0, 0.0)]
+        while stack:
+            lo, hi, axis, plane_distance = stack.pop()
+            # Skip subtrees that cannot contain anything closer than the best match so far
+            if lo >= hi or plane_distance >= best_distance:
+                continue
+            mid = (lo + hi) // 2
+            point = points[mid]
+            dx = point[0] - target[0]
+            dy = point[1] - target[1]
+            dz = point[2] - target[2]
+            distance = dx * dx + dy * dy + dz * dz
+            if distance < best_distance:
+                best_distance = distance
+                best_position = mid
+
+            # Visit the side of the splitting plane containing the target first
+            diff = target[axis] - point[axis]
+            next_axis = (axis + 1) % 3
+            if diff < 0:
+                stack.append((mid + 1, hi, next_axis, diff * diff))
+                stack.append((lo, mid, next_axis, 0.0))
+            else:
+                stack.append((lo, mid, next_axis, diff * diff))
+                stack.append((mid + 1, hi, next_axis, 0.0))
+
+        if best_position is None:
+            return None, math.inf
+        return self.ids[best_position], best_distance
+
+class NearestCityIndex(ReferenceDataIndex):
+    """
+    Nearest-city index over the coordinates of every cities_light city.
+    """
+
+    def build(self):
+        ids, points = [], []
+        cities = City.objects.order_by().filter(latitude__isnull=False, longitude__isnull=False)
+        for city_id, latitude, longitude in cities.values_list('id', 'latitude', 'longitude').iterator(chunk_size=5000):
+            ids.append(city_id)
+            points.append(to_unit_vector(float(latitude), float(longitude)))
+        return KDTree(ids, points)
+
+    def nearest(self, latitude, longitude):
+        """
+        Find the city nearest to a coordinate.
+
+        Parameters:
+            latitude (float): The latitude to search from
+            longitude (float): The longitude to search from
+
+        Returns:
+            tuple: (city id, distance in kilometers), or (None, None) if there are no cities
+        """
+        city_id, distance = self.get().nearest(to_unit_vector(latitude, longitude))
+        if city_id is None:
+            return None, None
+        return city_id, chord_to_km(distance)
+
+    def nearest_many(self, coordinates):
+        """
+        Find the nearest city for each of many coordinates.
+
+        Parameters:
+            coordinates (iterable): (latitude, longitude) pairs
+
+        Returns:
+            list: (city id, distance in kilometers) for each coordinate, in the same order
+        """
+        tree = self.get()
+        results = []
+        for latitude, longitude in coordinates:
+            city_id, distance = tree.nearest(to_unit_vector(latitude, longitude))
+            results.append((city_id, chord_to_km(distance)) if city_id is not None else (None, None))
+        return results
+
+# Shared index for this worker
+nearest_city_index = NearestCityIndex()
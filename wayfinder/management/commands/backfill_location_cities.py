@@ -0,0 +1,56 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the `backfill_location_cities` management command, which assigns the nearest city
+to every Location that has coordinates but no city. Locations are processed in batches, each resolved with a single
+call to the nearest-city index and saved with one bulk update.
+"""
+
+from django.core.management.base import BaseCommand
+from wayfinder.helpers import find_nearest_cities
+from wayfinder.models import Location
+from wayfinder.response_cache import bump_cache_version
+
+class Command(BaseCommand):
+    help = 'Assign the nearest city to locations that have coordinates but no city.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of locations to update per batch.')
+        parser.add_argument('--max-distance-km', type=float, default=None,
+                            help='Ignore cities further away than this (defaults to NEAREST_CITY_MAX_DISTANCE_KM).')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        locations = Location.objects.filter(
+            city__isnull=True, latitude__isnull=False, longitude__isnull=False
+        ).order_by('location_id')
+
+        updated = 0
+        last_id = None
+        while True:
+            # Walk the table by primary key so each batch is a cheap index range scan
+            batch = locations if last_id is None else locations.filter(location_id__gt=last_id)
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].location_id
+
+            cities = find_nearest_cities(
+                [(location.latitude, location.longitude) for location in batch],
+                max_distance_km=options['max_distance_km'],
+            )
+            changed = []
+            for location, city in zip(batch, cities):
+                if city is None:
+                    continue
+                location.city = city
+                location.region_id = location.region_id or city.region_id
+                location.country_id = location.country_id or city.country_id
+                changed.append(location)
+            Location.objects.bulk_update(changed, ['city', 'region', 'country'])
+            updated += len(changed)
+
+        # Bulk updates do not send save signals, so invalidate cached locations directly
+        bump_cache_version('location')
+
+        self.stdout.write(self.style.SUCCESS(f'Assigned a city to {updated} locations.'))
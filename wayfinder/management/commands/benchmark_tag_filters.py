@@ -0,0 +1,64 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the `benchmark_tag_filters` management command, which times the tag filters of
+`get_experiences_with_filters` against the current database. It compares the old approach (one join through the
+experience-tag table per tag) with the grouped "all" subquery and the "any" subquery, using the most common tags
+unless tags are given.
+"""
+
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from wayfinder.pagination import EXPERIENCE_ORDERING
+from wayfinder.models import Experience, Tag
+
+class Command(BaseCommand):
+    help = 'Time tag filtering of experiences with chained joins, the "all" subquery and the "any" subquery.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tags', help='Comma-separated tag names, defaults to the most common tags.')
+        parser.add_argument('--tag-count', type=int, default=10, help='Number of common tags to use without --tags.')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs of each query.')
+        parser.add_argument('--page-size', type=int, default=50, help='Number of experiences fetched per query.')
+        parser.add_argument('--explain', action='store_true', help='Print the EXPLAIN ANALYZE plan of each query.')
+
+    def handle(self, *args, **options):
+        if options['tags']:
+            tag_names = [name.strip() for name in options['tags'].split(',') if name.strip()]
+        else:
+            tag_names = list(
+                Tag.objects.annotate(uses=Count('experiences')).order_by('-uses', 'name')
+                .values_list('name', flat=True)[:options['tag_count']]
+            )
+        if not tag_names:
+            raise CommandError('There are no tags to benchmark.')
+
+        self.stdout.write(f'{Experience.objects.count()} experiences, filtering by {len(tag_names)} tags: '
+                          f'{", ".join(tag_names)}')
+
+        chained = Experience.objects.all()
+        for tag_name in tag_names:
+            chained = chained.filter(tags__name=tag_name)
+        queries = {
+            'chained joins (all)': chained,
+            'grouped subquery (all)': Experience.objects.with_tags(tag_names, match='all'),
+            'subquery (any)': Experience.objects.with_tags(tag_names, match='any'),
+        }
+
+        for label, queryset in queries.items():
+            # Fetch a page of IDs in the API's order, so the timings include the sort but not serialization
+            page = queryset.order_by(*EXPERIENCE_ORDERING).values_list('pk', flat=True)[:options['page_size']]
+            matches = queryset.count()
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                list(page.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(
+                f'{label}: {matches} matches, median {statistics.median(timings):.2f} ms, '
+                f'min {min(timings):.2f} ms over {options["repeat"]} runs'
+            )
+            if options['explain']:
+                self.stdout.write(page.explain(analyze=True))
@@ -0,0 +1,48 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the `import_experiences` management command, which imports experiences in bulk
+from a JSON or CSV file, e.g. `python manage.py import_experiences partner.csv --creator partner@example.com`.
+Unlike the import endpoint it has no limit on the number of rows. The errors of skipped rows are printed, or written
+to a JSON file with --errors.
+"""
+
+import json
+from django.core.management.base import BaseCommand, CommandError
+from wayfinder.imports import IMPORT_FORMATS, ExperienceImport, ImportFileError, read_rows
+from wayfinder.models import User
+
+class Command(BaseCommand):
+    help = 'Import experiences in bulk from a JSON or CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import.')
+        parser.add_argument('--creator', required=True, help='Email of the user the experiences are created by.')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Format of the file (defaults to its extension).')
+        parser.add_argument('--batch-size', type=int, default=None, help='Number of rows imported per transaction.')
+        parser.add_argument('--errors', help='Write the errors of skipped rows to this JSON file.')
+
+    def handle(self, *args, **options):
+        creator = User.objects.filter(email=options['creator']).first()
+        if creator is None:
+            raise CommandError(f'No user has the email {options["creator"]}.')
+
+        file_format = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        try:
+            with open(options['path'], 'rb') as file:
+                rows = read_rows(file, file_format)
+                result = ExperienceImport(creator, batch_size=options['batch_size']).run(rows)
+        except (OSError, ImportFileError) as error:
+            raise CommandError(str(error))
+
+        if options['errors']:
+            with open(options['errors'], 'w') as file:
+                json.dump(result['errors'], file, indent=2)
+        else:
+            for error in result['errors']:
+                self.stderr.write(f'Row {error["row"]}: {error["error"]}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result["created"]} of {result["rows"]} experiences, creating {result["locations_created"]} '
+            f'locations. {len(result["errors"])} rows were skipped.'
+        ))
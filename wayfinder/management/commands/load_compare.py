@@ -0,0 +1,151 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the `load_compare` management command, which compares the throughput of the read
+endpoints served by gunicorn sync workers (`app.wsgi`) and by uvicorn workers (`app.asgi`). It starts each server
+with the same number of workers, keeps the given number of requests in flight for a fixed time against a mix of
+read endpoints, and reports requests per second, latency percentiles and errors for each server.
+"""
+
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from wayfinder.benchmarks import BenchmarkData
+
+SERVERS = {
+    'sync': ['app.wsgi:application', '--worker-class', 'sync'],
+    'async': ['app.asgi:application', '--worker-class', 'uvicorn_worker.UvicornWorker'],
+}
+
+def default_paths():
+    """
+    Get the paths of uncached read endpoints, with IDs from the database.
+    """
+    data = BenchmarkData()
+    return [
+        reverse('get_experiences_with_filters') + f'?search_query={data.search_word}',
+        reverse('get_experiences_by_user_id', kwargs={'user_id': data.user.pk}),
+        reverse('get_experience_ratings', kwargs={'experience_id': data.experience.pk}),
+        reverse('get_tips_by_user_id', kwargs={'user_id': data.user.pk}),
+        reverse('get_user_by_id', kwargs={'user_id': data.user.pk}),
+    ]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def fetch(port, path):
+    """
+    Send one GET request on a new connection and read the whole response.
+
+    Returns:
+        int: The response status code
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode('latin-1'))
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1])
+
+async def run_load(port, paths, concurrency, duration):
+    """
+    Keep `concurrency` requests in flight for `duration` seconds, cycling through the paths.
+
+    Returns:
+        tuple: (latencies in seconds of successful requests, number of failed requests)
+    """
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(offset):
+        nonlocal errors
+        number = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await fetch(port, paths[number % len(paths)])
+            except (OSError, IndexError, ValueError):
+                status = None
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+            number += 1
+
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    return latencies, errors
+
+class Command(BaseCommand):
+    help = 'Compare the throughput of the read endpoints under gunicorn sync workers and uvicorn (ASGI) workers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Number of server workers.')
+        parser.add_argument('--concurrency', type=int, default=100, help='Number of requests kept in flight.')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per server.')
+        parser.add_argument('--servers', default='sync,async', help='Comma-separated servers to compare.')
+        parser.add_argument('--paths', help='Comma-separated paths to request, defaults to uncached read endpoints.')
+
+    def handle(self, *args, **options):
+        servers = [name.strip() for name in options['servers'].split(',') if name.strip()]
+        unknown = [name for name in servers if name not in SERVERS]
+        if unknown:
+            raise CommandError(f'Unknown servers: {", ".join(unknown)}')
+        paths = options['paths'].split(',') if options['paths'] else default_paths()
+
+        self.stdout.write(f'{options["workers"]} workers, {options["concurrency"]} concurrent requests, '
+                          f'{options["duration"]} s per server over: {", ".join(paths)}')
+        for name in servers:
+            port = free_port()
+            server = self.start_server(name, port, options['workers'])
+            try:
+                self.wait_until_ready(server, port)
+                asyncio.run(run_load(port, paths, min(options['concurrency'], 10), 1))  # Warm up the workers
+                latencies, errors = asyncio.run(
+                    run_load(port, paths, options['concurrency'], options['duration'])
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            self.report(name, latencies, errors, options['duration'])
+
+    def start_server(self, name, port, workers):
+        command = [
+            sys.executable, '-m', 'gunicorn', *SERVERS[name], '--bind', f'127.0.0.1:{port}',
+            '--workers', str(workers), '--backlog', '4096', '--log-level', 'warning',
+        ]
+        env = {**os.environ, 'DJANGO_ALLOWED_HOSTS': 'localhost'}
+        return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def wait_until_ready(self, server, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'The server exited with code {server.returncode}.')
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('The server did not start listening in time.')
+
+    def report(self, name, latencies, errors, duration):
+        if not latencies:
+            self.stdout.write(f'{name}: no successful requests, {errors} errors')
+            return
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+        percentiles = statistics.quantiles(latencies_ms, n=100, method='inclusive') if len(latencies_ms) > 1 else None
+        p50, p99 = (percentiles[49], percentiles[98]) if percentiles else (latencies_ms[0], latencies_ms[0])
+        self.stdout.write(
+            f'{name}: {len(latencies) / duration:.1f} req/s, p50 {p50:.1f} ms, p99 {p99:.1f} ms, {errors} errors'
+        )
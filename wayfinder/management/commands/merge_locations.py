@@ -0,0 +1,120 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the `merge_locations` management command, which gives every location with
+coordinates its grid key and merges locations that share one: their experiences are moved to a single location,
+which keeps any country, region or city the others had, and the others are deleted. Run it once after deploying the
+grid key, and with --rekey after changing LOCATION_GRID_PRECISION. Locations are processed in batches, each in its
+own short transaction, so the command can run while the application is serving requests.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, connection, transaction
+from wayfinder.managers import location_grid_key
+from wayfinder.models import Location
+from wayfinder.response_cache import bump_cache_version
+
+class Command(BaseCommand):
+    help = 'Give locations their grid key and merge locations at the same point.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of locations to process per batch.')
+        parser.add_argument('--rekey', action='store_true',
+                            help='Recompute every grid key first, e.g. after changing LOCATION_GRID_PRECISION.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['rekey']:
+            self.clear_keys(batch_size)
+
+        keyed = merged = 0
+        last_id = None
+        while True:
+            for attempt in range(3):
+                try:
+                    batch_keyed, batch_merged, last_batch_id = self.merge_batch(last_id, batch_size)
+                    break
+                except IntegrityError:
+                    # A request created a location at one of the batch's points meanwhile, which the batch merges
+                    # into when it is retried
+                    if attempt == 2:
+                        raise
+            if last_batch_id is None:
+                break
+            keyed += batch_keyed
+            merged += batch_merged
+            last_id = last_batch_id
+
+        # Queryset updates and deletes do not send save signals, so invalidate cached responses directly
+        bump_cache_version('experience', 'location')
+        self.stdout.write(self.style.SUCCESS(f'Keyed {keyed} locations and merged {merged} duplicates.'))
+
+    def clear_keys(self, batch_size):
+        keyed = Location.objects.filter(grid_key__isnull=False).order_by('pk').values_list('pk', flat=True)
+        while True:
+            batch = list(keyed[:batch_size])
+            if not batch:
+                return
+            Location.objects.filter(pk__in=batch).update(grid_key=None)
+
+    def merge_batch(self, last_id, batch_size):
+        """
+        Key or merge the next batch of locations without a grid key.
+
+        Returns:
+            tuple: (locations keyed, locations merged away, last location ID of the batch or None if there was none)
+        """
+        with transaction.atomic():
+            pending = Location.objects.select_for_update().filter(
+                grid_key__isnull=True, latitude__isnull=False, longitude__isnull=False
+            ).order_by('pk')
+            if last_id is not None:
+                pending = pending.filter(pk__gt=last_id)
+            batch = list(pending[:batch_size])
+            if not batch:
+                return 0, 0, None
+
+            groups = {}
+            for location in batch:
+                groups.setdefault(location_grid_key(location.latitude, location.longitude), []).append(location)
+            holders = Location.objects.select_for_update().in_bulk(list(groups), field_name='grid_key')
+
+            # Keep the location that already has the key, or else the one that knows the most about its place
+            keep, merge_into, keyed = [], {}, 0
+            for key, locations in groups.items():
+                locations.sort(key=lambda location: (location.city_id is None, location.region_id is None,
+                                                     location.country_id is None, str(location.pk)))
+                kept = holders.get(key)
+                if kept is None:
+                    kept = locations.pop(0)
+                    kept.grid_key = key
+                    keyed += 1
+                for location in locations:
+                    kept.country_id = kept.country_id or location.country_id
+                    kept.region_id = kept.region_id or location.region_id
+                    kept.city_id = kept.city_id or location.city_id
+                    merge_into[location.pk] = kept.pk
+                keep.append(kept)
+
+            # Repoint and update with one statement each: Case/When updates over thousands of rows spend most of
+            # their time building the expression
+            with connection.cursor() as cursor:
+                if merge_into:
+                    cursor.execute(
+                        'UPDATE wayfinder_experience SET location_id = moved.new_id '
+                        'FROM unnest(%s::uuid[], %s::uuid[]) AS moved(old_id, new_id) '
+                        'WHERE wayfinder_experience.location_id = moved.old_id',
+                        [list(merge_into), list(merge_into.values())],
+                    )
+                    Location.objects.filter(pk__in=list(merge_into)).delete()
+                cursor.execute(
+                    'UPDATE wayfinder_location SET grid_key = kept.grid_key, country_id = kept.country_id, '
+                    'region_id = kept.region_id, city_id = kept.city_id '
+                    'FROM unnest(%s::uuid[], %s::varchar[], %s::integer[], %s::integer[], %s::integer[]) '
+                    'AS kept(id, grid_key, country_id, region_id, city_id) '
+                    'WHERE wayfinder_location.location_id = kept.id',
+                    [[location.pk for location in keep], [location.grid_key for location in keep],
+                     [location.country_id for location in keep], [location.region_id for location in keep],
+                     [location.city_id for location in keep]],
+                )
+        return keyed, len(merge_into), batch[-1].pk
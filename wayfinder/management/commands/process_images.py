@@ -0,0 +1,30 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the `process_images` management command, which generates the resized variants of
+every experience image and profile picture that has none, such as images uploaded before variants existed or
+whose background processing was interrupted. Images are processed one at a time in this process.
+"""
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from wayfinder.images import IMAGE_FIELDS, process_image, variants_field
+
+class Command(BaseCommand):
+    help = 'Generate the missing resized variants of experience images and profile pictures.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Most images to process per model.')
+
+    def handle(self, *args, **options):
+        processed = 0
+        for model_label, field_name in IMAGE_FIELDS.items():
+            model = apps.get_model(model_label)
+            pending = model.objects.exclude(**{field_name: ''}).filter(
+                **{f'{field_name}__isnull': False, variants_field(field_name): {}}
+            ).order_by('pk').values_list('pk', flat=True)
+            for pk in pending[:options['limit']]:
+                process_image(model_label, pk, field_name)
+                processed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images.'))
@@ -0,0 +1,40 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the `prune_tokens` management command, which deletes expired refresh tokens from
+the outstanding and blacklisted token tables. Unlike simplejwt's `flushexpiredtokens`, which deletes every expired
+token in one statement, tokens are deleted in small batches, each in its own short transaction, so the tables are
+never locked for long. Run it on a schedule, e.g. daily from Heroku Scheduler: `python manage.py prune_tokens`.
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+class Command(BaseCommand):
+    help = 'Delete expired refresh tokens from the token blacklist tables in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of tokens to delete per batch.')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to wait between batches.')
+
+    def handle(self, *args, **options):
+        now = aware_utcnow()
+        # Answered from the expires_at index, oldest tokens first
+        expired_ids = OutstandingToken.objects.filter(expires_at__lte=now).order_by('expires_at').values_list('pk', flat=True)
+
+        pruned = 0
+        while True:
+            with transaction.atomic():
+                batch = list(expired_ids[:options['batch_size']])
+                if not batch:
+                    break
+                # Also deletes the blacklist entries of the tokens
+                OutstandingToken.objects.filter(pk__in=batch).delete()
+            pruned += len(batch)
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f'Pruned {pruned} expired refresh tokens.'))
@@ -0,0 +1,37 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the `recompute_ranking_scores` management command, which recomputes every
+experience's ranking score from its rating aggregates. Run it after changing the constants of wayfinder/ranking.py.
+Experiences are processed in batches, each written with one UPDATE in its own short transaction.
+"""
+
+from django.core.management.base import BaseCommand
+from wayfinder.models import Experience
+from wayfinder.response_cache import bump_cache_version
+
+class Command(BaseCommand):
+    help = 'Recompute the ranking score of every experience from its rating aggregates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of experiences to update per batch.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        experience_ids = Experience.objects.order_by('pk').values_list('pk', flat=True)
+
+        updated = 0
+        last_id = None
+        while True:
+            # Walk the table by primary key so each batch is a cheap index range scan
+            batch = experience_ids if last_id is None else experience_ids.filter(pk__gt=last_id)
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]
+            updated += Experience.objects.filter(pk__in=batch).recompute_ranking_scores()
+
+        # Queryset updates do not send save signals, so invalidate cached experiences directly
+        bump_cache_version('experience')
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed ranking scores for {updated} experiences.'))
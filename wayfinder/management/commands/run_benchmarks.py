@@ -0,0 +1,117 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the `run_benchmarks` management command, which sends the requests declared in
+`wayfinder/benchmarks.py` to every URL of the API and reports the p50, p95 and p99 latency and the SQL query count
+of each endpoint. The run fails when an endpoint runs more queries than its budget, returns an unexpected status
+or has no benchmark. Everything the requests write is rolled back.
+"""
+
+import statistics
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.urls import URLPattern, URLResolver, get_resolver
+from wayfinder.benchmarks import BENCHMARKS, BenchmarkClient, BenchmarkData
+
+def percentile(timings, percent):
+    """
+    Get a percentile of the timings, interpolating between the two nearest measurements.
+    """
+    if len(timings) == 1:
+        return timings[0]
+    return statistics.quantiles(timings, n=100, method='inclusive')[percent - 1]
+
+def wayfinder_url_names(resolver=None):
+    """
+    Get the names of every URL pattern routed to the application's views, skipping included apps such as the admin.
+    """
+    resolver = resolver or get_resolver()
+    names = []
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            names.extend(wayfinder_url_names(pattern))
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            if pattern.callback.__module__.startswith('wayfinder.views'):
+                names.append(pattern.name)
+    return names
+
+class Command(BaseCommand):
+    help = 'Measure latency percentiles and query counts of every endpoint, failing when a query budget is exceeded.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Number of measured requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=2, help='Number of unmeasured requests per endpoint first.')
+        parser.add_argument('--endpoints', help='Comma-separated URL names to benchmark, defaults to all of them.')
+
+    def handle(self, *args, **options):
+        benchmarks = {benchmark.url_name: benchmark for benchmark in BENCHMARKS}
+        failures = []
+
+        # Every URL must declare a budget, so new endpoints cannot skip the benchmarks
+        for url_name in wayfinder_url_names():
+            if url_name not in benchmarks:
+                failures.append(f'{url_name}: no benchmark is declared')
+
+        if options['endpoints']:
+            selected = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+            unknown = [name for name in selected if name not in benchmarks]
+            if unknown:
+                raise CommandError(f'Unknown endpoints: {", ".join(unknown)}')
+            benchmarks = {name: benchmarks[name] for name in selected}
+
+        # Bypass the response cache so every request measures the view itself, and keep any emails in memory
+        caches = {**settings.CACHES, 'benchmark': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with override_settings(CACHES=caches, RESPONSE_CACHE_ALIAS='benchmark', ALLOWED_HOSTS=['*'],
+                               EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            with transaction.atomic():
+                failures.extend(self.run(benchmarks.values(), options))
+                transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError('Benchmarks failed:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Every endpoint is within its query budget.'))
+
+    def run(self, benchmarks, options):
+        """
+        Benchmark each endpoint, printing one line of results per endpoint.
+
+        Returns:
+            list: Descriptions of the endpoints that failed
+        """
+        data = BenchmarkData()
+        client = BenchmarkClient(connection)
+        failures = []
+
+        self.stdout.write(f'{"endpoint":<30} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"budget":>7}')
+        for benchmark in benchmarks:
+            iterations = benchmark.iterations or options['iterations']
+            timings = []
+            query_counts = []
+            statuses = set()
+            with benchmark.environment():
+                for number in range(options['warmup'] + iterations):
+                    # Roll back each request, so writes do not change what later requests see
+                    with transaction.atomic():
+                        response, elapsed, queries = benchmark.request(client, data, number)
+                        transaction.set_rollback(True)
+                    if number >= options['warmup']:
+                        timings.append(elapsed * 1000)
+                        query_counts.append(queries)
+                        statuses.add(response.status_code)
+
+            queries = max(query_counts)
+            budget = benchmark.budget(data)
+            self.stdout.write(
+                f'{benchmark.url_name:<30} {percentile(timings, 50):>8.2f} {percentile(timings, 95):>8.2f} '
+                f'{percentile(timings, 99):>8.2f} {queries:>8} {budget:>7}'
+            )
+            if queries > budget:
+                failures.append(f'{benchmark.url_name}: {queries} queries, over the budget of {budget}')
+            if statuses != {benchmark.expected_status}:
+                failures.append(
+                    f'{benchmark.url_name}: responded {", ".join(map(str, sorted(statuses)))}, '
+                    f'expected {benchmark.expected_status}'
+                )
+        return failures
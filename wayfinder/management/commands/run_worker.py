@@ -0,0 +1,52 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the `run_worker` management command, which runs the tasks of the background task
+queue as they come due. Start as many workers as needed, e.g. the `worker` process of the Procfile: each claims tasks
+the others have not locked. A worker stops after its current task when it receives SIGTERM or SIGINT, as on every
+Heroku restart, and a task cut off mid-way is unlocked and retried by the next worker.
+"""
+
+import signal
+import time
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+from wayfinder.task_queue import run_next
+
+class Command(BaseCommand):
+    help = 'Run background tasks from the task queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when no task is due.')
+        parser.add_argument('--burst', action='store_true', help='Exit once no task is due instead of waiting.')
+        parser.add_argument('--max-tasks', type=int, default=None, help='Exit after running this many tasks.')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        succeeded = failed = 0
+        while not self.stopping and (options['max_tasks'] is None or succeeded + failed < options['max_tasks']):
+            try:
+                task = run_next()
+            except DatabaseError as error:
+                # Drop a broken connection and try again, e.g. after a database restart
+                self.stderr.write(f'Could not run the next task: {error}')
+                close_old_connections()
+                time.sleep(options['sleep'])
+                continue
+
+            if task is None:
+                if options['burst']:
+                    break
+                time.sleep(options['sleep'])
+            elif task.pk is None:
+                succeeded += 1
+            else:
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Ran {succeeded} tasks, {failed} failed.'))
+
+    def stop(self, signum, frame):
+        self.stopping = True
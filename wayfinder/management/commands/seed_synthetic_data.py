@@ -0,0 +1,240 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the `seed_synthetic_data` management command, which fills the database with a
+configurable synthetic dataset for benchmarking: users, locations, tagged experiences, ratings, tips, wishlists and
+wishlist items. Rows are generated lazily and inserted with bulk_create in batches, so datasets of millions of rows
+can be seeded without holding them in memory. Synthetic users share an email domain and synthetic tags share a
+prefix, so the dataset can be removed again with --clear.
+"""
+
+import itertools
+import random
+from cities_light.models import City
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from wayfinder.models import Experience, Location, Rating, Tag, Tip, User, Wishlist, WishlistItem
+from wayfinder.response_cache import bump_cache_version
+
+# Marks synthetic rows so they can be found and cleared
+SYNTHETIC_EMAIL_DOMAIN = 'synthetic.wayfinder.test'
+SYNTHETIC_TAG_PREFIX = 'synthetic-'
+
+# Password of every synthetic user, for benchmarking authenticated endpoints
+SYNTHETIC_PASSWORD = 'synthetic-password'
+
+WORDS = (
+    'harbor', 'market', 'sunset', 'museum', 'trail', 'garden', 'festival', 'jazz', 'street', 'food', 'coffee',
+    'river', 'castle', 'beach', 'mountain', 'night', 'tour', 'gallery', 'park', 'bridge', 'lake', 'bakery',
+    'vineyard', 'temple', 'rooftop', 'kayak', 'cathedral', 'old', 'town', 'hidden', 'local', 'sunrise',
+)
+PRICES = ('free', 'cheap', 'moderate', 'expensive', None)
+
+def batched(iterable, size):
+    """
+    Split an iterable into lists of at most `size` items, without materializing the iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+class Command(BaseCommand):
+    help = 'Seed the database with synthetic users, experiences, ratings, tips and wishlists for benchmarking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to create.')
+        parser.add_argument('--experiences', type=int, default=10000, help='Number of experiences to create.')
+        parser.add_argument('--tags', type=int, default=50, help='Number of tags to create.')
+        parser.add_argument('--max-tags-per-experience', type=int, default=5, help='Maximum tags per experience.')
+        parser.add_argument('--ratings', type=int, default=50000, help='Number of ratings to create.')
+        parser.add_argument('--tips', type=int, default=10000, help='Number of tips to create.')
+        parser.add_argument('--wishlists', type=int, default=2000, help='Number of wishlists to create.')
+        parser.add_argument('--items-per-wishlist', type=int, default=10, help='Number of experiences per wishlist.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of rows inserted per query.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible datasets.')
+        parser.add_argument('--clear', action='store_true', help='Delete the existing synthetic dataset first.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        if options['clear']:
+            self.clear()
+
+        # Cities to place locations and tips in, with coordinates to scatter locations around
+        self.cities = list(
+            City.objects.order_by().filter(latitude__isnull=False, longitude__isnull=False)
+            .values_list('id', 'region_id', 'country_id', 'latitude', 'longitude')
+        )
+
+        user_ids = self.create_users(options['users'])
+        tag_ids = self.create_tags(options['tags'])
+        experience_ids = self.create_experiences(options['experiences'], user_ids, tag_ids,
+                                                 options['max_tags_per_experience'])
+        self.create_ratings(options['ratings'], user_ids, experience_ids)
+        self.create_tips(options['tips'], user_ids)
+        self.create_wishlists(options['wishlists'], user_ids, experience_ids, options['items_per_wishlist'])
+        self.spread_dates()
+
+        # Ratings were bulk inserted, so build the experiences' rating aggregates from them
+        call_command('recompute_rating_aggregates', batch_size=self.batch_size, stdout=self.stdout)
+        bump_cache_version('experience', 'rating', 'tip', 'tag', 'location')
+        self.stdout.write(self.style.SUCCESS('Seeded the synthetic dataset.'))
+
+    def bulk_create(self, model, objects):
+        """
+        Insert generated objects batch by batch.
+
+        Returns:
+            list: Primary keys of the inserted objects
+        """
+        ids = []
+        for batch in batched(objects, self.batch_size):
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+            ids.extend(obj.pk for obj in batch)
+        self.stdout.write(f'Created {len(ids)} {model._meta.verbose_name_plural}.')
+        return ids
+
+    def sentence(self, length):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(length))
+
+    def random_city(self):
+        return self.rng.choice(self.cities) if self.cities else None
+
+    def create_users(self, count):
+        # Hash the shared password once, hashing it per user would dominate the run
+        password = make_password(SYNTHETIC_PASSWORD)
+        run = '%08x' % self.rng.getrandbits(32)
+        users = (
+            User(name=self.sentence(2).title(), email=f'user{number}-{run}@{SYNTHETIC_EMAIL_DOMAIN}', password=password)
+            for number in range(count)
+        )
+        return self.bulk_create(User, users)
+
+    def create_tags(self, count):
+        names = [f'{SYNTHETIC_TAG_PREFIX}{number}' for number in range(count)]
+        Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+        return list(Tag.objects.filter(name__in=names).order_by('name').values_list('pk', flat=True))
+
+    def create_experiences(self, count, user_ids, tag_ids, max_tags):
+        experience_ids = []
+        through = Experience.tags.through
+        for batch in batched(range(count), self.batch_size):
+            locations = [self.build_location() for _ in batch]
+            Location.objects.bulk_create(locations)
+            experiences = [
+                Experience(
+                    title=self.sentence(self.rng.randint(2, 5)).capitalize(),
+                    description=self.sentence(self.rng.randint(10, 40)).capitalize(),
+                    location=location,
+                    creator_id=self.rng.choice(user_ids),
+                    price=self.rng.choice(PRICES),
+                )
+                for location in locations
+            ]
+            Experience.objects.bulk_create(experiences)
+
+            # Popular tags are picked more often, as in real data
+            tagged = []
+            for experience in experiences:
+                tag_count = min(self.rng.randint(0, max_tags), len(tag_ids))
+                chosen = {tag_ids[(int(self.rng.paretovariate(1.2)) - 1) % len(tag_ids)] for _ in range(tag_count)}
+                tagged.extend(through(experience_id=experience.pk, tag_id=tag_id) for tag_id in chosen)
+            through.objects.bulk_create(tagged, batch_size=self.batch_size)
+            experience_ids.extend(experience.pk for experience in experiences)
+        self.stdout.write(f'Created {len(experience_ids)} experiences.')
+        return experience_ids
+
+    def build_location(self):
+        city = self.random_city()
+        if city is None:
+            return Location(latitude=self.rng.uniform(-60, 70), longitude=self.rng.uniform(-180, 180))
+        city_id, region_id, country_id, latitude, longitude = city
+        return Location(
+            city_id=city_id, region_id=region_id, country_id=country_id,
+            latitude=float(latitude) + self.rng.uniform(-0.05, 0.05),
+            longitude=float(longitude) + self.rng.uniform(-0.05, 0.05),
+        )
+
+    def create_ratings(self, count, user_ids, experience_ids):
+        if not experience_ids:
+            return []
+        ratings = (
+            Rating(
+                user_id=self.rng.choice(user_ids),
+                experience_id=self.rng.choice(experience_ids),
+                rating_value=self.rng.choices((1, 2, 3, 4, 5), weights=(1, 1, 3, 5, 4))[0],
+                comment=self.sentence(self.rng.randint(3, 20)).capitalize(),
+            )
+            for _ in range(count)
+        )
+        return self.bulk_create(Rating, ratings)
+
+    def create_tips(self, count, user_ids):
+        def build_tip():
+            city = self.random_city()
+            return Tip(
+                content=self.sentence(self.rng.randint(5, 25)).capitalize(),
+                creator_id=self.rng.choice(user_ids),
+                city_id=city[0] if city else None,
+                country_id=city[2] if city else None,
+            )
+        return self.bulk_create(Tip, (build_tip() for _ in range(count)))
+
+    def create_wishlists(self, count, user_ids, experience_ids, items_per_wishlist):
+        wishlists = (Wishlist(user_id=self.rng.choice(user_ids), title=self.sentence(2).title()) for _ in range(count))
+        wishlist_ids = self.bulk_create(Wishlist, wishlists)
+        items_per_wishlist = min(items_per_wishlist, len(experience_ids))
+        items = (
+            WishlistItem(wishlist_id=wishlist_id, experience_id=experience_id)
+            for wishlist_id in wishlist_ids
+            for experience_id in self.rng.sample(experience_ids, items_per_wishlist)
+        )
+        self.bulk_create(WishlistItem, items)
+
+    def spread_dates(self):
+        """
+        Spread the creation dates of the synthetic rows over the past year, as bulk_create stamps them all with
+        the time of their batch.
+        """
+        statements = [
+            ('wayfinder_experience', 'date_posted', 'creator_id'),
+            ('wayfinder_rating', 'date_posted', 'user_id'),
+            ('wayfinder_tip', 'date_posted', 'creator_id'),
+            ('wayfinder_wishlist', 'created_date', 'user_id'),
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            for table, column, user_column in statements:
+                cursor.execute(
+                    f"""
+                    UPDATE {table} SET {column} = now() - random() * interval '365 days'
+                    WHERE {user_column} IN (SELECT id FROM wayfinder_user WHERE email LIKE %s)
+                    """,
+                    ['%@' + SYNTHETIC_EMAIL_DOMAIN],
+                )
+            cursor.execute(
+                """
+                UPDATE wayfinder_wishlistitem SET date_added = now() - random() * interval '365 days'
+                WHERE wishlist_id IN (
+                    SELECT wishlist_id FROM wayfinder_wishlist
+                    WHERE user_id IN (SELECT id FROM wayfinder_user WHERE email LIKE %s)
+                )
+                """,
+                ['%@' + SYNTHETIC_EMAIL_DOMAIN],
+            )
+
+    def clear(self):
+        """
+        Delete the synthetic dataset. Deleting the locations of synthetic experiences removes the experiences with
+        their ratings and wishlist items, and deleting synthetic users removes the rest.
+        """
+        synthetic_users = User.objects.filter(email__endswith='@' + SYNTHETIC_EMAIL_DOMAIN)
+        location_ids = Experience.objects.filter(creator__in=synthetic_users).values('location_id')
+        Location.objects.filter(pk__in=location_ids).delete()
+        synthetic_users.delete()
+        Tag.objects.filter(name__startswith=SYNTHETIC_TAG_PREFIX).delete()
+        self.stdout.write('Cleared the existing synthetic dataset.')
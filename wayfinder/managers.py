@@ -3,10 +3,45 @@ Author: Matthew Hilliard
 Email: mch2003@bu.edu
 Description: This module defines a custom user manager class, `CustomUserManager`, for managing 
 the creation of regular and superuser accounts. The class extends the functionality of Django's 
-`UserManager` to include custom logic for user creation with additional fields like `name`.
+`UserManager` to include custom logic for user creation with additional fields like `name`. 
+It also defines `ExperienceManager` and its queryset, which hold reusable experience queries such as full-text 
+search, tag filtering, radius searches and the atomic maintenance of rating aggregates and ranking scores, and `LocationManager`, which creates locations
+with INSERT ... ON CONFLICT on their grid key so concurrent requests for the same point share one Location.
 """
 
+from django.conf import settings
 from django.contrib.auth.models import UserManager
+from django.contrib.postgres.search import SearchRank
+from django.db import connections, models, transaction
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast
+from .geo import bounding_box, distance_km
+from .ranking import ranking_score
+from .search import build_search_query
+
+# Tag filter modes: experiences with every one of the tags, or with at least one of them
+TAG_MATCH_MODES = ('all', 'any')
+
+# Valid rating values and the Experience fields that aggregate them
+RATING_VALUES = (1, 2, 3, 4, 5)
+RATING_AGGREGATE_FIELDS = ['rating_sum', 'number_of_ratings', 'average_rating'] + [
+    f'rating_{value}_count' for value in RATING_VALUES
+]
+
+def location_grid_key(latitude, longitude, precision=None):
+    """
+    Get the grid key of a coordinate: its latitude and longitude rounded to LOCATION_GRID_PRECISION decimal places
+    (5 by default, about a meter), e.g. "42.35000,-71.06000". Coordinates with the same key are the same Location.
+
+    Returns:
+        str or None: The grid key, or None if either coordinate is missing
+    """
+    if latitude is None or longitude is None:
+        return None
+    if precision is None:
+        precision = getattr(settings, 'LOCATION_GRID_PRECISION', 5)
+    # Adding 0.0 turns -0.0 into 0.0, so both round to the same key
+    return f'{round(latitude, precision) + 0.0:.{precision}f},{round(longitude, precision) + 0.0:.{precision}f}'
 
 class CustomUserManager(UserManager):
     def _create_user(self, name, email, password, **extra_fields):
@@ -36,3 +71,203 @@ class CustomUserManager(UserManager):
         extra_fields.setdefault('is_staff', True) # Set the is_staff field to True by default
         extra_fields.setdefault('is_superuser', True) # Set the is_superuser field to True by default
         return self._create_user(name, email, password, **extra_fields) # Call the _create_user method
+
+
+class ExperienceQuerySet(models.QuerySet):
+    def search(self, text, prefix=False):
+        """
+        Filter experiences with full-text search over the title and description, annotating each match with
+        its relevance as `search_rank`.
+
+        Parameters:
+            text (str): The search text entered by the user
+            prefix (bool): Whether to match every term as a prefix, for search-as-you-type
+        """
+        query = build_search_query(text, prefix=prefix)
+        if query is None:
+            # Keep the annotation so callers can still order by relevance
+            return self.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+        # ts_rank returns a real; cast it so the value round-trips exactly through pagination cursors
+        rank = Cast(SearchRank(F('search_vector'), query), output_field=FloatField())
+        return self.filter(search_vector=query).annotate(search_rank=rank)
+
+    def with_tags(self, tag_names, match='all'):
+        """
+        Filter experiences by tag names with a single subquery on the experience-tag table, however many tags
+        are given. In "all" mode the tagged rows are grouped by experience and only experiences matching every
+        tag are kept (HAVING COUNT(tag_id) = number of tags). Each (experience, tag) pair is unique in that table,
+        so the plain count equals the distinct count and can be computed with a hash aggregate instead of a sort.
+
+        Parameters:
+            tag_names (iterable): The tag names to filter by
+            match (str): "all" to require every tag, "any" to require at least one
+        """
+        if match not in TAG_MATCH_MODES:
+            raise ValueError(f'Unknown tag match mode: {match}')
+        tag_names = {name.strip() for name in tag_names if name.strip()}
+        if not tag_names:
+            return self
+
+        tagged = self.model.tags.through.objects.filter(tag__name__in=tag_names)
+        if match == 'all':
+            tagged = tagged.values('experience_id').annotate(
+                matched_tags=Count('tag_id')
+            ).filter(matched_tags=len(tag_names))
+        return self.filter(pk__in=tagged.values('experience_id'))
+
+    def near(self, latitude, longitude, radius_km):
+        """
+        Filter experiences within a distance of a coordinate, annotating each with its great-circle distance in
+        kilometers as `distance`. Locations are first narrowed to the bounding box of the circle with range filters
+        the coordinate index on Location answers, so the exact distance is only computed inside the box.
+
+        Parameters:
+            latitude (float): Latitude of the center, in degrees
+            longitude (float): Longitude of the center, in degrees
+            radius_km (float): Largest distance from the center, in kilometers
+        """
+        min_latitude, max_latitude, longitude_ranges = bounding_box(latitude, longitude, radius_km)
+        in_box = Q()
+        for min_longitude, max_longitude in longitude_ranges:
+            in_box |= Q(location__longitude__range=(min_longitude, max_longitude))
+        return self.filter(in_box, location__latitude__range=(min_latitude, max_latitude)).annotate(
+            distance=distance_km('location__latitude', 'location__longitude', latitude, longitude)
+        ).filter(distance__lte=radius_km)
+
+    def record_rating(self, experience_id, rating_value):
+        """
+        Add a rating value to an experience's aggregates and ranking score in a single UPDATE statement. The new
+        values are computed by the database from the current row, so concurrent ratings are never lost and no other
+        column is rewritten.
+
+        Parameters:
+            experience_id: ID of the rated experience
+            rating_value (int): The rating, from 1 to 5
+
+        Returns:
+            int: The number of experiences updated (0 if the experience does not exist)
+        """
+        new_sum = F('rating_sum') + rating_value
+        new_count = F('number_of_ratings') + 1
+        histogram_field = f'rating_{rating_value}_count'
+        return self.filter(pk=experience_id).update(
+            rating_sum=new_sum,
+            number_of_ratings=new_count,
+            average_rating=Cast(new_sum, output_field=FloatField()) / new_count,
+            ranking_score=ranking_score(new_sum, new_count, F('date_posted')),
+            **{histogram_field: F(histogram_field) + 1},
+        )
+
+    def recompute_rating_aggregates(self):
+        """
+        Recompute the rating aggregates and ranking scores of the experiences in this queryset from their Rating
+        rows. The experiences are locked while their ratings are counted, so ratings recorded concurrently are not
+        lost.
+
+        Returns:
+            int: The number of experiences updated
+        """
+        rating_model = self.model._meta.get_field('ratings').related_model
+        with transaction.atomic(using=self.db):
+            experience_ids = list(self.select_for_update().order_by('pk').values_list('pk', flat=True))
+            aggregates = rating_model.objects.filter(
+                experience_id__in=experience_ids, rating_value__isnull=False
+            ).order_by().values('experience_id').annotate(
+                total=Sum('rating_value'),
+                count=Count('pk'),
+                **{f'count_{value}': Count('pk', filter=Q(rating_value=value)) for value in RATING_VALUES},
+            )
+            aggregates = {row['experience_id']: row for row in aggregates}
+
+            experiences = []
+            for experience_id in experience_ids:
+                row = aggregates.get(experience_id, {})
+                total = row.get('total') or 0
+                count = row.get('count') or 0
+                experiences.append(self.model(
+                    pk=experience_id,
+                    rating_sum=total,
+                    number_of_ratings=count,
+                    average_rating=total / count if count else 0.0,
+                    **{f'rating_{value}_count': row.get(f'count_{value}', 0) for value in RATING_VALUES},
+                ))
+            updated = self.model.objects.bulk_update(experiences, RATING_AGGREGATE_FIELDS)
+            self.model.objects.filter(pk__in=experience_ids).recompute_ranking_scores()
+            return updated
+
+    def recompute_ranking_scores(self):
+        """
+        Recompute the ranking scores of the experiences in this queryset from their rating aggregates, e.g. after
+        the constants of wayfinder/ranking.py changed.
+
+        Returns:
+            int: The number of experiences updated
+        """
+        return self.update(ranking_score=ranking_score(F('rating_sum'), F('number_of_ratings'), F('date_posted')))
+
+class ExperienceManager(models.Manager.from_queryset(ExperienceQuerySet)):
+    def get_queryset(self):
+        """
+        Skip loading the search vector, which is only used inside the database.
+        """
+        return super().get_queryset().defer('search_vector')
+
+class LocationManager(models.Manager):
+    def upsert(self, latitude, longitude, **defaults):
+        """
+        Get the location at a coordinate, creating it with the defaults if there is none, in a single
+        INSERT ... ON CONFLICT DO NOTHING statement on the grid key. Unlike get_or_create, concurrent calls for the same
+        point cannot create two locations.
+
+        Parameters:
+            latitude (float): Latitude of the location
+            longitude (float): Longitude of the location
+            defaults: Other fields of the location if it is created (country, region, city)
+
+        Returns:
+            tuple: (Location, whether it was created)
+        """
+        location = self.model(latitude=latitude, longitude=longitude, **defaults)
+        location.grid_key = location_grid_key(latitude, longitude)
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        fields = self.model._meta.concrete_fields
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        values = [field.get_db_prep_save(getattr(location, field.attname), connection) for field in fields]
+
+        # The SELECT cannot see a row committed by a concurrent insert after this statement started, which is
+        # looked up again below
+        sql = f"""
+            WITH inserted AS (
+                INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(fields))})
+                ON CONFLICT (grid_key) DO NOTHING
+                RETURNING {columns}
+            )
+            SELECT {columns}, true AS created FROM inserted
+            UNION ALL
+            SELECT {columns}, false AS created FROM {table} WHERE grid_key = %s
+            LIMIT 1
+        """
+        row = next(iter(self.raw(sql, values + [location.grid_key])), None)
+        if row is None:
+            return self.get(grid_key=location.grid_key), False
+        if row.created:
+            # Keep the instance the caller's related objects are cached on
+            return location, True
+        return row, False
+
+    def upsert_many(self, locations):
+        """
+        Get or create many locations at once: one INSERT ... ON CONFLICT DO NOTHING for all of them, then one query
+        for the locations of their grid keys.
+
+        Parameters:
+            locations (list): Unsaved locations with coordinates, used for the points that have no location yet
+
+        Returns:
+            dict: Location by grid key, for every given location
+        """
+        for location in locations:
+            location.grid_key = location_grid_key(location.latitude, location.longitude)
+        self.bulk_create(locations, ignore_conflicts=True)
+        return self.in_bulk({location.grid_key for location in locations}, field_name='grid_key')
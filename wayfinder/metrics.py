@@ -0,0 +1,189 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module records where the time of each request goes. `RequestMetricsMiddleware` counts the SQL
+queries of every request to a view in `wayfinder/views` and times them, the serialization of its response and the
+whole request. The timings are sent back in a `Server-Timing` header and observed into Prometheus histograms labeled
+by URL name, which the metrics endpoint exposes together with the response cache counters. Queries are timed by a
+database execute wrapper installed on every connection, and the current request's metrics are kept in a context
+variable, so code outside a request pays only one context variable lookup per query.
+"""
+
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from prometheus_client import REGISTRY, CollectorRegistry, Histogram, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily
+from wayfinder.response_cache import get_cache_stats
+
+# Buckets of the query count histogram, the latency histograms use the Prometheus defaults (5 ms to 10 s)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+REQUEST_DURATION = Histogram(
+    'wayfinder_request_duration_seconds', 'Total time spent in the view and middleware.', ['url_name'],
+)
+SQL_DURATION = Histogram(
+    'wayfinder_request_sql_duration_seconds', 'Time spent running SQL queries per request.', ['url_name'],
+)
+SERIALIZE_DURATION = Histogram(
+    'wayfinder_request_serialize_duration_seconds', 'Time spent serializing the response per request.', ['url_name'],
+)
+SQL_QUERIES = Histogram(
+    'wayfinder_request_sql_queries', 'Number of SQL queries per request.', ['url_name'], buckets=QUERY_COUNT_BUCKETS,
+)
+
+class RequestMetrics:
+    """
+    Timings of the request being handled.
+    """
+    __slots__ = ('sql_queries', 'sql_time', 'serialize_time', 'serializing')
+
+    def __init__(self):
+        self.sql_queries = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+
+_current_metrics = ContextVar('wayfinder_request_metrics', default=None)
+
+def sql_timer(execute, sql, params, many, context):
+    """
+    Database execute wrapper that counts and times the queries of the current request.
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_time += perf_counter() - start
+        metrics.sql_queries += 1
+
+def install_sql_timer(connection):
+    """
+    Add the SQL timer to a database connection, once (connections are reused after reconnecting).
+    """
+    if getattr(settings, 'REQUEST_METRICS', True) and sql_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_timer)
+
+@contextmanager
+def timed_serialization():
+    """
+    Add the time spent in the block to the current request's serialization time. Nested blocks are only counted
+    once, so serializers can time themselves whether or not they are nested in another serializer.
+    """
+    metrics = _current_metrics.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize_time += perf_counter() - start
+        metrics.serializing = False
+
+def server_timing(metrics, total):
+    """
+    Format request metrics as a Server-Timing header value, with durations in milliseconds.
+    """
+    return (
+        f'sql;dur={metrics.sql_time * 1000:.2f};desc="{metrics.sql_queries} queries", '
+        f'serialize;dur={metrics.serialize_time * 1000:.2f}, '
+        f'total;dur={total * 1000:.2f}'
+    )
+
+class RequestMetricsMiddleware:
+    """
+    Measure the SQL queries, serialization and total time of requests to the application's views, report them in
+    a Server-Timing header and observe them into the histograms of the request's URL name. For streaming responses
+    the work done while streaming the body is not included. Runs natively under both WSGI and ASGI, and is disabled
+    with REQUEST_METRICS = False.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.record(request, response, metrics, perf_counter() - start)
+
+    async def __acall__(self, request):
+        # Queries run by the async ORM in worker threads see the same metrics, as the context is copied to them
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.record(request, response, metrics, perf_counter() - start)
+
+    def record(self, request, response, metrics, total):
+        """
+        Add the Server-Timing header and observe the histograms of a request to one of the application's views.
+        """
+        match = request.resolver_match
+        if match is None or not match.func.__module__.startswith('wayfinder.views'):
+            return response
+
+        response['Server-Timing'] = server_timing(metrics, total)
+        url_name = match.url_name or match.view_name
+        REQUEST_DURATION.labels(url_name).observe(total)
+        SQL_DURATION.labels(url_name).observe(metrics.sql_time)
+        SERIALIZE_DURATION.labels(url_name).observe(metrics.serialize_time)
+        SQL_QUERIES.labels(url_name).observe(metrics.sql_queries)
+        return response
+
+class ResponseCacheCollector:
+    """
+    Prometheus collector of the response cache hit and miss counters, which are shared by every worker.
+    """
+
+    def collect(self):
+        hits = CounterMetricFamily('wayfinder_response_cache_hits', 'Response cache hits.', labels=['view'])
+        misses = CounterMetricFamily('wayfinder_response_cache_misses', 'Response cache misses.', labels=['view'])
+        for view_name, counters in get_cache_stats().items():
+            hits.add_metric([view_name], counters['hits'])
+            misses.add_metric([view_name], counters['misses'])
+        yield hits
+        yield misses
+
+# Registry of the response cache counters, which are read from the cache when the metrics are scraped
+CACHE_REGISTRY = CollectorRegistry()
+CACHE_REGISTRY.register(ResponseCacheCollector())
+
+def render_metrics():
+    """
+    Render every metric in the Prometheus text format. When PROMETHEUS_MULTIPROC_DIR is set (several gunicorn
+    workers), the histograms of all workers are combined from that directory, otherwise this process's are used.
+
+    Returns:
+        bytes: The exposition text
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(CACHE_REGISTRY)
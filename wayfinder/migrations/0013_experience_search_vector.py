@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:55
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Weighted vector over the title (A) and description (B), shared by the trigger and the backfill
+CREATE_SEARCH_VECTOR_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION wayfinder_experience_search_vector(title text, description text)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') ||
+           setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B');
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION wayfinder_experience_search_vector_trigger()
+RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := wayfinder_experience_search_vector(NEW.title, NEW.description);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER wayfinder_experience_search_vector_update
+BEFORE INSERT OR UPDATE OF title, description ON wayfinder_experience
+FOR EACH ROW EXECUTE FUNCTION wayfinder_experience_search_vector_trigger();
+"""
+
+DROP_SEARCH_VECTOR_FUNCTIONS = """
+DROP TRIGGER IF EXISTS wayfinder_experience_search_vector_update ON wayfinder_experience;
+DROP FUNCTION IF EXISTS wayfinder_experience_search_vector_trigger();
+DROP FUNCTION IF EXISTS wayfinder_experience_search_vector(text, text);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wayfinder', '0012_alter_rating_comment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experience',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='experience',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='experience_search_vector_gin'),
+        ),
+        migrations.RunSQL(CREATE_SEARCH_VECTOR_FUNCTIONS, DROP_SEARCH_VECTOR_FUNCTIONS),
+    ]
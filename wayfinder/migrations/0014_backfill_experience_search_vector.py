@@ -0,0 +1,41 @@
+# Generated by Django 5.1.4 on 2026-10-18 11:02
+
+from django.db import migrations
+
+# Number of experiences updated per statement, small enough to keep row locks short
+BATCH_SIZE = 1000
+
+
+def backfill_search_vectors(apps, schema_editor):
+    """
+    Fill in the search vector of existing experiences in batches. Each batch commits on its own
+    so the table is never locked for the whole backfill.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                """
+                UPDATE wayfinder_experience
+                SET search_vector = wayfinder_experience_search_vector(title, description)
+                WHERE experience_id IN (
+                    SELECT experience_id FROM wayfinder_experience
+                    WHERE search_vector IS NULL
+                    LIMIT %s
+                )
+                """,
+                [BATCH_SIZE],
+            )
+            if cursor.rowcount < BATCH_SIZE:
+                break
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('wayfinder', '0013_experience_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
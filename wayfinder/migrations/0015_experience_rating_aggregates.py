@@ -0,0 +1,71 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+# Fill in the new aggregates, and recompute the average and count, from the existing ratings
+BACKFILL_RATING_AGGREGATES = """
+UPDATE wayfinder_experience AS experience
+SET rating_sum = aggregate.total,
+    number_of_ratings = aggregate.count,
+    average_rating = aggregate.total::double precision / aggregate.count,
+    rating_1_count = aggregate.count_1,
+    rating_2_count = aggregate.count_2,
+    rating_3_count = aggregate.count_3,
+    rating_4_count = aggregate.count_4,
+    rating_5_count = aggregate.count_5
+FROM (
+    SELECT experience_id,
+           SUM(rating_value) AS total,
+           COUNT(*) AS count,
+           COUNT(*) FILTER (WHERE rating_value = 1) AS count_1,
+           COUNT(*) FILTER (WHERE rating_value = 2) AS count_2,
+           COUNT(*) FILTER (WHERE rating_value = 3) AS count_3,
+           COUNT(*) FILTER (WHERE rating_value = 4) AS count_4,
+           COUNT(*) FILTER (WHERE rating_value = 5) AS count_5
+    FROM wayfinder_rating
+    WHERE rating_value IS NOT NULL
+    GROUP BY experience_id
+) AS aggregate
+WHERE experience.experience_id = aggregate.experience_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wayfinder', '0014_backfill_experience_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experience',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='experience',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='experience',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='experience',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='experience',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='experience',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunSQL(BACKFILL_RATING_AGGREGATES, migrations.RunSQL.noop),
+    ]
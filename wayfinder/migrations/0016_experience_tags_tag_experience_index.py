@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:14
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('wayfinder', '0015_experience_rating_aggregates'),
+    ]
+
+    operations = [
+        # Tag filters look up the experiences of each tag, which this index answers without reading the table
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS wayfinder_experience_tags_tag_experience_idx '
+                'ON wayfinder_experience_tags (tag_id, experience_id)',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS wayfinder_experience_tags_tag_experience_idx',
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('wayfinder', '0016_experience_tags_tag_experience_index'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    operations = [
+        # prune_tokens finds expired tokens by expiry, which this index answers without scanning the table
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS wayfinder_outstandingtoken_expires_at_idx '
+                'ON token_blacklist_outstandingtoken (expires_at)',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS wayfinder_outstandingtoken_expires_at_idx',
+        ),
+    ]
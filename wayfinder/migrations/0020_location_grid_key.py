@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('wayfinder', '0019_task'),
+    ]
+
+    operations = [
+        # Existing locations get their keys from `merge_locations`, which also merges their duplicates
+        migrations.AddField(
+            model_name='location',
+            name='grid_key',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        # Build the unique index without blocking writes, then turn it into the constraint
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS wayfinder_location_grid_key_uniq '
+                        'ON wayfinder_location (grid_key)',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS wayfinder_location_grid_key_uniq',
+                ),
+                migrations.RunSQL(
+                    sql='ALTER TABLE wayfinder_location ADD CONSTRAINT wayfinder_location_grid_key_uniq '
+                        'UNIQUE USING INDEX wayfinder_location_grid_key_uniq',
+                    reverse_sql='ALTER TABLE wayfinder_location DROP CONSTRAINT wayfinder_location_grid_key_uniq',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='location',
+                    constraint=models.UniqueConstraint(fields=('grid_key',), name='wayfinder_location_grid_key_uniq'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('wayfinder', '0020_location_grid_key'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='experience',
+            index=models.Index(fields=['-average_rating', '-number_of_ratings', '-experience_id'], name='experience_rating_order_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='experience',
+            index=models.Index(fields=['creator', '-date_posted', '-experience_id'], name='experience_creator_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='rating',
+            index=models.Index(fields=['experience', '-date_posted', '-rating_id'], name='rating_experience_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='tip',
+            index=models.Index(fields=['-date_posted', '-tip_id'], name='tip_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='tip',
+            index=models.Index(condition=models.Q(('country__isnull', False)), fields=['country', '-date_posted', '-tip_id'], name='tip_country_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='tip',
+            index=models.Index(condition=models.Q(('city__isnull', False)), fields=['city', '-date_posted', '-tip_id'], name='tip_city_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='tip',
+            index=models.Index(fields=['creator', '-date_posted', '-tip_id'], name='tip_creator_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='wishlistitem',
+            index=models.Index(fields=['wishlist', 'experience'], name='wishlist_item_experience_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='wishlistitem',
+            index=models.Index(fields=['wishlist', '-date_added', '-wishlist_item_id'], name='wishlist_item_date_idx'),
+        ),
+        # Drop the single-column foreign key indexes only once the composite indexes leading with the same
+        # columns exist
+        migrations.AlterField(
+            model_name='experience',
+            name='creator',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='created_experiences', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='experience',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='wayfinder.experience'),
+        ),
+        migrations.AlterField(
+            model_name='tip',
+            name='city',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='cities_light.city'),
+        ),
+        migrations.AlterField(
+            model_name='tip',
+            name='country',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='cities_light.country'),
+        ),
+        migrations.AlterField(
+            model_name='tip',
+            name='creator',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='created_tips', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='wishlistitem',
+            name='wishlist',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='wayfinder.wishlist'),
+        ),
+    ]
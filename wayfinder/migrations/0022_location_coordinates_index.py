@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 21:30
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('wayfinder', '0021_hot_path_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='location',
+            index=models.Index(fields=['latitude', 'longitude'], name='location_coordinates_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.1.4 on 2026-10-18 22:15
+
+import datetime
+import django.db.models.expressions
+import django.db.models.functions.datetime
+import django.db.models.functions.math
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+# Number of experiences updated per statement, small enough to keep row locks short
+BATCH_SIZE = 1000
+
+# The score of wayfinder/ranking.py when this migration was written, frozen so later changes to it do not change
+# what the migration does: ln((PRIOR_WEIGHT * PRIOR_MEAN + rating_sum) / (PRIOR_WEIGHT + number_of_ratings)) plus
+# ln(2) per HALF_LIFE_DAYS since EPOCH
+RANKING_SCORE_SQL = (
+    "ln((15.0 + rating_sum) / (5.0 + number_of_ratings)) "
+    "+ 1.0989776454844388e-08 * extract(epoch FROM date_posted - '2024-01-01T00:00:00+00:00'::timestamptz)"
+)
+
+
+def backfill_ranking_scores(apps, schema_editor):
+    """
+    Score existing experiences, which the column default scores as unrated and posted now, in batches of
+    primary keys. Each batch commits on its own so the table is never locked for the whole backfill.
+    """
+    last_id = None
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            # The last primary key of the next batch, or None when fewer than BATCH_SIZE experiences are left
+            cursor.execute(
+                """
+                SELECT experience_id FROM wayfinder_experience
+                WHERE %s::uuid IS NULL OR experience_id > %s::uuid
+                ORDER BY experience_id
+                OFFSET %s LIMIT 1
+                """,
+                [last_id, last_id, BATCH_SIZE - 1],
+            )
+            row = cursor.fetchone()
+            batch_end = row[0] if row else None
+            cursor.execute(
+                f"""
+                UPDATE wayfinder_experience SET ranking_score = {RANKING_SCORE_SQL}
+                WHERE (%s::uuid IS NULL OR experience_id > %s::uuid)
+                AND (%s::uuid IS NULL OR experience_id <= %s::uuid)
+                """,
+                [last_id, last_id, batch_end, batch_end],
+            )
+            if batch_end is None:
+                break
+            last_id = batch_end
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('wayfinder', '0022_location_coordinates_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='experience',
+            name='ranking_score',
+            field=models.FloatField(db_default=django.db.models.expressions.CombinedExpression(django.db.models.functions.math.Ln(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.Value(15.0), '+', models.Value(0)), '/', django.db.models.expressions.CombinedExpression(models.Value(5.0), '+', models.Value(0))), output_field=models.FloatField()), '+', django.db.models.expressions.CombinedExpression(models.Value(1.0989776454844388e-08), '*', django.db.models.functions.datetime.Extract(django.db.models.expressions.CombinedExpression(django.db.models.functions.datetime.Now(), '-', models.Value(datetime.datetime(2024, 1, 1, 0, 0, tzinfo=datetime.timezone.utc))), 'epoch', output_field=models.FloatField()))), editable=False),
+        ),
+        migrations.RunPython(backfill_ranking_scores, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='experience',
+            index=models.Index(fields=['-ranking_score', '-experience_id'], name='experience_ranking_idx'),
+        ),
+    ]
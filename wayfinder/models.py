@@ -3,14 +3,20 @@ Author: Matthew Hilliard
 Email: mch2003@bu.edu
 Description: This module defines the core models for the application, including Location, User, Experience, Tip, 
 Wishlist, WishlistItem, Rating, and Tag. These models represent key entities in the application and establish 
-relationships between users, locations, and experiences.
+relationships between users, locations, and experiences. The Task model stores the jobs of the background task queue.
 """
 
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 import uuid
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
-from .managers import CustomUserManager
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models import Value
+from django.db.models.functions import Now
+from .managers import CustomUserManager, ExperienceManager, LocationManager
+from .ranking import ranking_score
 
 '''Location model for the application'''
 class Location(models.Model):
@@ -20,6 +26,21 @@ class Location(models.Model):
     city = models.ForeignKey('cities_light.City', on_delete=models.SET_NULL, null=True)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    # Coordinates rounded to LOCATION_GRID_PRECISION decimals, unique so each point has a single Location. Empty for
+    # locations without coordinates and for old locations until `merge_locations` has run
+    grid_key = models.CharField(max_length=32, null=True, blank=True, editable=False)
+
+    objects = LocationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['grid_key'], name='wayfinder_location_grid_key_uniq'),
+        ]
+        indexes = [
+            # Bounding-box prefilter of radius searches: the latitude range bounds the scan, and the longitude range
+            # is checked in the index
+            models.Index(fields=['latitude', 'longitude'], name='location_coordinates_idx'),
+        ]
     
     def __str__(self):
         if self.city is not None:
@@ -40,6 +61,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     country = models.ForeignKey('cities_light.Country', on_delete=models.SET_NULL, null=True, blank=True) 
     city = models.ForeignKey('cities_light.City', on_delete=models.SET_NULL, null=True, blank=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True, null=True)
+    # Resized copies of the profile picture, generated in the background (see wayfinder/images.py)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
@@ -62,12 +85,24 @@ class Experience(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     location = models.ForeignKey('Location', on_delete=models.CASCADE, related_name='experiences')
-    creator = models.ForeignKey('User', on_delete=models.CASCADE, related_name='created_experiences')
+    # Indexed by experience_creator_date_idx, which leads with the creator
+    creator = models.ForeignKey('User', on_delete=models.CASCADE, related_name='created_experiences', db_index=False)
     average_rating = models.FloatField(default=0.0)
     number_of_ratings = models.PositiveIntegerField(default=0)
+    # Rating aggregates, updated atomically in the database as ratings arrive
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    # Bayesian average of the ratings with time decay (see wayfinder/ranking.py), updated with the aggregates
+    ranking_score = models.FloatField(db_default=ranking_score(Value(0), Value(0), Now()), editable=False)
     date_posted = models.DateTimeField(auto_now_add=True)
     tags = models.ManyToManyField('Tag', related_name='experiences')
     image = models.ImageField(upload_to='experience_images/', blank=True, null=True)
+    # Resized copies of the image, generated in the background (see wayfinder/images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     price = models.CharField(
         max_length=10,
         choices=[
@@ -82,6 +117,21 @@ class Experience(models.Model):
     start_time = models.TimeField(blank=True, null=True)
     end_time = models.TimeField(blank=True, null=True)
     date = models.DateField(blank=True, null=True)
+    # Weighted title/description vector for full-text search, kept up to date by a database trigger
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ExperienceManager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='experience_search_vector_gin'),
+            # Each index matches a keyset ordering of pagination.py column for column (filters first), so a page is read in order
+            # from the index instead of sorting every matching row
+            models.Index(fields=['-average_rating', '-number_of_ratings', '-experience_id'],
+                         name='experience_rating_order_idx'),
+            models.Index(fields=['creator', '-date_posted', '-experience_id'], name='experience_creator_date_idx'),
+            models.Index(fields=['-ranking_score', '-experience_id'], name='experience_ranking_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -90,11 +140,24 @@ class Experience(models.Model):
 class Tip(models.Model):
     tip_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     content = models.TextField()
-    country = models.ForeignKey('cities_light.Country', on_delete=models.SET_NULL, null=True, blank=True) 
-    city = models.ForeignKey('cities_light.City', on_delete=models.SET_NULL, null=True, blank=True)
-    creator = models.ForeignKey('User', on_delete=models.CASCADE, related_name='created_tips')
+    # The foreign keys are indexed by the date indexes below, which lead with them
+    country = models.ForeignKey('cities_light.Country', on_delete=models.SET_NULL, null=True, blank=True,
+                                db_index=False)
+    city = models.ForeignKey('cities_light.City', on_delete=models.SET_NULL, null=True, blank=True, db_index=False)
+    creator = models.ForeignKey('User', on_delete=models.CASCADE, related_name='created_tips', db_index=False)
     date_posted = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-date_posted', '-tip_id'], name='tip_date_idx'),
+            # Tips are only looked up by a country or city they have, so tips without one are left out
+            models.Index(fields=['country', '-date_posted', '-tip_id'], condition=models.Q(country__isnull=False),
+                         name='tip_country_date_idx'),
+            models.Index(fields=['city', '-date_posted', '-tip_id'], condition=models.Q(city__isnull=False),
+                         name='tip_city_date_idx'),
+            models.Index(fields=['creator', '-date_posted', '-tip_id'], name='tip_creator_date_idx'),
+        ]
+
     def __str__(self):
         return self.content
 
@@ -111,10 +174,18 @@ class Wishlist(models.Model):
 '''WishlistItem model for the application'''
 class WishlistItem(models.Model):
     wishlist_item_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    wishlist = models.ForeignKey('Wishlist', on_delete=models.CASCADE, related_name='items')
+    # Indexed by the indexes below, which lead with the wishlist
+    wishlist = models.ForeignKey('Wishlist', on_delete=models.CASCADE, related_name='items', db_index=False)
     experience = models.ForeignKey('Experience', on_delete=models.CASCADE, related_name='wishlist_items')
     date_added = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Checks whether an experience is already in a wishlist
+            models.Index(fields=['wishlist', 'experience'], name='wishlist_item_experience_idx'),
+            models.Index(fields=['wishlist', '-date_added', '-wishlist_item_id'], name='wishlist_item_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.experience.title} in {self.wishlist.title}"
 
@@ -122,11 +193,17 @@ class WishlistItem(models.Model):
 class Rating(models.Model):
     rating_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='ratings')
-    experience = models.ForeignKey('Experience', on_delete=models.CASCADE, related_name='ratings')
+    # Indexed by rating_experience_date_idx, which leads with the experience
+    experience = models.ForeignKey('Experience', on_delete=models.CASCADE, related_name='ratings', db_index=False)
     comment = models.TextField()
     date_posted = models.DateTimeField(auto_now_add=True)
     rating_value = models.PositiveSmallIntegerField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['experience', '-date_posted', '-rating_id'], name='rating_experience_date_idx'),
+        ]
+
     def __str__(self):
         return f"Rating by {self.user.name} on {self.experience.title}"
 
@@ -137,3 +214,28 @@ class Tag(models.Model):
 
     def __str__(self):
         return self.name
+
+
+'''Task model for the application'''
+class Task(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [(STATUS_QUEUED, 'Queued'), (STATUS_FAILED, 'Failed')]
+
+    name = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers only look for queued tasks, so finished retries don't bloat the index
+            models.Index(fields=['run_at'], condition=models.Q(status='queued'), name='wayfinder_task_queued_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
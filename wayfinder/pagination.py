@@ -0,0 +1,156 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module provides keyset (cursor) pagination for list endpoints. Instead of counting rows or
+using OFFSET, each page is fetched with a WHERE clause that continues after the sort key of the last row of the
+previous page, so every page costs the same no matter how deep the client has paged. The position is handed to
+clients as an opaque, URL-safe cursor string.
+"""
+
+import base64
+import binascii
+import datetime
+import json
+import uuid
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+# Sort keys for each paginated endpoint. Each ends with the primary key as a tiebreaker so the order is total.
+EXPERIENCE_ORDERING = ('-average_rating', '-number_of_ratings', '-experience_id')
+EXPERIENCE_DATE_ORDERING = ('-date_posted', '-experience_id')
+EXPERIENCE_DISTANCE_ORDERING = ('distance', 'experience_id')
+EXPERIENCE_SEARCH_ORDERING = ('-search_rank', '-average_rating', '-number_of_ratings', '-experience_id')
+EXPERIENCE_RANKING_ORDERING = ('-ranking_score', '-experience_id')
+EXPERIENCE_SEARCH_RANKING_ORDERING = ('-search_rank', '-ranking_score', '-experience_id')
+RATING_ORDERING = ('-date_posted', '-rating_id')
+TIP_ORDERING = ('-date_posted', '-tip_id')
+WISHLIST_ITEM_ORDERING = ('-date_added', '-wishlist_item_id')
+
+class KeysetPaginator:
+    """
+    Paginates a queryset on a fixed ordering using an opaque cursor from the request.
+
+    Usage:
+        paginator = KeysetPaginator(request, EXPERIENCE_ORDERING)
+        experiences = paginator.paginate(queryset)
+        return JsonResponse({'data': ..., 'next_cursor': paginator.next_cursor})
+    """
+
+    def __init__(self, request, ordering):
+        """
+        Parameters:
+            request: Request object with optional "cursor" and "page_size" query parameters
+            ordering (tuple): Field names to sort by, prefixed with "-" for descending order
+        """
+        self.ordering = ordering
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request.GET.get('cursor'))
+        self.next_cursor = None
+
+    def get_page_size(self, request):
+        """
+        Get the requested page size, falling back to the default and capping it at the maximum.
+        """
+        default_size = getattr(settings, 'PAGINATION_PAGE_SIZE', 50)
+        max_size = getattr(settings, 'PAGINATION_MAX_PAGE_SIZE', 500)
+        page_size = request.GET.get('page_size')
+        if not page_size:
+            return default_size
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            raise ValidationError({'page_size': ['Page size must be an integer.']})
+        if page_size < 1:
+            raise ValidationError({'page_size': ['Page size must be at least 1.']})
+        return min(page_size, max_size)
+
+    def decode_cursor(self, cursor):
+        """
+        Decode a cursor string into the list of sort key values it points after.
+        """
+        if not cursor:
+            return None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise ValidationError({'cursor': ['Invalid cursor.']})
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise ValidationError({'cursor': ['Invalid cursor.']})
+        return values
+
+    def encode_cursor(self, values):
+        """
+        Encode a list of sort key values into an opaque cursor string.
+        """
+        values = [self._encode_value(value) for value in values]
+        encoded = base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode('ascii'))
+        return encoded.decode('ascii').rstrip('=')
+
+    def _encode_value(self, value):
+        # Keep full precision, the cursor has to compare equal to the stored value
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            return value.isoformat()
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        return value
+
+    def _after_cursor(self, values):
+        """
+        Build the filter that selects rows sorting strictly after the given sort key values, i.e.
+        (a < x) OR (a = x AND b < y) OR (a = x AND b = y AND c < z) for a descending (a, b, c) ordering.
+        """
+        condition = Q()
+        equal_prefix = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal_prefix, **{f'{name}__{lookup}': value})
+            equal_prefix[name] = value
+        return condition
+
+    def page_queryset(self, queryset):
+        """
+        Order the queryset, continue after the cursor and limit it to one page plus one row, which is used
+        to tell whether another page exists without running a COUNT query.
+        """
+        queryset = queryset.order_by(*self.ordering)
+        if self.cursor is not None:
+            try:
+                queryset = queryset.filter(self._after_cursor(self.cursor))
+            except (DjangoValidationError, TypeError, ValueError):
+                raise ValidationError({'cursor': ['Invalid cursor.']})
+        return queryset[:self.page_size + 1]
+
+    def get_key(self, row):
+        """
+        Get the sort key values of a row, which may be a model instance or a dictionary from values().
+        """
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    def build_page(self, rows):
+        """
+        Trim the fetched rows to the page size and set next_cursor if there is another page.
+        """
+        rows = list(rows)
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_cursor = self.encode_cursor(self.get_key(rows[-1]))
+        return rows
+
+    def paginate(self, queryset):
+        """
+        Fetch one page of the queryset.
+
+        Parameters:
+            queryset (QuerySet): The filtered queryset to paginate
+
+        Returns:
+            list: The rows on the current page
+        """
+        return self.build_page(self.page_queryset(queryset))
@@ -0,0 +1,45 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the ranking score experiences can be sorted by. The score is a Bayesian average
+of the ratings, which counts PRIOR_WEIGHT imaginary ratings of PRIOR_MEAN so a single 5-star rating does not
+outrank hundreds of good ones, decayed by half every HALF_LIFE_DAYS since the experience was posted. It is stored
+on a log scale, ln(average) + age offset: the decay then only adds a constant per experience, and stored scores keep
+their order as time passes without being rewritten. The score is one database expression, used as the column's
+default, by `record_rating` as ratings arrive and by the `recompute_ranking_scores` command. After changing a
+constant, run makemigrations (the column default embeds them) and then `recompute_ranking_scores`.
+"""
+
+import datetime
+import math
+from django.db.models import FloatField, Value
+from django.db.models.functions import Extract, Ln
+
+# Imaginary ratings added to every experience: how many, and their value
+PRIOR_WEIGHT = 5
+PRIOR_MEAN = 3.0
+
+# Days after which an experience's score counts half as much as a new one's with the same ratings
+HALF_LIFE_DAYS = 730
+
+# Posting dates are measured from this instant, to keep the scores small
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+def ranking_score(rating_sum, number_of_ratings, date_posted):
+    """
+    Build the ranking score of an experience as a database expression.
+
+    Parameters:
+        rating_sum: Expression of the sum of the rating values, e.g. F('rating_sum')
+        number_of_ratings: Expression of the number of ratings
+        date_posted: Expression of the date the experience was posted, e.g. F('date_posted') or Now()
+
+    Returns:
+        Expression: The score, as a float
+    """
+    bayesian_average = (
+        (Value(PRIOR_WEIGHT * PRIOR_MEAN) + rating_sum) / (Value(float(PRIOR_WEIGHT)) + number_of_ratings)
+    )
+    seconds_since_epoch = Extract(date_posted - Value(EPOCH), 'epoch', output_field=FloatField())
+    decay_rate = math.log(2) / (HALF_LIFE_DAYS * 86400)
+    return Ln(bayesian_average, output_field=FloatField()) + Value(decay_rate) * seconds_since_epoch
@@ -0,0 +1,177 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module provides a versioned response cache for anonymous read endpoints. Each cached view declares
+the models its response depends on. Every model has a version number in the cache, and the cache key of a response
+includes the current versions of its models, so saving or deleting any of them (which bumps its version) makes the
+old entries unreachable without having to find and delete them. The time of each model's last change is kept too,
+for conditional requests. Hit and miss counters are kept per view.
+"""
+
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+VERSION_KEY = 'wayfinder:version:{}'
+RESPONSE_KEY = 'wayfinder:response:{}:{}'
+STATS_KEY = 'wayfinder:cache-stats:{}:{}'
+CHANGED_KEY = 'wayfinder:changed:{}'
+
+# Views wrapped with cache_response, used to report their counters
+cached_views = []
+
+def get_response_cache():
+    """
+    Get the cache backend configured for responses, the default cache unless RESPONSE_CACHE_ALIAS is set.
+    """
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+def bump_cache_version(*model_names):
+    """
+    Invalidate every cached response that depends on the given models.
+
+    Parameters:
+        model_names (str): Lowercase model names, e.g. "experience"
+    """
+    cache = get_response_cache()
+    for model_name in model_names:
+        key = VERSION_KEY.format(model_name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Missing versions start from the current time so they never repeat an evicted version
+            cache.set(key, time.time_ns(), None)
+    now = time.time()
+    cache.set_many({CHANGED_KEY.format(model_name): now for model_name in model_names}, None)
+
+def get_cache_versions(model_names):
+    """
+    Get the current version of each model, initializing any that are missing.
+    """
+    cache = get_response_cache()
+    keys = [VERSION_KEY.format(model_name) for model_name in model_names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = cache.get_or_set(key, time.time_ns(), None)
+    return [versions[key] for key in keys]
+
+def get_last_change_time(model_names):
+    """
+    Get when any of the models last changed, as a Unix timestamp. Models with no recorded change are taken to
+    have changed now, as a change may have been evicted from the cache.
+    """
+    cache = get_response_cache()
+    keys = [CHANGED_KEY.format(model_name) for model_name in model_names]
+    changed = cache.get_many(keys)
+    for key in keys:
+        if key not in changed:
+            changed[key] = cache.get_or_set(key, time.time(), None)
+    return max(changed.values())
+
+def _increment_stat(view_name, outcome):
+    cache = get_response_cache()
+    key = STATS_KEY.format(view_name, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+def get_cache_stats():
+    """
+    Get the hit and miss counters of every cached view.
+
+    Returns:
+        dict: Mapping of view name to {"hits": int, "misses": int}
+    """
+    cache = get_response_cache()
+    keys = [STATS_KEY.format(view_name, outcome) for view_name in cached_views for outcome in ('hits', 'misses')]
+    counters = cache.get_many(keys)
+    return {
+        view_name: {
+            outcome: counters.get(STATS_KEY.format(view_name, outcome), 0) for outcome in ('hits', 'misses')
+        }
+        for view_name in cached_views
+    }
+
+def build_cache_key(view_name, request, versions):
+    """
+    Build the cache key of a request from the view, path, normalized query string and model versions.
+    """
+    query = urlencode(sorted((key, value) for key, values in request.GET.lists() for value in values))
+    digest = hashlib.md5(
+        f'{request.path}?{query}|{":".join(str(version) for version in versions)}'.encode('utf-8')
+    ).hexdigest()
+    return RESPONSE_KEY.format(view_name, digest)
+
+def _lookup(view_name, model_names, request):
+    """
+    Build a request's cache key and get its cached response, counting the hit or miss.
+
+    Returns:
+        tuple: (cache key, cached (content, content type) or None)
+    """
+    # Read the versions before running the view, so a change made while it runs invalidates this entry
+    key = build_cache_key(view_name, request, get_cache_versions(model_names))
+    cached = get_response_cache().get(key)
+    _increment_stat(view_name, 'hits' if cached is not None else 'misses')
+    return key, cached
+
+def _hit_response(cached):
+    content, content_type = cached
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Cache'] = 'HIT'
+    return response
+
+def _store(key, response, timeout):
+    if response.status_code == 200 and not response.streaming:
+        cache_timeout = timeout if timeout is not None else getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+        get_response_cache().set(key, (response.content, response['Content-Type']), cache_timeout)
+    response['X-Cache'] = 'MISS'
+
+def cache_response(*model_names, timeout=None):
+    """
+    Cache successful responses of a read-only view until one of the models it depends on changes.
+    Async views are supported, their cache reads and writes run in a worker thread.
+
+    Parameters:
+        model_names (str): Lowercase names of the models the response depends on
+        timeout (int): Seconds to keep responses, defaults to RESPONSE_CACHE_TIMEOUT
+
+    Usage:
+        @api_view(['GET'])
+        @authentication_classes([])
+        @permission_classes([AllowAny])
+        @cache_response('tag')
+        def get_tags(request):
+    """
+    def decorator(view):
+        view_name = view.__name__
+        cached_views.append(view_name)
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                key, cached = await sync_to_async(_lookup)(view_name, model_names, request)
+                if cached is not None:
+                    return _hit_response(cached)
+                response = await view(request, *args, **kwargs)
+                await sync_to_async(_store)(key, response, timeout)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key, cached = _lookup(view_name, model_names, request)
+            if cached is not None:
+                return _hit_response(cached)
+            response = view(request, *args, **kwargs)
+            _store(key, response, timeout)
+            return response
+        return wrapper
+    return decorator
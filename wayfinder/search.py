@@ -0,0 +1,37 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module builds PostgreSQL full-text search queries for experiences. Experience titles and
+descriptions are indexed in a weighted `tsvector` column (title weighted higher) that is maintained by a database
+trigger and backed by a GIN index. Queries are either parsed like a web search engine would (quoted phrases, "or",
+"-" exclusions) or, for search-as-you-type, turned into prefix matches on every term.
+"""
+
+import re
+from django.contrib.postgres.search import SearchQuery
+
+# Text search configuration used by the search_vector trigger, the backfill and the queries
+SEARCH_CONFIG = 'english'
+
+# Words in user input; anything else (including tsquery operators) is dropped for prefix queries
+TERM_PATTERN = re.compile(r'\w+')
+
+def build_search_query(text, prefix=False):
+    """
+    Build a full-text search query from user input.
+
+    Parameters:
+        text (str): The search text entered by the user
+        prefix (bool): Whether to match every term as a prefix, for search-as-you-type
+
+    Returns:
+        SearchQuery or None: The query, or None if the text contains no searchable terms
+    """
+    if prefix:
+        terms = TERM_PATTERN.findall(text)
+        if not terms:
+            return None
+        return SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=SEARCH_CONFIG)
+    if not text.strip():
+        return None
+    return SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
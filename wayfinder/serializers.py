@@ -6,10 +6,105 @@ The serializers define how data is serialized/deserialized and include logic for
 """
 
 from rest_framework import serializers
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch
 from cities_light.models import City, Country, Region
 from .models import *
+from .metrics import timed_serialization
+from .helpers import location_instances, resolve_location_id
 from dj_rest_auth.registration.serializers import RegisterSerializer
 
+"""--- Eager Loading ---"""
+
+class EagerLoadingMixin:
+    """
+    Mixin that lets a serializer declare the related objects it reads, so list views can load them up front
+    instead of issuing one query per row.
+
+    Attributes:
+        select_related_fields: Forward foreign keys to join in the main query
+        prefetch_related_fields: Many-valued relations (names or Prefetch objects) to load in one extra query each
+        nested_eager_loading: Mapping of a relation name to the nested serializer whose plan should be included
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    nested_eager_loading = {}
+
+    @classmethod
+    def get_eager_loading_plan(cls, prefix=''):
+        """
+        Build the select_related and prefetch_related lookups for this serializer and its nested serializers.
+
+        Parameters:
+            prefix (str): Lookup prefix when this serializer is nested under a relation (e.g. "experience__")
+
+        Returns:
+            tuple: (list of select_related lookups, list of prefetch_related lookups)
+        """
+        select_related = [prefix + field for field in cls.select_related_fields]
+        prefetch_related = []
+        for lookup in cls.prefetch_related_fields:
+            if isinstance(lookup, Prefetch):
+                lookup = Prefetch(prefix + lookup.prefetch_through, queryset=lookup.queryset, to_attr=lookup.to_attr)
+            else:
+                lookup = prefix + lookup
+            prefetch_related.append(lookup)
+
+        # Include the plans of nested serializers under their relation
+        for relation, serializer_class in cls.nested_eager_loading.items():
+            nested_select, nested_prefetch = serializer_class.get_eager_loading_plan(prefix + relation + '__')
+            select_related.extend(nested_select)
+            prefetch_related.extend(nested_prefetch)
+        return select_related, prefetch_related
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """
+        Apply this serializer's eager loading plan to a queryset.
+
+        Parameters:
+            queryset (QuerySet): The queryset that will be serialized
+
+        Returns:
+            QuerySet: The queryset with select_related and prefetch_related applied
+        """
+        select_related, prefetch_related = cls.get_eager_loading_plan()
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    def to_representation(self, instance):
+        # Count the time spent serializing towards the request's metrics
+        with timed_serialization():
+            return super().to_representation(instance)
+
+"""--- Fields ---"""
+
+class ImageVariantsField(serializers.JSONField):
+    """
+    Read-only field of an image's resized variants (see wayfinder/images.py) with the URL of each format, e.g.
+    {"width": 4032, "height": 3024, "thumbnail": {"width": 320, "height": 240, "webp": url, "jpeg": url}, ...}.
+    None while the variants are being generated, or when the image could not be read.
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value or 'error' in value:
+            return None
+        data = {}
+        for key, variant in value.items():
+            if isinstance(variant, dict):
+                data[key] = {
+                    name: default_storage.url(item) if isinstance(item, str) else item for name, item in variant.items()
+                }
+            elif key != 'source':
+                data[key] = variant
+        return data
+
 """--- Auth Serializers ---"""
 
 class CustomRegisterSerializer(RegisterSerializer):
@@ -29,43 +124,41 @@ class CustomRegisterSerializer(RegisterSerializer):
         location_type = self.validated_data.get('location_type', '').strip()
         location_id = self.validated_data.get('location_id')
         
-        # Match the location type and ID
+        # Match the location type and ID against the in-memory location index
         if location_type and location_id:
-            if location_type == 'country':
-                country = Country.objects.filter(id=location_id).first()
-                if country:
-                    user.country = country
-            elif location_type == 'city':
-                city = City.objects.filter(id=location_id).first()
-                if city:
-                    user.city = city
-                    user.country = city.country
+            location = resolve_location_id(location_type, location_id)
+            if location:
+                user.country, _, user.city = location_instances(location)
         
         # Save user with updated fields
         user.save(update_fields=["name", "country", "city"])
         
 """--- Django Cities Light Serializers ---"""
 
-class CitySerializer(serializers.ModelSerializer):
+class CitySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = City
         fields = ['id', 'name']  # Include relevant city fields
         
-class RegionSerializer(serializers.ModelSerializer):
+class RegionSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Region
         fields = ['id', 'name']  # Include relevant region fields
 
-class CountrySerializer(serializers.ModelSerializer):
+class CountrySerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Country
         fields = ['id', 'name']  # Include relevant country fields
         
 """--- Application Serializers ---"""
         
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     country_info = CountrySerializer(source='country', read_only=True)  # Serialize country info for GET requests
     city_info = CitySerializer(source='city', read_only=True)  # Serialize city info for GET requests
+    profile_picture_variants = ImageVariantsField()  # Resized profile pictures
+    
+    select_related_fields = ('country', 'city')
+    prefetch_related_fields = ('groups', 'user_permissions')  # Many-to-many fields included by '__all__'
     
     class Meta:
         model = User
@@ -77,28 +170,37 @@ class UserSerializer(serializers.ModelSerializer):
             return obj.profile_picture.url
         return None
 
-class LocationSerializer(serializers.ModelSerializer):
+class LocationSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     city_info = CitySerializer(source='city', read_only=True)  # Serialize city info for GET requests
     region_info = RegionSerializer(source='region', read_only=True)  # Serialize region info for GET requests
     country_info = CountrySerializer(source='country', read_only=True)  # Serialize country info for GET requests
     
+    select_related_fields = ('city', 'region', 'country')
+    
     class Meta:
         model = Location
-        fields = '__all__'
+        # Only used inside the database, to deduplicate locations at the same point
+        exclude = ['grid_key']
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = '__all__'
 
-class ExperienceSerializer(serializers.ModelSerializer):
+class ExperienceSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)  # Serialize related tags for GET requests
     location_info = LocationSerializer(source='location', read_only=True)  # Serialize related location for GET requests
     creator_info = UserSerializer(source='creator')  # Add custom field for creator info
+    image_variants = ImageVariantsField()  # Resized images
+    
+    select_related_fields = ('location', 'creator')
+    prefetch_related_fields = ('tags',)
+    nested_eager_loading = {'location': LocationSerializer, 'creator': UserSerializer}
 
     class Meta:
         model = Experience
-        fields = '__all__'
+        # Only used inside the database, for full-text search and as a sort key
+        exclude = ['search_vector', 'ranking_score']
         
     def get_image_url(self, obj):
         if obj.image:
@@ -106,33 +208,45 @@ class ExperienceSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
         
-class RatingSerializer(serializers.ModelSerializer):
+class RatingSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user_info = UserSerializer(source='user', read_only=True)  # Serialize user info for GET requests
     experience_info = ExperienceSerializer(source='experience', read_only=True)  # Serialize experience info for GET requests
     
+    select_related_fields = ('user', 'experience')
+    nested_eager_loading = {'user': UserSerializer, 'experience': ExperienceSerializer}
+    
     class Meta:
         model = Rating
         fields = '__all__'
         
-class WishlistSerializer(serializers.ModelSerializer):
+class WishlistSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user_info = UserSerializer(source='user', read_only=True)  # Serialize user info for GET requests
     
+    select_related_fields = ('user',)
+    nested_eager_loading = {'user': UserSerializer}
+    
     class Meta:
         model = Wishlist
         fields = '__all__'
         
-class WishlistItemSerializer(serializers.ModelSerializer):
+class WishlistItemSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     experience_info = ExperienceSerializer(source='experience', read_only=True)  # Serialize experience info for GET requests
     
+    select_related_fields = ('experience',)
+    nested_eager_loading = {'experience': ExperienceSerializer}
+    
     class Meta:
         model = WishlistItem
         fields = '__all__'
         
-class TipSerializer(serializers.ModelSerializer):
+class TipSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     creator_info = UserSerializer(source='creator', read_only=True)  # Serialize creator info for GET requests
     country_info = CountrySerializer(source='country', read_only=True)  # Serialize country info for GET requests
     city_info = CitySerializer(source='city', read_only=True)  # Serialize city info for GET requests
     
+    select_related_fields = ('creator', 'country', 'city')
+    nested_eager_loading = {'creator': UserSerializer}
+    
     class Meta:
         model = Tip
         fields = '__all__'
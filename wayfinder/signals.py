@@ -0,0 +1,117 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the application's signal receivers. Changes to the django-cities-light reference
+tables mark the in-process location indexes as stale so every worker rebuilds them, and changes to the application's
+models bump the versions that cached read responses are keyed on. Saving or deleting a user drops them from the
+authentication cache and from cached responses, and refresh tokens blacklisted in the database (e.g. at logout) are
+added to the cache denylist when it is used. Saving a new experience image or profile picture schedules its resized variants. New
+database connections get the SQL timer of the request metrics.
+"""
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from cities_light.models import Country, Region, City
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from wayfinder.authentication import invalidate_cached_user
+from wayfinder.images import IMAGE_FIELDS, schedule_image_processing, variants_field
+from wayfinder.indexes.base import mark_reference_data_changed
+from wayfinder.metrics import install_sql_timer
+from wayfinder.models import Experience, Location, Rating, Tag, Tip, User, Wishlist
+from wayfinder.response_cache import bump_cache_version
+from wayfinder.tokens import deny_token, uses_cache_denylist
+
+@receiver([post_save, post_delete], sender=Country)
+@receiver([post_save, post_delete], sender=Region)
+@receiver([post_save, post_delete], sender=City)
+def reference_data_changed(sender, **kwargs):
+    """
+    Rebuild the location indexes and drop cached location searches after a country, region or city is saved or deleted,
+    once the change is committed: a worker rebuilding before then would read the old rows and record them as current.
+    """
+    transaction.on_commit(mark_reference_data_changed)
+    transaction.on_commit(lambda: bump_cache_version('cities'))
+
+@receiver([post_save, post_delete], sender=Experience)
+@receiver([post_save, post_delete], sender=Rating)
+@receiver([post_save, post_delete], sender=Tip)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Location)
+@receiver([post_save, post_delete], sender=Wishlist)
+def model_changed(sender, **kwargs):
+    """
+    Invalidate cached responses that depend on the saved or deleted model, once the change is committed.
+    """
+    model_name = sender._meta.model_name
+    transaction.on_commit(lambda: bump_cache_version(model_name))
+
+@receiver(m2m_changed, sender=Experience.tags.through)
+def experience_tags_changed(sender, action, **kwargs):
+    """
+    Invalidate cached experience responses when an experience's tags change.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: bump_cache_version('experience'))
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    """
+    Drop a saved or deleted user from the authentication cache, now and again once the change is committed, so a
+    request that loaded the old row meanwhile cannot keep it cached, and invalidate cached responses that embed user
+    details. Logins only update last_login, which neither authentication nor responses read, so they keep both.
+    """
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    user_id = instance.pk
+    invalidate_cached_user(user_id)
+    transaction.on_commit(lambda: invalidate_cached_user(user_id))
+    transaction.on_commit(lambda: bump_cache_version('user'))
+
+@receiver(post_save, sender=BlacklistedToken)
+def token_blacklisted(sender, instance, created, **kwargs):
+    """
+    Add refresh tokens blacklisted outside the refresh endpoint, such as at logout or from the admin, to the cache
+    denylist, which is the only place refreshes check when it is used.
+    """
+    if created and uses_cache_denylist():
+        deny_token(instance.token.jti, instance.token.expires_at)
+
+def image_field_saved(instance, field_name, update_fields):
+    # Saves of other fields (such as last_login at every login) leave the image alone
+    if update_fields is not None and field_name not in update_fields:
+        return False
+    return not {field_name, variants_field(field_name)} & instance.get_deferred_fields()
+
+@receiver(pre_save, sender=Experience)
+@receiver(pre_save, sender=User)
+def image_saving(sender, instance, update_fields=None, **kwargs):
+    """
+    Clear the variants of an image that is being replaced or removed, marking the new image as pending.
+    """
+    field_name = IMAGE_FIELDS[sender._meta.label_lower]
+    if not image_field_saved(instance, field_name, update_fields):
+        return
+    variants = getattr(instance, variants_field(field_name))
+    if variants and variants.get('source') != getattr(instance, field_name).name:
+        setattr(instance, variants_field(field_name), {})
+
+@receiver(post_save, sender=Experience)
+@receiver(post_save, sender=User)
+def image_saved(sender, instance, update_fields=None, **kwargs):
+    """
+    Schedule the variants of a saved image that has none yet.
+    """
+    field_name = IMAGE_FIELDS[sender._meta.label_lower]
+    if not image_field_saved(instance, field_name, update_fields):
+        return
+    if getattr(instance, field_name) and not getattr(instance, variants_field(field_name)):
+        schedule_image_processing(instance, field_name)
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    """
+    Count and time the queries of each request on every database connection.
+    """
+    install_sql_timer(connection)
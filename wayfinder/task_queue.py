@@ -0,0 +1,107 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module implements a small background task queue stored in PostgreSQL. Functions decorated with
+`@task` get an `enqueue` method, which inserts a Task row in the request's transaction, so a task is only seen by
+workers once the request commits and disappears with it when it rolls back. Workers (`python manage.py run_worker`)
+claim due tasks with SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can run side by side without taking
+the same task, and run each task in the transaction that holds its lock: a successful task is deleted in the same
+commit as its database changes, and a task whose worker died is unlocked and picked up again. Failed tasks are
+retried with exponential backoff, and kept with status "failed" once they run out of attempts. With
+TASKS_RUN_INLINE set (as in tests), tasks run as soon as they are enqueued instead.
+"""
+
+import logging
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from wayfinder.models import Task
+
+logger = logging.getLogger(__name__)
+
+# Registered task functions, by name
+_registry = {}
+
+def task(func=None, *, max_attempts=5):
+    """
+    Register a function as a background task and add an `enqueue(**kwargs)` method to it. The keyword arguments
+    are stored as JSON, so pass IDs (as strings for UUIDs) rather than model instances.
+
+    Parameters:
+        max_attempts (int): How many times the task is run before it is marked as failed
+    """
+    def decorator(func):
+        name = f'{func.__module__}.{func.__name__}'
+        _registry[name] = func
+        func.task_name = name
+        func.enqueue = lambda **kwargs: enqueue(name, kwargs, max_attempts=max_attempts)
+        return func
+    return decorator(func) if func is not None else decorator
+
+def tasks_run_inline():
+    return getattr(settings, 'TASKS_RUN_INLINE', False)
+
+def enqueue(name, kwargs, max_attempts=5, delay=None):
+    """
+    Queue a registered task, or run it right away when TASKS_RUN_INLINE is set.
+
+    Parameters:
+        name (str): Name of the task
+        kwargs (dict): Keyword arguments of the task, which must be JSON serializable
+        max_attempts (int): How many times the task is run before it is marked as failed
+        delay (timedelta): How long to wait before running the task, if at all
+
+    Returns:
+        Task or None: The queued task, or None when it ran inline
+    """
+    if tasks_run_inline():
+        _registry[name](**kwargs)
+        return None
+    run_at = timezone.now() + delay if delay else timezone.now()
+    return Task.objects.create(name=name, kwargs=kwargs, run_at=run_at, max_attempts=max_attempts)
+
+def retry_delay(attempts):
+    """
+    Get how long to wait before retrying a task that has failed a number of times: TASK_RETRY_DELAY seconds,
+    doubled after every failure up to TASK_MAX_RETRY_DELAY.
+    """
+    base = getattr(settings, 'TASK_RETRY_DELAY', 10)
+    longest = getattr(settings, 'TASK_MAX_RETRY_DELAY', 3600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), longest))
+
+def run_next():
+    """
+    Claim the next due task and run it. Tasks locked by other workers are skipped rather than waited for.
+
+    Returns:
+        Task or None: The task that was run, or None when no task is due. Tasks that succeeded are deleted, which
+        leaves them without a primary key
+    """
+    with transaction.atomic():
+        task = Task.objects.select_for_update(skip_locked=True).filter(
+            status=Task.STATUS_QUEUED, run_at__lte=timezone.now()
+        ).order_by('run_at').first()
+        if task is None:
+            return None
+
+        try:
+            # A savepoint, so a failed task's changes are rolled back while its retry is still recorded
+            with transaction.atomic():
+                if task.name not in _registry:
+                    raise LookupError(f'No task is registered as "{task.name}".')
+                _registry[task.name](**task.kwargs)
+        except Exception:
+            task.attempts += 1
+            task.last_error = traceback.format_exc()
+            if task.attempts >= task.max_attempts:
+                task.status = Task.STATUS_FAILED
+                logger.exception('Task %s (%s) failed for good after %s attempts.', task.pk, task.name, task.attempts)
+            else:
+                task.run_at = timezone.now() + retry_delay(task.attempts)
+                logger.warning('Task %s (%s) failed, retrying at %s.', task.pk, task.name, task.run_at, exc_info=True)
+            task.save(update_fields=['attempts', 'last_error', 'status', 'run_at'])
+        else:
+            task.delete()
+    return task
@@ -0,0 +1,49 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the background tasks the write endpoints defer to the task queue: adding a rating
+to its experience's aggregates, and assigning the nearest city to a new location. The resized variants of uploaded
+images are generated by a task defined in `wayfinder.images`.
+"""
+
+from django.db import transaction
+from wayfinder.helpers import find_nearest_city
+from wayfinder.models import Experience, Location
+from wayfinder.response_cache import bump_cache_version
+from wayfinder.task_queue import task
+
+@task
+def record_rating(experience_id, rating_value):
+    """
+    Add a rating value to an experience's aggregates. The task runs in one transaction with the removal of its
+    queue row, so the value is only ever counted once.
+
+    Parameters:
+        experience_id (str): ID of the rated experience
+        rating_value (int): The rating, from 1 to 5
+    """
+    if Experience.objects.record_rating(experience_id, rating_value):
+        # Queryset updates do not send save signals, so invalidate cached experiences directly
+        transaction.on_commit(lambda: bump_cache_version('experience'))
+
+@task
+def resolve_location_city(location_id):
+    """
+    Assign the city nearest to its coordinates to a location that has no city, filling in its region and country
+    if they are missing too.
+
+    Parameters:
+        location_id (str): ID of the location
+    """
+    location = Location.objects.filter(
+        pk=location_id, city__isnull=True, latitude__isnull=False, longitude__isnull=False
+    ).first()
+    if location is None:
+        return
+    city = find_nearest_city(location.latitude, location.longitude)
+    if city is None:
+        return
+    location.city = city
+    location.region_id = location.region_id or city.region_id
+    location.country_id = location.country_id or city.country_id
+    location.save(update_fields=['city', 'region', 'country'])
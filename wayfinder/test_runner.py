@@ -0,0 +1,20 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the test runner of the application, which runs background tasks as soon as they
+are enqueued, so tests see their effects without running a worker. Tests of the task queue itself turn this off
+with `override_settings(TASKS_RUN_INLINE=False)`.
+"""
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+class InlineTasksTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.inline_tasks = override_settings(TASKS_RUN_INLINE=True)
+        self.inline_tasks.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.inline_tasks.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,1099 @@
-from django.test import TestCase
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module contains the application's tests. They run against PostgreSQL, which the application
+relies on for full-text search and row locking.
+"""
 
-# Create your tests here.
+import base64
+import json
+import math
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+import boto3
+import requests
+from asgiref.sync import sync_to_async
+from cities_light.models import City, Country, Region
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import JsonResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from moto import mock_aws
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from wayfinder.fast_serializers import FastJsonResponse, get_projection
+from wayfinder.geo import EARTH_RADIUS_KM
+from wayfinder.helpers import find_nearest_cities, find_nearest_city, resolve_location_names
+from wayfinder.indexes.base import mark_reference_data_changed
+from wayfinder.indexes.city_search import NameIndex, city_search_index
+from wayfinder.indexes.nearest_city import KDTree, chord_to_km, to_unit_vector
+from wayfinder.models import Experience, Location, Rating, Tag, Task, Tip, User, Wishlist, WishlistItem
+from wayfinder.pagination import EXPERIENCE_ORDERING, TIP_ORDERING
+from wayfinder import ranking
+from wayfinder.response_cache import CHANGED_KEY, get_response_cache
+from wayfinder.serializers import ExperienceSerializer, RatingSerializer, TipSerializer
+from wayfinder.task_queue import run_next, task
+from wayfinder.tasks import record_rating
+
+def create_experience(creator, **fields):
+    """
+    Create an experience at a new location for tests.
+    """
+    location = Location.objects.create(latitude=42.35, longitude=-71.06)
+    return Experience.objects.create(
+        title=fields.pop('title', 'Harbor walk'),
+        description=fields.pop('description', 'A walk along the harbor'),
+        location=location,
+        creator=creator,
+        **fields
+    )
+
+class RatingAggregationConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(name='Rater', email='rater@example.com', password='password')
+        self.experience = create_experience(self.user)
+
+    def test_parallel_ratings_are_all_counted(self):
+        values = [1, 2, 3, 4, 5] * 4
+        barrier = threading.Barrier(len(values))
+        statuses = []
+
+        def rate(value):
+            try:
+                client = APIClient()
+                client.force_authenticate(user=self.user)
+                barrier.wait()  # Fire every request at the same time
+                response = client.post('/ratings/create_rating/', {
+                    'experience_id': str(self.experience.experience_id),
+                    'rating_value': value,
+                    'comment': 'Parallel rating',
+                }, format='json')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=rate, args=(value,)) for value in values]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses, [201] * len(values))
+        self.experience.refresh_from_db()
+        self.assertEqual(self.experience.number_of_ratings, len(values))
+        self.assertEqual(self.experience.rating_sum, sum(values))
+        self.assertAlmostEqual(self.experience.average_rating, sum(values) / len(values))
+        for value in range(1, 6):
+            self.assertEqual(getattr(self.experience, f'rating_{value}_count'), 4)
+
+class RecomputeRatingAggregatesTests(TestCase):
+    def test_command_rebuilds_aggregates_from_ratings(self):
+        user = User.objects.create_user(name='Rater', email='rater@example.com', password='password')
+        rated = create_experience(user)
+        unrated = create_experience(user, number_of_ratings=3, rating_sum=9, average_rating=3.0)
+        for value in (5, 4, 4, None):
+            Rating.objects.create(user=user, experience=rated, rating_value=value, comment='Great')
+
+        call_command('recompute_rating_aggregates', batch_size=1, stdout=StringIO())
+
+        rated.refresh_from_db()
+        unrated.refresh_from_db()
+        self.assertEqual((rated.number_of_ratings, rated.rating_sum, rated.rating_4_count, rated.rating_5_count), (3, 13, 2, 1))
+        self.assertAlmostEqual(rated.average_rating, 13 / 3)
+        self.assertEqual((unrated.number_of_ratings, unrated.rating_sum, unrated.average_rating), (0, 0, 0.0))
+
+class ListQueryCountTests(TestCase):
+    def setUp(self):
+        self.addCleanup(mark_reference_data_changed)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.country = Country.objects.create(name='Ireland', code2='IE', code3='IRL')
+            self.city = City.objects.create(name='Dublin', country=self.country, latitude=53.35, longitude=-6.26)
+        self.tags = [Tag.objects.create(name=name) for name in ('hiking', 'food')]
+        self.owner = User.objects.create_user(name='Owner', email='owner@example.com', password='password')
+        self.rated = create_experience(self.owner, title='Rated')
+        self.wishlist = Wishlist.objects.create(user=self.owner, title='Someday')
+        self.rows = 0
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def add_rows(self, count):
+        # Every row has its own creator, location and related rows, as an N+1 query would load each separately
+        for _ in range(count):
+            self.rows += 1
+            creator = User.objects.create_user(
+                name=f'Creator {self.rows}', email=f'creator{self.rows}@example.com', password='password',
+                country=self.country, city=self.city,
+            )
+            experience = create_experience(creator, title=f'Experience {self.rows}')
+            experience.tags.set(self.tags)
+            create_experience(self.owner, title=f'Owned {self.rows}').tags.set(self.tags)
+            Rating.objects.create(experience=self.rated, user=creator, rating_value=4, comment='Good')
+            Tip.objects.create(content=f'Tip {self.rows}', country=self.country, city=self.city, creator=creator)
+            WishlistItem.objects.create(wishlist=self.wishlist, experience=experience)
+
+    def count_queries(self):
+        urls = [
+            ('/experiences/get_experiences/', {}),
+            ('/experiences/get_experiences_with_filters/', {'tags': 'hiking,food'}),
+            ('/experiences/get_nearby_experiences/', {'latitude': 42.35, 'longitude': -71.06}),
+            (f'/experiences/get_experiences_by_user_id/{self.owner.pk}/', {}),
+            (f'/ratings/get_experience_ratings/{self.rated.pk}/', {}),
+            ('/tips/get_tips_with_filters/', {}),
+            (f'/tips/get_tips_by_user_id/{User.objects.get(name="Creator 1").pk}/', {}),
+            (f'/wishlists/get_wishlist_items/{self.wishlist.pk}', {}),
+        ]
+        counts = {}
+        for url, params in urls:
+            get_response_cache().clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, url)
+            counts[url] = len(queries.captured_queries)
+        return counts
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        self.add_rows(1)
+        single = self.count_queries()
+        self.add_rows(4)
+        self.assertEqual(self.count_queries(), single)
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = User.objects.create_user(name='Pager', email='pager@example.com', password='password')
+        experiences = [create_experience(self.user, title=f'Experience {number}') for number in range(7)]
+        # Ties in every sort key but the primary key
+        for experience, (average, count) in zip(experiences, [(4.0, 2)] * 3 + [(0.0, 0)] * 3 + [(5.0, 1)]):
+            Experience.objects.filter(pk=experience.pk).update(average_rating=average, number_of_ratings=count)
+        tips = [Tip.objects.create(content=f'Tip {number}', creator=self.user) for number in range(5)]
+        Tip.objects.filter(pk__in=[tip.pk for tip in tips]).update(date_posted=timezone.now())
+
+    def page_through(self, url, page_size):
+        """
+        Request every page of a list endpoint, returning the rows of each page.
+        """
+        pages, params = [], {'page_size': page_size}
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            pages.append(body['data'])
+            if body['next_cursor'] is None:
+                return pages
+            params['cursor'] = body['next_cursor']
+
+    def test_pages_cover_every_row_once_despite_ties(self):
+        pages = self.page_through('/experiences/get_experiences/', 2)
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        expected = [str(pk) for pk in Experience.objects.order_by(*EXPERIENCE_ORDERING).values_list('pk', flat=True)]
+        self.assertEqual([row['experience_id'] for page in pages for row in page], expected)
+
+        pages = self.page_through('/tips/get_tips_with_filters/', 2)
+        expected = [str(pk) for pk in Tip.objects.order_by(*TIP_ORDERING).values_list('pk', flat=True)]
+        self.assertEqual([row['tip_id'] for page in pages for row in page], expected)
+
+        # A page that ends exactly at the last row has no next page
+        self.assertEqual(len(self.page_through('/experiences/get_experiences/', 7)), 1)
+
+    def test_malformed_cursor_or_page_size_is_rejected(self):
+        wrong_length = base64.urlsafe_b64encode(b'[1,2]').decode('ascii')
+        wrong_types = base64.urlsafe_b64encode(b'["high","many","not-a-uuid"]').decode('ascii')
+        for params in ({'cursor': 'not a cursor!'}, {'cursor': wrong_length}, {'cursor': wrong_types},
+                       {'page_size': 'ten'}, {'page_size': 0}):
+            with self.subTest(params=params):
+                response = self.client.get('/experiences/get_experiences/', params)
+                self.assertEqual(response.status_code, 400)
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(name='Rater', email='rater@example.com', password='password')
+        self.experience = create_experience(self.user)
+        Rating.objects.create(experience=self.experience, user=self.user, rating_value=4)
+        self.url = f'/ratings/get_experience_ratings/{self.experience.experience_id}/'
+
+    def test_matching_etag_returns_not_modified_without_serializing(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):  # Only the fingerprint query
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_rating_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Rating.objects.create(experience=self.experience, user=self.user, rating_value=2)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_changes_to_embedded_rows_change_etag(self):
+        tips_url = '/tips/get_tips_with_filters/'
+        Tip.objects.create(content='Take the ferry', creator=self.user)
+        etags = {url: self.client.get(url)['ETag'] for url in (self.url, tips_url)}
+
+        # Renaming the user and updating the experience's aggregates move neither the row count nor the newest date
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.name = 'Renamed'
+            self.user.save()
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['ETag'], self.client.get(url)['ETag'])
+            etags[url] = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record_rating(experience_id=str(self.experience.pk), rating_value=5)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etags[self.url]).status_code, 200)
+        self.assertEqual(self.client.get(tips_url, HTTP_IF_NONE_MATCH=etags[tips_url]).status_code, 304)
+
+    def test_changes_without_new_rows_move_last_modified(self):
+        tips_url = '/tips/get_tips_with_filters/'
+        tips = [Tip.objects.create(content=content, creator=self.user) for content in ('Take the ferry', 'Go early')]
+        Tip.objects.update(date_posted=timezone.now() - timedelta(days=1))
+
+        def if_modified_since_status():
+            # Move the recorded changes an hour back, so the change under test lands in a later second
+            an_hour_ago = time.time() - 3600
+            get_response_cache().set_many({CHANGED_KEY.format(name): an_hour_ago for name in ('tip', 'user', 'cities')})
+            last_modified = self.client.get(tips_url)['Last-Modified']
+            self.assertEqual(self.client.get(tips_url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+            return lambda: self.client.get(tips_url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code
+
+        status = if_modified_since_status()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.name = 'Renamed'
+            self.user.save()
+        self.assertEqual(status(), 200)
+
+        status = if_modified_since_status()
+        with self.captureOnCommitCallbacks(execute=True):
+            tips[0].delete()
+        self.assertEqual(status(), 200)
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = User.objects.create_user(name='Cacher', email='cacher@example.com', password='password')
+        self.experience = create_experience(self.user)
+        self.url = f'/experiences/get_experience_by_id/{self.experience.experience_id}/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_writes_invalidate_cached_responses(self):
+        response = self.client.get(self.url)
+        self.assertEqual((response['X-Cache'], response.json()['data']['number_of_ratings']), ('MISS', 0))
+        response = self.client.get(self.url)
+        self.assertEqual((response['X-Cache'], response.json()['data']['number_of_ratings']), ('HIT', 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/ratings/create_rating/', {
+                'experience_id': str(self.experience.experience_id), 'rating_value': 5, 'comment': 'Lovely',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get(self.url)
+        self.assertEqual((response['X-Cache'], response.json()['data']['number_of_ratings']), ('MISS', 1))
+
+        # Responses embed their creator's details, so user changes invalidate them too
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f'/users/update_user/{self.user.pk}/', {'name': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url)
+        self.assertEqual((response['X-Cache'], response.json()['data']['creator_info']['name']), ('MISS', 'Renamed'))
+
+class TagFilterTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(name='Tagger', email='tagger@example.com', password='password')
+        hiking, food, music = (Tag.objects.create(name=name) for name in ('hiking', 'food', 'music'))
+        self.both = create_experience(user, title='Trail picnic')
+        self.both.tags.set([hiking, food])
+        self.hiking_only = create_experience(user, title='Ridge hike')
+        self.hiking_only.tags.set([hiking, music])
+        create_experience(user, title='Untagged walk')
+
+    def test_all_mode_requires_every_tag(self):
+        experiences = Experience.objects.with_tags(['hiking', 'food', 'hiking'])
+        self.assertEqual(list(experiences), [self.both])
+
+    def test_any_mode_requires_one_tag(self):
+        experiences = Experience.objects.with_tags(['food', 'music'], match='any')
+        self.assertEqual(set(experiences), {self.both, self.hiking_only})
+
+    def test_view_rejects_unknown_tag_mode(self):
+        response = self.client.get('/experiences/get_experiences_with_filters/', {'tags': 'food', 'tag_mode': 'some'})
+        self.assertEqual(response.status_code, 400)
+
+class SearchTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        user = User.objects.create_user(name='Searcher', email='searcher@example.com', password='password')
+        create_experience(user, title='Harbor kayaking', description='Paddle around the harbor islands')
+        create_experience(user, title='Museum night', description='Late opening at the art museum')
+
+    def search(self, **params):
+        return self.client.get('/experiences/get_experiences_with_filters/', params)
+
+    def test_matches_are_returned_in_plain_and_prefix_mode(self):
+        for params in ({'search_query': 'kayaking'}, {'search_query': 'kay', 'search_prefix': 'true'}):
+            response = self.search(**params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([row['title'] for row in response.json()['data']], ['Harbor kayaking'])
+
+    def test_text_without_terms_returns_no_matches(self):
+        for text in (' ', '!!!'):
+            for prefix in ('false', 'true'):
+                with self.subTest(text=text, prefix=prefix):
+                    response = self.search(search_query=text, search_prefix=prefix)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.json()['data'], [])
+
+class FastSerializationParityTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = User.objects.create_user(name='Writer', email='writer@example.com', password='password')
+        experience = create_experience(self.user, price='free')
+        experience.tags.set([Tag.objects.create(name='outdoors')])
+        create_experience(self.user, title='Museum visit')
+        Rating.objects.create(experience=experience, user=self.user, rating_value=5, comment='Great')
+        Tip.objects.create(content='Bring water', creator=self.user)
+
+    def assertParity(self, serializer_class, queryset):
+        projection = get_projection(serializer_class)
+        fast = json.loads(FastJsonResponse(projection.render(projection.fetch(queryset))).content)
+        slow = json.loads(JsonResponse(serializer_class(queryset, many=True).data, safe=False).content)
+        self.assertEqual(fast, slow)
+
+    def test_projections_match_serializers(self):
+        self.assertParity(ExperienceSerializer, Experience.objects.order_by('title'))
+        # The grid key is internal, and not even fetched
+        self.assertNotIn('location__grid_key', get_projection(ExperienceSerializer).columns)
+        self.assertNotIn('experience__location__grid_key', get_projection(RatingSerializer).columns)
+        self.assertParity(RatingSerializer, Rating.objects.all())
+        self.assertParity(TipSerializer, Tip.objects.all())
+
+    def test_nested_many_to_many_fields_are_rejected(self):
+        class TagExperiencesSerializer(serializers.ModelSerializer):
+            experiences = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+            class Meta:
+                model = Tag
+                fields = ['name', 'experiences']
+
+        class ExperienceTagsSerializer(serializers.ModelSerializer):
+            tags = TagExperiencesSerializer(many=True, read_only=True)
+
+            class Meta:
+                model = Experience
+                fields = ['title', 'tags']
+
+        with self.assertRaisesMessage(TypeError, 'ExperienceTagsSerializer.tags nests many-to-many fields'):
+            get_projection(ExperienceTagsSerializer)
+
+    def test_list_endpoint_matches_serializer_path(self):
+        fast = self.client.get('/experiences/get_experiences/', {'page_size': 1}).json()
+        get_response_cache().clear()
+        with self.settings(FAST_SERIALIZATION=False):
+            slow = self.client.get('/experiences/get_experiences/', {'page_size': 1}).json()
+        self.assertEqual(fast, slow)
+        self.assertIsNotNone(fast['next_cursor'])
+        self.assertNotIn('grid_key', fast['data'][0]['location_info'])
+
+    async def test_async_views_match_under_asgi(self):
+        url = f'/experiences/get_experiences_by_user_id/{self.user.pk}/'
+        wsgi = await sync_to_async(self.client.get)(url)
+        asgi = await self.async_client.get(url)
+        self.assertEqual(asgi.json(), wsgi.json())
+
+        response = await self.async_client.get('/experiences/export_experiences/')
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        titles = sorted(json.loads(line)['title'] for line in content.splitlines())
+        self.assertEqual(titles, ['Harbor walk', 'Museum visit'])
+
+class ExportTests(TestCase):
+    def test_export_streams_one_serialized_experience_per_line(self):
+        user = User.objects.create_user(name='Exporter', email='exporter@example.com', password='password')
+        experiences = [create_experience(user, title=f'Experience {number}') for number in range(5)]
+        experiences[0].tags.set([Tag.objects.create(name='outdoors')])
+
+        with self.settings(EXPORT_CHUNK_SIZE=2):
+            response = self.client.get('/experiences/export_experiences/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        expected = ExperienceSerializer(Experience.objects.order_by('experience_id'), many=True).data
+        self.assertEqual(lines, json.loads(JsonResponse(expected, safe=False).content))
+
+class BenchmarkBudgetTests(TestCase):
+    # Read endpoints that need no cities, which the test database does not have
+    ENDPOINTS = [
+        'get_experiences', 'get_experiences_with_filters', 'get_experience_by_id', 'get_experiences_by_user_id',
+        'export_experiences', 'get_tags', 'get_user_by_id', 'get_experience_ratings', 'get_user_wishlists',
+        'get_wishlist_items', 'get_tips_by_user_id',
+    ]
+
+    def test_read_endpoints_stay_within_query_budgets(self):
+        call_command(
+            'seed_synthetic_data', users=5, experiences=30, tags=5, ratings=60, tips=10, wishlists=5,
+            items_per_wishlist=3, stdout=StringIO(),
+        )
+        output = StringIO()
+        call_command('run_benchmarks', iterations=2, warmup=1, endpoints=','.join(self.ENDPOINTS), stdout=output)
+        self.assertIn('Every endpoint is within its query budget.', output.getvalue())
+
+class RequestMetricsTests(TestCase):
+    def test_server_timing_counts_queries_and_metrics_expose_histograms(self):
+        get_response_cache().clear()
+        Tag.objects.create(name='outdoors')
+        response = self.client.get('/tags/get_tags/')
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+        metrics = self.client.get('/metrics').content.decode('utf-8')
+        self.assertIn('wayfinder_request_sql_queries_bucket{le="1.0",url_name="get_tags"}', metrics)
+        self.assertIn('wayfinder_response_cache_misses_total{view="get_tags"}', metrics)
+
+    def test_metrics_require_the_configured_token(self):
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        # Without a token, the metrics are only open outside production
+        with self.settings(METRICS_TOKEN=None, METRICS_OPEN_WITHOUT_TOKEN=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(name='Traveler', email='traveler@example.com', password='password')
+        Wishlist.objects.create(user=self.user, title='Summer trip')
+        self.url = f'/wishlists/get_user_wishlists/{self.user.pk}'
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, **self.auth)
+        return response, [query for query in queries if 'FROM "wayfinder_user"' in query['sql']]
+
+    def test_user_is_loaded_once_until_saved(self):
+        response, loads = self.user_queries()
+        self.assertEqual((response.status_code, len(loads)), (200, 1))
+        response, loads = self.user_queries()
+        self.assertEqual((response.status_code, len(loads)), (200, 0))
+
+        self.user.is_active = False
+        self.user.save()
+        response, loads = self.user_queries()
+        self.assertEqual((response.status_code, len(loads)), (401, 1))
+
+class RefreshTokenDenylistTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(name='Traveler', email='traveler@example.com', password='password')
+
+    def test_rotated_and_logged_out_tokens_are_rejected(self):
+        for denylist in ('database', 'cache'):
+            with self.subTest(denylist=denylist), self.settings(REFRESH_TOKEN_DENYLIST=denylist):
+                refresh = str(RefreshToken.for_user(self.user))
+                response = self.client.post('/auth/token/refresh/', {'refresh': refresh})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.client.post('/auth/token/refresh/', {'refresh': refresh}).status_code, 401)
+
+                refresh = str(RefreshToken.for_user(self.user))
+                self.assertEqual(self.client.post('/auth/logout/', {'refresh': refresh}).status_code, 200)
+                self.assertEqual(self.client.post('/auth/token/refresh/', {'refresh': refresh}).status_code, 401)
+
+    def test_prune_tokens_deletes_expired_tokens_in_batches(self):
+        now = timezone.now()
+        for number, expires_at in enumerate([now - timedelta(days=2), now - timedelta(days=1), now + timedelta(days=1)]):
+            token = OutstandingToken.objects.create(user=self.user, jti=f'jti-{number}', token='token', expires_at=expires_at)
+            BlacklistedToken.objects.create(token=token)
+
+        call_command('prune_tokens', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['jti-2'])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        # Store uploads in a temporary directory instead of S3
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        storages = {**settings.STORAGES, 'default': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': media_root, 'base_url': '/media/'},
+        }}
+        storage_settings = self.settings(STORAGES=storages)
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+        self.user = User.objects.create_user(name='Photographer', email='photographer@example.com', password='password')
+
+    def upload(self, size=(2000, 1500)):
+        exif = Image.Exif()
+        exif[0x8825] = {2: (42.0, 21.0, 0.0)}  # GPS latitude
+        buffer = BytesIO()
+        Image.new('RGB', size, (200, 120, 40)).save(buffer, format='JPEG', exif=exif)
+        return SimpleUploadedFile('walk.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_new_image_gets_resized_variants_without_metadata(self):
+        experience = create_experience(self.user, image=self.upload())
+        experience.refresh_from_db()
+        variants = experience.image_variants
+        self.assertEqual((variants['source'], variants['width'], variants['height']), (experience.image.name, 2000, 1500))
+        self.assertEqual((variants['thumbnail']['width'], variants['thumbnail']['height']), (320, 240))
+        self.assertEqual((variants['card']['width'], variants['card']['height']), (853, 640))
+
+        for extension, image_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+            with default_storage.open(variants['card'][extension]) as file:
+                image = Image.open(file)
+                self.assertEqual((image.format, image.size), (image_format, (853, 640)))
+                self.assertEqual(len(image.getexif()), 0)
+
+        data = ExperienceSerializer(experience).data['image_variants']
+        self.assertEqual(data['thumbnail']['webp'], default_storage.url(variants['thumbnail']['webp']))
+        self.assertNotIn('source', data)
+
+    def test_replaced_profile_picture_is_processed_again(self):
+        self.user.profile_picture = self.upload()
+        self.user.save()
+        self.user.profile_picture = self.upload(size=(600, 900))
+        self.user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile_picture_variants['source'], self.user.profile_picture.name)
+        self.assertEqual(self.user.profile_picture_variants['thumbnail']['height'], 320)
+
+@mock_aws
+class DirectUploadTests(TestCase):
+    def setUp(self):
+        # moto stands in for S3, for the storage as well as the client's upload
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='wayfinder-test')
+        storages = {**settings.STORAGES, 'default': {
+            'BACKEND': 'storages.backends.s3.S3Storage',
+            'OPTIONS': {'bucket_name': 'wayfinder-test', 'region_name': 'us-east-1', 'access_key': 'test',
+                        'secret_key': 'test'},
+        }}
+        storage_settings = self.settings(STORAGES=storages)
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+        self.user = User.objects.create_user(name='Uploader', email='uploader@example.com', password='password')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def presign(self, target='experience_image', content_type='image/jpeg'):
+        response = self.client.post('/uploads/create_upload/', {'target': target, 'content_type': content_type}, **self.auth)
+        return response.status_code, response.json().get('data')
+
+    def upload(self, upload, content):
+        return requests.post(upload['url'], data=upload['fields'], files={'file': ('photo.jpg', content)})
+
+    def test_uploaded_image_is_attached_to_experience(self):
+        experience = create_experience(self.user)
+        status, upload = self.presign()
+        self.assertEqual(status, 201)
+        confirm = {'upload_token': upload['upload_token'], 'experience_id': str(experience.pk)}
+        self.assertEqual(self.client.post('/uploads/confirm_upload/', confirm, **self.auth).status_code, 400)
+
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), (20, 90, 160)).save(buffer, format='JPEG')
+        self.assertEqual(self.upload(upload, buffer.getvalue()).status_code, 204)
+        malformed = {**confirm, 'experience_id': 'not-a-uuid'}
+        self.assertEqual(self.client.post('/uploads/confirm_upload/', malformed, **self.auth).status_code, 400)
+        response = self.client.post('/uploads/confirm_upload/', confirm, **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+        experience.refresh_from_db()
+        self.assertEqual(experience.image.name, upload['fields']['key'])
+        self.assertEqual(experience.image_variants['thumbnail']['height'], 240)
+
+    def test_presigned_post_enforces_content_type_and_token_owner(self):
+        self.assertEqual(self.presign(content_type='image/gif')[0], 400)
+        status, upload = self.presign(target='profile_picture')
+        # S3 rejects uploads that break the signed policy (moto does not check it)
+        policy = json.loads(base64.b64decode(upload['fields']['policy']))
+        self.assertIn({'Content-Type': 'image/jpeg'}, policy['conditions'])
+        self.assertIn(['content-length-range', 1, settings.UPLOAD_MAX_BYTES], policy['conditions'])
+
+        other = User.objects.create_user(name='Other', email='other@example.com', password='password')
+        response = self.client.post(
+            '/uploads/confirm_upload/', {'upload_token': upload['upload_token']},
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(other)}',
+        )
+        self.assertEqual(response.status_code, 403)
+
+@task(max_attempts=2)
+def failing_task():
+    raise ValueError('Task failed')
+
+@override_settings(TASKS_RUN_INLINE=False)
+class TaskQueueTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(name='Rater', email='rater@example.com', password='password')
+        self.experience = create_experience(self.user, number_of_ratings=1, rating_sum=3, average_rating=3.0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_rating_aggregates_are_updated_by_the_worker(self):
+        response = self.client.post('/ratings/create_rating/', {
+            'experience_id': str(self.experience.experience_id), 'rating_value': 5, 'comment': 'Great',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        # The response already counts the rating, the database once the task has run
+        self.assertEqual(response.json()['data']['experience_info']['number_of_ratings'], 2)
+        self.experience.refresh_from_db()
+        self.assertEqual(self.experience.number_of_ratings, 1)
+
+        self.assertIsNone(run_next().pk)
+        self.assertIsNone(run_next())
+        self.experience.refresh_from_db()
+        self.assertEqual((self.experience.number_of_ratings, self.experience.rating_sum), (2, 8))
+        self.assertAlmostEqual(self.experience.average_rating, 4.0)
+        self.assertFalse(Task.objects.exists())
+
+    def test_failed_tasks_are_retried_with_backoff(self):
+        failing_task.enqueue()
+        with self.assertLogs('wayfinder.task_queue', 'WARNING'):
+            first = run_next()
+        self.assertEqual((first.status, first.attempts), (Task.STATUS_QUEUED, 1))
+        self.assertIn('Task failed', first.last_error)
+        self.assertGreater(first.run_at, timezone.now())
+        # Not due until the backoff has passed
+        self.assertIsNone(run_next())
+
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('wayfinder.task_queue', 'ERROR'):
+            second = run_next()
+        self.assertEqual((second.status, second.attempts), (Task.STATUS_FAILED, 2))
+        self.assertIsNone(run_next())
+
+    def test_workers_skip_tasks_locked_by_other_workers(self):
+        locked = failing_task.enqueue()
+        Task.objects.filter(pk=locked.pk).update(run_at=timezone.now() - timedelta(minutes=1))
+        other = failing_task.enqueue()
+        claimed = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            with transaction.atomic():
+                Task.objects.select_for_update().get(pk=locked.pk)
+                claimed.set()
+                release.wait(5)
+            connection.close()
+
+        worker = threading.Thread(target=hold_lock)
+        worker.start()
+        claimed.wait(5)
+        try:
+            with self.assertLogs('wayfinder.task_queue', 'WARNING'):
+                self.assertEqual(run_next().pk, other.pk)
+            self.assertIsNone(run_next())
+        finally:
+            release.set()
+            worker.join()
+
+class ExperienceImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(name='Partner', email='partner@example.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Tag.objects.create(name='food')
+        self.existing, _ = Location.objects.upsert(42.35, -71.06)
+
+    def test_json_import_dedupes_locations_and_reports_row_errors(self):
+        rows = [
+            {'title': 'Harbor walk', 'description': 'Walk', 'latitude': 42.35, 'longitude': -71.06, 'tags': ['food']},
+            {'title': 'Market tour', 'description': 'Tour', 'latitude': 40.0, 'longitude': -70.0, 'price': 'free'},
+            {'title': 'Second tour', 'description': 'Tour', 'latitude': '40.0', 'longitude': '-70.0'},
+            {'title': 'No coordinates', 'description': 'Missing'},
+            {'title': 'Unknown tag', 'description': 'Tagged', 'latitude': 1, 'longitude': 1, 'tags': ['nightlife']},
+        ]
+        response = self.client.post('/experiences/import_experiences/', {'experiences': rows}, format='json')
+        self.assertEqual(response.status_code, 200)
+        result = response.json()['data']
+        self.assertEqual((result['rows'], result['created'], result['locations_created']), (5, 3, 1))
+        self.assertEqual([error['row'] for error in result['errors']], [4, 5])
+
+        harbor = Experience.objects.get(title='Harbor walk')
+        self.assertEqual(harbor.location, self.existing)
+        self.assertEqual(list(harbor.tags.values_list('name', flat=True)), ['food'])
+        tours = Experience.objects.filter(title__endswith='tour')
+        self.assertEqual(len({experience.location_id for experience in tours}), 1)
+        # The search trigger runs for bulk inserts too
+        self.assertEqual(list(Experience.objects.search('market').values_list('title', flat=True)), ['Market tour'])
+
+    def test_csv_upload_is_imported_in_batches(self):
+        content = 'title,description,latitude,longitude,tags,price\n' + ''.join(
+            f'Walk {number},A walk,{40 + number / 100},-70,food,cheap\n' for number in range(5)
+        ) + 'Bad price,A walk,40,-70,,pricey\n'
+        upload = SimpleUploadedFile('partner.csv', content.encode(), content_type='text/csv')
+        with self.settings(IMPORT_BATCH_SIZE=2):
+            response = self.client.post('/experiences/import_experiences/', {'file': upload}, format='multipart')
+        result = response.json()['data']
+        self.assertEqual((result['created'], result['errors'][0]['row']), (5, 6))
+        self.assertEqual(Experience.tags.through.objects.count(), 5)
+
+    def test_import_rejects_unreadable_files(self):
+        upload = SimpleUploadedFile('partner.json', b'[{"title": ', content_type='application/json')
+        response = self.client.post('/experiences/import_experiences/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Experience.objects.exists())
+
+
+class LocationResolutionTests(TestCase):
+    def setUp(self):
+        self.addCleanup(mark_reference_data_changed)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.brazil = Country.objects.create(name='Brazil', code2='BR', code3='BRA', alternate_names='Brasil')
+            self.sao_paulo_state = Region.objects.create(name='São Paulo', country=self.brazil)
+            self.sao_paulo = City.objects.create(
+                name='São Paulo', region=self.sao_paulo_state, country=self.brazil, population=12000000,
+                alternate_names='Sampa', latitude=-23.55, longitude=-46.63,
+            )
+        self.user = User.objects.create_user(name='Traveler', email='traveler@example.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_names_resolve_ignoring_case_accents_and_alternate_names(self):
+        expected = (self.brazil.id, self.sao_paulo_state.id, self.sao_paulo.id)
+        self.assertEqual(tuple(resolve_location_names('brasil', 'SAO PAULO', 'sampa')), expected)
+        # Names are matched within their parents, and as substrings when nothing matches exactly
+        self.assertEqual(tuple(resolve_location_names('Braz', None, 'paulo')), (self.brazil.id, None, self.sao_paulo.id))
+        self.assertEqual(tuple(resolve_location_names(None, None, 'São Paulo')), (None, None, None))
+
+    def test_write_paths_resolve_locations_without_reference_queries(self):
+        resolve_location_names('Brazil')  # Build the index
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/experiences/create_experience/', {
+                'title': 'Paulista walk', 'description': 'A walk', 'latitude': -23.56, 'longitude': -46.65,
+                'country_name': 'Brazil', 'region_name': 'Sao Paulo', 'city_name': 'Sao Paulo',
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse([query for query in queries.captured_queries if 'cities_light' in query['sql']])
+        location = Experience.objects.get().location
+        self.assertEqual((location.country_id, location.region_id, location.city_id),
+                         (self.brazil.id, self.sao_paulo_state.id, self.sao_paulo.id))
+
+        response = self.client.post('/tips/create_tip/', {
+            'content': 'Try the pastel', 'location_type': 'city', 'location_id': self.sao_paulo.id,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((Tip.objects.get().country_id, Tip.objects.get().city_id), (self.brazil.id, self.sao_paulo.id))
+        response = self.client.post('/tips/create_tip/', {
+            'content': 'Nowhere', 'location_type': 'city', 'location_id': 'unknown',
+        }, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class CitySearchIndexTests(TestCase):
+    def test_short_queries_match_prefixes_and_longer_queries_match_substrings(self):
+        index = NameIndex(
+            ['Santos', 'Salvador', 'São Paulo', 'Abcxbcd'],
+            [['Santos'], ['Salvador'], ['São Paulo', 'Sampa'], ['Abcxbcd']],
+            [400000, 2500000, 12000000, 1],
+        )
+        # Prefixes of any name, ignoring accents, most populous first
+        self.assertEqual(index.search('sa', limit=10), ['São Paulo', 'Salvador', 'Santos'])
+        self.assertEqual(index.search('sa', limit=1), ['São Paulo'])
+        # Substrings, with names that start with the query first
+        self.assertEqual(index.search('paulo', limit=10), ['São Paulo'])
+        self.assertEqual(index.search('ntos', limit=10), ['Santos'])
+        self.assertEqual(index.search('sal', limit=10), ['Salvador'])
+        # Short queries fall back to substrings when too few names start with them
+        self.assertEqual(index.search('ul', limit=10), ['São Paulo'])
+        self.assertEqual(index.search('o', limit=10), ['São Paulo', 'Salvador', 'Santos'])
+        self.assertEqual(index.search('s', limit=2), ['São Paulo', 'Salvador'])
+        # Every trigram of "abcd" is in "abcxbcd", but the name does not contain it
+        self.assertEqual(index.search('abcd', limit=10), [])
+        self.assertEqual(index.search('', limit=2), ['São Paulo', 'Salvador'])
+
+    def test_index_is_rebuilt_once_reference_data_changes_are_committed(self):
+        self.addCleanup(mark_reference_data_changed)
+        with self.captureOnCommitCallbacks(execute=True):
+            portugal = Country.objects.create(name='Portugal', code2='PT', code3='PRT')
+        self.assertEqual(city_search_index.search_cities('porto'), [])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            City.objects.create(name='Porto', country=portugal, population=230000, latitude=41.15, longitude=-8.61)
+        self.assertEqual(city_search_index.search_cities('porto'), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual([city['name'] for city in city_search_index.search_cities('porto')], ['Porto'])
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    """
+    Great-circle distance between two coordinates, computed directly for comparison with the indexes.
+    """
+    lat1, lat2 = math.radians(latitude1), math.radians(latitude2)
+    half_lat = (lat2 - lat1) / 2
+    half_lng = math.radians(longitude2 - longitude1) / 2
+    a = math.sin(half_lat) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(half_lng) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class NearestCityTests(TestCase):
+    def setUp(self):
+        self.addCleanup(mark_reference_data_changed)
+        with self.captureOnCommitCallbacks(execute=True):
+            country = Country.objects.create(name='Testland', code2='TL', code3='TLD')
+            self.cities = {
+                name: City.objects.create(name=name, country=country, latitude=latitude, longitude=longitude)
+                for name, latitude, longitude in [
+                    ('Suva', -18.14, 178.44), ('Eastern isle', -16.5, -179.9), ('Longyearbyen', 78.22, 15.65),
+                    ('McMurdo', -77.85, 166.67), ('Boston', 42.36, -71.06),
+                ]
+            }
+
+    def test_kd_tree_matches_brute_force_search(self):
+        rng = random.Random(7)
+        # Include points crowding the antimeridian and the poles, where longitudes wrap or converge
+        coordinates = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(200)]
+        coordinates += [(rng.uniform(-60, 60), rng.choice([-1, 1]) * rng.uniform(179, 180)) for _ in range(50)]
+        coordinates += [(rng.choice([-1, 1]) * rng.uniform(88, 90), rng.uniform(-180, 180)) for _ in range(50)]
+        tree = KDTree(list(range(len(coordinates))), [to_unit_vector(*point) for point in coordinates])
+
+        queries = coordinates[:20] + [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(200)]
+        queries += [(0.0, 180.0), (0.0, -180.0), (10.0, 179.99), (-10.0, -179.99), (90.0, 0.0), (-90.0, 45.0)]
+        for latitude, longitude in queries:
+            position, squared_chord = tree.nearest(to_unit_vector(latitude, longitude))
+            expected = min(haversine_km(latitude, longitude, *point) for point in coordinates)
+            self.assertAlmostEqual(haversine_km(latitude, longitude, *coordinates[position]), expected, places=6)
+            self.assertAlmostEqual(chord_to_km(squared_chord), expected, places=6)
+
+    def test_empty_index_finds_nothing(self):
+        self.assertEqual(KDTree([], []).nearest(to_unit_vector(0.0, 0.0)), (None, math.inf))
+        with self.captureOnCommitCallbacks(execute=True):
+            City.objects.all().delete()
+        self.assertIsNone(find_nearest_city(42.0, -71.0))
+        self.assertEqual(find_nearest_cities([(42.0, -71.0), (0.0, 0.0)]), [None, None])
+
+    def test_nearest_cities_across_the_antimeridian_and_poles(self):
+        # Suva is closer by longitude difference, but the eastern isle is closer across the antimeridian
+        self.assertEqual(find_nearest_city(-16.5, 179.95), self.cities['Eastern isle'])
+        self.assertEqual(find_nearest_city(89.9, -170.0, max_distance_km=2000), self.cities['Longyearbyen'])
+        self.assertEqual(find_nearest_city(-89.9, 10.0, max_distance_km=2000), self.cities['McMurdo'])
+        self.assertIsNone(find_nearest_city(0.0, 0.0, max_distance_km=100))
+        self.assertEqual(
+            find_nearest_cities([(42.0, -71.0), (0.0, 0.0), (-18.0, 178.5)], max_distance_km=500),
+            [self.cities['Boston'], None, self.cities['Suva']],
+        )
+
+class LocationDeduplicationTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(name='Mapper', email='mapper@example.com', password='password')
+
+    def test_concurrent_upserts_create_one_location(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def upsert(offset):
+            barrier.wait()
+            # Within a meter of each other, so on the same point of the grid
+            results.append(Location.objects.upsert(42.35 + offset / 10 ** 7, -71.06))
+            connection.close()
+
+        threads = [threading.Thread(target=upsert, args=(offset,)) for offset in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(Location.objects.count(), 1)
+        self.assertEqual({location.pk for location, _ in results}, {Location.objects.get().pk})
+        self.assertEqual([created for _, created in results].count(True), 1)
+
+    def test_merge_locations_moves_experiences_to_one_location(self):
+        kept, _ = Location.objects.upsert(42.35, -71.06)
+        duplicates = [
+            Location.objects.create(latitude=42.350001, longitude=-71.060001),
+            Location.objects.create(latitude=42.35, longitude=-71.06),
+        ]
+        first = Location.objects.create(latitude=40.0, longitude=-70.0)
+        second = Location.objects.create(latitude=40.000004, longitude=-70.0)
+        for location in [kept, first, second] + duplicates:
+            Experience.objects.create(title='Walk', description='A walk', location=location, creator=self.user)
+
+        output = StringIO()
+        call_command('merge_locations', batch_size=2, stdout=output)
+        self.assertIn('Keyed 1 locations and merged 3 duplicates.', output.getvalue())
+        self.assertEqual(Location.objects.count(), 2)
+        self.assertEqual(Experience.objects.filter(location=kept).count(), 3)
+        self.assertEqual(Location.objects.get(grid_key='40.00000,-70.00000').experiences.count(), 2)
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN the queries of the list endpoints against seeded data and fail when one reads a whole table or sorts all
+    matching rows to return a page. Test tables are small enough that the planner would rather scan and sort them than use an index, so
+    sequential scans and sorts are disabled while planning: the planner then only picks one when no index serves the
+    query.
+    """
+
+    def setUp(self):
+        get_response_cache().clear()
+        self.addCleanup(mark_reference_data_changed)
+        self.user = User.objects.create_user(name='Planner', email='planner@example.com', password='password')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.country = Country.objects.create(name='Portugal', code2='PT', code3='PRT')
+            self.city = City.objects.create(name='Lisbon', country=self.country, latitude=38.72, longitude=-9.14)
+        self.experiences = [create_experience(self.user, title=f'Experience {number}') for number in range(5)]
+        for experience in self.experiences:
+            Rating.objects.create(experience=experience, user=self.user, rating_value=4, comment='Good')
+        Tip.objects.create(content='Take the tram', country=self.country, city=self.city, creator=self.user)
+        Tip.objects.create(content='Bring a jacket', creator=self.user)
+        self.wishlist = Wishlist.objects.create(user=self.user, title='Lisbon')
+        WishlistItem.objects.create(wishlist=self.wishlist, experience=self.experiences[0])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def plan_problems(self, sql):
+        """
+        Get the sequential scans and top-N sorts in the plan of a query, e.g. ["Seq Scan on wayfinder_tip"].
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            cursor.execute('SET enable_sort = off')
+            try:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0][0]['Plan']
+            finally:
+                cursor.execute('RESET enable_seqscan')
+                cursor.execute('RESET enable_sort')
+
+        # Sorts are only a problem under a LIMIT: a page sorted from every matching row instead of read in order
+        problems, nodes = [], [(plan, False)]
+        while nodes:
+            node, limited = nodes.pop()
+            if node['Node Type'] == 'Seq Scan':
+                problems.append(f'Seq Scan on {node["Relation Name"]}')
+            elif node['Node Type'] in ('Sort', 'Incremental Sort') and limited:
+                problems.append(f'{node["Node Type"]} by {", ".join(node["Sort Key"])}')
+            limited = limited or node['Node Type'] == 'Limit'
+            nodes.extend((child, limited) for child in node.get('Plans', []))
+        return problems
+
+    def assertIndexedQueries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+        self.assertLess(response.status_code, 300)
+        selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertEqual(self.plan_problems(sql), [], sql)
+        return response
+
+    def test_experience_lists_use_indexes(self):
+        response = self.assertIndexedQueries('get', '/experiences/get_experiences/', {'page_size': 2})
+        self.assertIndexedQueries('get', '/experiences/get_experiences/', {
+            'page_size': 2, 'cursor': response.json()['next_cursor'],
+        })
+        self.assertIndexedQueries('get', f'/experiences/get_experiences_by_user_id/{self.user.pk}/', {'page_size': 2})
+        self.assertIndexedQueries('get', '/experiences/get_experiences/', {'page_size': 2, 'sort': 'ranking'})
+
+    def test_rating_and_tip_lists_use_indexes(self):
+        self.assertIndexedQueries('get', f'/ratings/get_experience_ratings/{self.experiences[0].pk}/')
+        self.assertIndexedQueries('get', '/tips/get_tips_with_filters/')
+        self.assertIndexedQueries('get', '/tips/get_tips_with_filters/', {
+            'location_type': 'country', 'location_id': self.country.id,
+        })
+        self.assertIndexedQueries('get', '/tips/get_tips_with_filters/', {
+            'location_type': 'city', 'location_id': self.city.id,
+        })
+        self.assertIndexedQueries('get', f'/tips/get_tips_by_user_id/{self.user.pk}/')
+
+    def test_wishlist_items_use_indexes(self):
+        self.assertIndexedQueries('get', f'/wishlists/get_wishlist_items/{self.wishlist.pk}')
+        self.assertIndexedQueries('post', f'/wishlists/create_wishlist_item/{self.wishlist.pk}', {
+            'user_id': self.user.pk, 'experience_id': self.experiences[1].pk,
+        })
+
+class NearbyExperienceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(name='Walker', email='walker@example.com', password='password')
+        self.url = '/experiences/get_nearby_experiences/'
+
+    def create_at(self, title, latitude, longitude, **fields):
+        location = Location.objects.create(latitude=latitude, longitude=longitude)
+        return Experience.objects.create(
+            title=title, description='Nearby', location=location, creator=self.user, **fields
+        )
+
+    def titles(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [experience['title'] for experience in response.json()['data']]
+
+    def test_experiences_within_radius_are_paged_by_distance(self):
+        self.create_at('Five km', 42.395, -71.06, average_rating=5.0)
+        self.create_at('Here', 42.35, -71.06)
+        self.create_at('One km', 42.359, -71.06, price='free')
+        self.create_at('Fifty km', 42.8, -71.06)
+
+        params = {'latitude': 42.35, 'longitude': -71.06, 'radius_km': 10, 'page_size': 2}
+        response = self.client.get(self.url, params)
+        self.assertEqual(self.titles(response), ['Here', 'One km'])
+        response = self.client.get(self.url, {**params, 'cursor': response.json()['next_cursor']})
+        self.assertEqual(self.titles(response), ['Five km'])
+        self.assertIsNone(response.json()['next_cursor'])
+
+        response = self.client.get(self.url, {**params, 'sort': 'rating'})
+        self.assertEqual(self.titles(response)[0], 'Five km')
+        self.assertEqual(self.titles(self.client.get(self.url, {**params, 'price': 'free'})), ['One km'])
+
+    def test_radius_crosses_the_antimeridian(self):
+        self.create_at('East', 0.0, 179.99)
+        self.create_at('West', 0.0, -179.99)
+        response = self.client.get(self.url, {'latitude': 0, 'longitude': 179.995, 'radius_km': 5})
+        self.assertEqual(self.titles(response), ['East', 'West'])
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in ({'latitude': 42.35}, {'latitude': 91, 'longitude': 0},
+                       {'latitude': 0, 'longitude': 0, 'radius_km': 1000},
+                       {'latitude': 0, 'longitude': 0, 'sort': 'price'},
+                       {'latitude': 0, 'longitude': 0, 'price': 'priceless'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+
+class RankingScoreTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = User.objects.create_user(name='Ranker', email='ranker@example.com', password='password')
+
+    def test_established_experiences_outrank_single_ratings(self):
+        single = create_experience(self.user, title='One five')
+        established = create_experience(self.user, title='Many good')
+        Experience.objects.record_rating(single.pk, 5)
+        for rating_value in [5, 4] * 10:
+            Experience.objects.record_rating(established.pk, rating_value)
+
+        titles = lambda params: [row['title'] for row in self.client.get('/experiences/get_experiences/', params).json()['data']]
+        self.assertEqual(titles({}), ['One five', 'Many good'])
+        self.assertEqual(titles({'sort': 'ranking'}), ['Many good', 'One five'])
+        self.assertEqual(self.client.get('/experiences/get_experiences/', {'sort': 'newest'}).status_code, 400)
+
+        # The batch recompute agrees with the scores maintained as ratings arrived
+        scores = dict(Experience.objects.values_list('pk', 'ranking_score'))
+        call_command('recompute_ranking_scores', stdout=StringIO())
+        for pk, score in Experience.objects.values_list('pk', 'ranking_score'):
+            self.assertAlmostEqual(score, scores[pk])
+
+    def test_scores_start_from_the_prior_and_halve_every_half_life(self):
+        experience = create_experience(self.user)
+        experience.refresh_from_db()
+        age = (experience.date_posted - ranking.EPOCH).total_seconds()
+        expected = math.log(ranking.PRIOR_MEAN) + math.log(2) * age / (ranking.HALF_LIFE_DAYS * 86400)
+        self.assertAlmostEqual(experience.ranking_score, expected, places=4)
+
+        Experience.objects.filter(pk=experience.pk).update(
+            date_posted=experience.date_posted - timedelta(days=ranking.HALF_LIFE_DAYS)
+        )
+        Experience.objects.all().recompute_ranking_scores()
+        experience_score = Experience.objects.get(pk=experience.pk).ranking_score
+        self.assertAlmostEqual(experience_score, expected - math.log(2), places=4)
\ No newline at end of file
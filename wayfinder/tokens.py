@@ -0,0 +1,74 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the refresh token used by the token refresh endpoint. Refresh tokens are rotated and
+the old token is blacklisted on every refresh. By default the blacklist is simplejwt's token blacklist tables, which
+the `prune_tokens` command keeps from growing. With REFRESH_TOKEN_DENYLIST = "cache", rotated tokens are instead
+kept in a denylist in the cache, keyed by JTI and expiring with the token, so a refresh runs no token queries.
+The cache must not evict entries early (e.g. Redis without an eviction policy), or rotated tokens become reusable.
+"""
+
+import math
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from dj_rest_auth.jwt_auth import CookieTokenRefreshSerializer
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow, datetime_from_epoch
+
+DENYLIST_KEY = 'wayfinder:denied-token:{}'
+
+def get_denylist_cache():
+    """
+    Get the cache backend of the token denylist, the default cache unless TOKEN_DENYLIST_CACHE_ALIAS is set.
+    """
+    return caches[getattr(settings, 'TOKEN_DENYLIST_CACHE_ALIAS', 'default')]
+
+def uses_cache_denylist():
+    return getattr(settings, 'REFRESH_TOKEN_DENYLIST', 'database') == 'cache'
+
+def deny_token(jti, expires_at):
+    """
+    Add a token to the cache denylist until it expires, after which it is rejected anyway.
+
+    Parameters:
+        jti (str): The token's JTI claim
+        expires_at (datetime): When the token expires
+    """
+    timeout = (expires_at - aware_utcnow()).total_seconds()
+    if timeout > 0:
+        get_denylist_cache().set(DENYLIST_KEY.format(jti), True, math.ceil(timeout))
+
+def is_token_denied(jti):
+    return get_denylist_cache().get(DENYLIST_KEY.format(jti), False)
+
+class DenylistRefreshToken(RefreshToken):
+    """
+    Refresh token that is checked against and blacklisted into the cache denylist when REFRESH_TOKEN_DENYLIST is
+    "cache", and the token blacklist tables otherwise. In cache mode, rotated tokens are not stored as outstanding
+    tokens either, only the tokens issued at login are.
+    """
+
+    def check_blacklist(self):
+        if not uses_cache_denylist():
+            return super().check_blacklist()
+        if is_token_denied(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        if not uses_cache_denylist():
+            return super().blacklist()
+        deny_token(self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self.payload['exp']))
+
+    def outstand(self):
+        if not uses_cache_denylist():
+            return super().outstand()
+
+class DenylistTokenRefreshSerializer(CookieTokenRefreshSerializer):
+    """
+    Refresh serializer of dj-rest-auth (which reads the refresh token from the request or its cookie), rotating
+    DenylistRefreshTokens.
+    """
+    token_class = DenylistRefreshToken
@@ -0,0 +1,80 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module implements direct uploads of images to S3, so image bytes never pass through the web
+workers. The client asks for a presigned POST for an upload target, sends the file straight to S3 with it, and then
+confirms the upload with the signed token it was given, which attaches the new object to the experience or user.
+The presigned POST pins the object key and content type and caps the file size, and the token ties the key to the
+user who requested it.
+"""
+
+import mimetypes
+import uuid
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from storages.backends.s3 import S3Storage
+from wayfinder.models import Experience, User
+
+TOKEN_SALT = 'wayfinder.uploads'
+
+# Upload targets, with the model and image field the uploaded object is attached to
+UPLOAD_TARGETS = {
+    'experience_image': (Experience, 'image'),
+    'profile_picture': (User, 'profile_picture'),
+}
+
+# Content types that can be uploaded, which the image variants can be generated from
+ALLOWED_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/webp')
+
+def direct_uploads_enabled():
+    """
+    Check whether files are stored in S3, which direct uploads need.
+    """
+    return isinstance(default_storage, S3Storage)
+
+def create_presigned_upload(user, target, content_type):
+    """
+    Generate a new object key for an upload target and a presigned POST to upload the file to it.
+
+    Parameters:
+        user (User): The user uploading the file
+        target (str): One of UPLOAD_TARGETS
+        content_type (str): One of ALLOWED_CONTENT_TYPES
+
+    Returns:
+        dict: The URL and form fields to POST the file with, and the token to confirm the upload with
+    """
+    model, field_name = UPLOAD_TARGETS[target]
+    extension = mimetypes.guess_extension(content_type) or ''
+    name = model._meta.get_field(field_name).generate_filename(None, f'{uuid.uuid4().hex}{extension}')
+
+    fields = {'Content-Type': content_type}
+    cache_control = default_storage.object_parameters.get('CacheControl')
+    if cache_control:
+        fields['Cache-Control'] = cache_control
+    expiry = getattr(settings, 'UPLOAD_URL_EXPIRY', 600)
+    post = default_storage.connection.meta.client.generate_presigned_post(
+        Bucket=default_storage.bucket_name,
+        Key=default_storage._normalize_name(name),
+        Fields=fields,
+        Conditions=[{key: value} for key, value in fields.items()] + [
+            ['content-length-range', 1, getattr(settings, 'UPLOAD_MAX_BYTES', 15 * 1024 * 1024)],
+        ],
+        ExpiresIn=expiry,
+    )
+    token = signing.dumps({'user': str(user.pk), 'target': target, 'name': name}, salt=TOKEN_SALT)
+    return {'url': post['url'], 'fields': post['fields'], 'upload_token': token, 'expires_in': expiry}
+
+def load_upload_token(token):
+    """
+    Read a token from create_presigned_upload, which stays valid for a few minutes after its upload URL expires.
+
+    Returns:
+        dict: The "user" ID, upload "target" and object "name"
+
+    Raises:
+        signing.BadSignature: When the token was tampered with or has expired
+    """
+    max_age = getattr(settings, 'UPLOAD_URL_EXPIRY', 600) + 300
+    return signing.loads(token, salt=TOKEN_SALT, max_age=max_age)
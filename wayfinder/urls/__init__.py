@@ -4,7 +4,8 @@ Email: mch2003@bu.edu
 Description: This module serves as the main entry point for defining URL routes in the application. 
 It consolidates URLs from separate modules, such as `auth_urls`, `experience_urls`, and others, 
 into a single list for better organization and scalability. The `urlpatterns` includes routes for 
-admin, authentication, experiences, locations, tags, users, ratings, wishlists, and tips.
+admin, authentication, experiences, locations, tags, users, ratings, wishlists, tips, direct uploads, the
+response cache and the Prometheus metrics.
 """
 
 from django.conf import settings
@@ -21,6 +22,9 @@ from .user_urls import urlpatterns as user_urls
 from .rating_urls import urlpatterns as rating_urls
 from .wishlist_urls import urlpatterns as wishlist_urls
 from .tips_urls import urlpatterns as tips_urls
+from .upload_urls import urlpatterns as upload_urls
+from .cache_urls import urlpatterns as cache_urls
+from .metrics_urls import urlpatterns as metrics_urls
 
 # All URL routes are defined here
 urlpatterns = [
@@ -33,4 +37,7 @@ urlpatterns = [
     path('ratings/', include(rating_urls)),
     path('wishlists/', include(wishlist_urls)),
     path('tips/', include(tips_urls)),
+    path('uploads/', include(upload_urls)),
+    path('cache/', include(cache_urls)),
+    path('metrics', include(metrics_urls)),
 ]
@@ -0,0 +1,16 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines URL routes for response cache operations, 
+including retrieving the cache hit and miss counters. These routes map to the 
+corresponding views in the `cache_views` module.
+"""
+
+from django.urls import path
+from wayfinder.views import cache_views
+
+# URL routes for calls relating to the response cache
+urlpatterns = [
+    # GET Requests
+    path('get_cache_stats/', cache_views.get_cache_stats_view, name='get_cache_stats'),
+]
@@ -0,0 +1,15 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines the URL route of the Prometheus metrics endpoint, which maps to the `get_metrics`
+view in the `metrics_views` module.
+"""
+
+from django.urls import path
+from wayfinder.views import metrics_views
+
+# URL routes for calls relating to request metrics
+urlpatterns = [
+    # GET Requests
+    path('', metrics_views.get_metrics, name='get_metrics'),
+]
@@ -2,8 +2,8 @@
 Author: Matthew Hilliard
 Email: mch2003@bu.edu
 Description: This module defines URL routes for tip-related operations, 
-including creating tips, retrieving tips with filters, and retrieving tips 
-created by a specific user. These routes map to the corresponding views in 
+including creating tips, retrieving tips with filters, retrieving tips 
+created by a specific user, and exporting tips with filters. These routes map to the corresponding views in 
 the `tip_views` module.
 """
 
@@ -18,4 +18,5 @@ urlpatterns = [
     # GET Requests
     path('get_tips_with_filters/', tip_views.get_tips_with_filters, name='get_tips_with_filters'),
     path('get_tips_by_user_id/<str:user_id>/', tip_views.get_tips_by_user_id, name='get_tips_by_user_id'),
+    path('export_tips/', tip_views.export_tips, name='export_tips'),
 ]
@@ -0,0 +1,17 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module defines URL routes for direct image uploads, including issuing presigned 
+upload URLs and confirming finished uploads. These routes map to the corresponding views in the 
+`upload_views` module.
+"""
+
+from django.urls import path
+from wayfinder.views import upload_views
+
+# URL routes for calls relating to uploads
+urlpatterns = [
+    # POST Requests
+    path('create_upload/', upload_views.create_upload, name='create_upload'),
+    path('confirm_upload/', upload_views.confirm_upload, name='confirm_upload'),
+]
@@ -1,9 +1,11 @@
 """
 Author: Matthew Hilliard
 Email: mch2003@bu.edu
-Description: This module defines custom views for user registration and login. The `CustomRegisterView` 
-extends the default `RegisterView` to handle duplicate email registration errors gracefully, and the 
-`CustomLoginView` modifies the default login behavior to include a refresh token in the response.
+Description: This module defines custom views for user registration, login and token refresh. The `CustomRegisterView` 
+extends the default `RegisterView` to handle duplicate email registration errors gracefully, the 
+`CustomLoginView` modifies the default login behavior to include a refresh token in the response. The 
+`CustomLogoutView` and `CustomTokenRefreshView` blacklist refresh tokens in the denylist configured in 
+REFRESH_TOKEN_DENYLIST.
 """
 
 from dj_rest_auth.registration.views import RegisterView
@@ -11,7 +13,15 @@ from rest_framework.exceptions import ValidationError
 from django.db import IntegrityError
 from wayfinder.serializers import CustomRegisterSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
-from dj_rest_auth.views import LoginView
+from dj_rest_auth.views import LoginView, LogoutView
+from dj_rest_auth.app_settings import api_settings as rest_auth_settings
+from dj_rest_auth.jwt_auth import get_refresh_view, unset_jwt_cookies
+from django.contrib.auth import logout as django_logout
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import TokenError
+from wayfinder.tokens import DenylistRefreshToken, DenylistTokenRefreshSerializer
 
 
 class CustomRegisterView(RegisterView):
@@ -34,4 +44,36 @@ class CustomLoginView(LoginView):
         response = super().get_response()
         refresh = RefreshToken.for_user(self.user)
         response.data["refresh"] = str(refresh)
-        return response
\ No newline at end of file
+        return response
+
+class CustomLogoutView(LogoutView):
+    """
+    Custom LogoutView that blacklists the refresh token sent in the request data (or the refresh cookie), as the 
+    refresh token is returned in the login response rather than in a cookie. Logging out without one still succeeds
+    """
+    def logout(self, request):
+        try:
+            request.user.auth_token.delete()
+        except (AttributeError, ObjectDoesNotExist):
+            pass
+        if rest_auth_settings.SESSION_LOGIN:
+            django_logout(request)
+
+        response = Response({'detail': 'Successfully logged out.'}, status=status.HTTP_200_OK)
+        unset_jwt_cookies(response)
+
+        refresh = request.data.get('refresh') or request.COOKIES.get(rest_auth_settings.JWT_AUTH_REFRESH_COOKIE or '')
+        if refresh:
+            try:
+                DenylistRefreshToken(refresh).blacklist()
+            except TokenError as error:
+                response.data = {'detail': str(error)}
+                response.status_code = status.HTTP_401_UNAUTHORIZED
+        return response
+
+class CustomTokenRefreshView(get_refresh_view()):
+    """
+    Token refresh view of dj-rest-auth (which also sets the token cookies) that blacklists rotated refresh tokens in
+    the configured denylist
+    """
+    serializer_class = DenylistTokenRefreshSerializer
\ No newline at end of file
@@ -0,0 +1,29 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module provides an API view for inspecting the response cache. The `get_cache_stats` function 
+returns the hit and miss counters of every cached read endpoint and is restricted to staff users.
+"""
+
+from django.http import JsonResponse
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from wayfinder.response_cache import get_cache_stats
+
+"""--- GET REQUESTS ---"""
+
+@api_view(['GET'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAdminUser])
+def get_cache_stats_view(request):
+    """
+    Get the response cache hit and miss counters for each cached view.
+
+    Parameters:
+        request: Request object
+
+    Returns:
+        JsonResponse: JSON response mapping each view name to its hits and misses
+    """
+    return JsonResponse({'data': get_cache_stats()})
@@ -2,27 +2,39 @@
 Author: Matthew Hilliard
 Email: mch2003@bu.edu
 Description: This module contains API views for handling requests related to experiences in the application. 
-It includes functionalities for creating, retrieving, and filtering experiences, as well as retrieving 
-experiences by user ID or specific filters. The module also ensures proper authentication and permission handling.
+It includes functionalities for creating, importing in bulk, retrieving, and filtering experiences, as well as
+retrieving experiences by user ID, specific filters or distance from a point, and streaming every experience for
+exports. The read views are async
+and query through Django's async ORM, so under ASGI a worker keeps serving other requests while they wait on the
+database. The module also ensures proper authentication and permission handling.
 """
 
 from django.http import JsonResponse
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
-from django.shortcuts import get_object_or_404
+from adrf.decorators import api_view as async_api_view
+from django.shortcuts import aget_object_or_404
 from wayfinder.models import Experience, Location
 from wayfinder.serializers import ExperienceSerializer
-from cities_light.models import Country, Region, City
 from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_201_CREATED
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from wayfinder.helpers import find_nearest_city
+from django.conf import settings
+from wayfinder.imports import IMPORT_FORMATS, ExperienceImport, ImportFileError, read_rows
+from wayfinder.authentication import CachedJWTAuthentication
+from wayfinder.helpers import location_instances, resolve_location_names
+from wayfinder.response_cache import cache_response
+from wayfinder.tasks import resolve_location_city
+from wayfinder.managers import TAG_MATCH_MODES
+from wayfinder.fast_serializers import apaginated_response, ndjson_response
+from wayfinder.pagination import (
+    KeysetPaginator, EXPERIENCE_ORDERING, EXPERIENCE_DATE_ORDERING, EXPERIENCE_DISTANCE_ORDERING,
+    EXPERIENCE_RANKING_ORDERING, EXPERIENCE_SEARCH_ORDERING, EXPERIENCE_SEARCH_RANKING_ORDERING,
+)
 from rest_framework.permissions import AllowAny
-from django.db.models import Q
 import json
 
 """--- POST REQUESTS ---"""
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])  # Use JWTAuthentication for token-based auth
+@authentication_classes([CachedJWTAuthentication])  # Use JWT token-based auth, with the user cached
 @permission_classes([]) 
 def create_experience(request):
     """
@@ -32,10 +44,11 @@ def create_experience(request):
     1. Ensure the user is authenticated.
     2. Extract required and optional fields from the request.
     3. Validate required fields (title, description, latitude, longitude).
-    4. Attempt to find the country, region, or city based on the provided data.
-       - If a city name is provided, attempt to match by name.
-       - If no city is found, attempt to match using latitude and longitude incrementally.
-    5. Create or fetch the Location object using the latitude, longitude, and matched data.
+    4. Attempt to find the country, region, or city based on the provided names.
+       - Names are matched ignoring case and accents, including alternate names, the region within the
+         country and the city within the region (or the country).
+       - If no city is found, the city nearest to the latitude and longitude is assigned in the background.
+    5. Create or fetch the Location object at the latitude and longitude, using the matched data.
     6. Create the Experience object using the authenticated user, Location, and request data.
     7. Attach tags to the Experience if provided.
     8. Serialize and return the created Experience object.
@@ -82,21 +95,16 @@ def create_experience(request):
         except json.JSONDecodeError:
             return JsonResponse({'error': 'Tags must be a valid JSON array.'}, status=HTTP_400_BAD_REQUEST)
 
-    # Step 4: Fetch country, region, or city with partial matching
-    country = Country.objects.filter(name__icontains=country_name).first() if country_name else None
-    region = Region.objects.filter(Q(name__icontains=region_name) & Q(country=country)).first() if region_name else None
-    city = City.objects.filter(Q(name__icontains=city_name) & Q(region=region)).first() if city_name else None
-
-    # If no city is found by name, fallback to latitude/longitude incrementally
-    if not city:
-        city = find_nearest_city(latitude, longitude)
+    # Step 4: Resolve the country, region, and city names from the in-memory location index
+    country, region, city = location_instances(resolve_location_names(country_name, region_name, city_name))
 
     # Step 5: Create or fetch the Location
-    location, _ = Location.objects.get_or_create(
-        latitude=latitude,
-        longitude=longitude,
-        defaults={"country": country, "region": region, "city": city}
-    )
+    # (an upsert on the coordinates' grid key, so concurrent requests for the same point share one Location)
+    location, created = Location.objects.upsert(latitude, longitude, country=country, region=region, city=city)
+
+    # If no city is found by name, fallback to the nearest city by latitude/longitude, which a worker looks up
+    if created and not city:
+        resolve_location_city.enqueue(location_id=str(location.location_id))
 
     # Step 6: Create the Experience
     experience = Experience.objects.create(
@@ -116,66 +124,170 @@ def create_experience(request):
     serializer = ExperienceSerializer(experience)
     return JsonResponse({'data': serializer.data}, status=HTTP_201_CREATED)
 
+@api_view(['POST'])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([])
+def import_experiences(request):
+    """
+    Import many experiences at once, created by the authenticated user. Rows with errors are skipped and reported,
+    and the other rows are still imported.
+
+    Steps:
+    1. Ensure the user is authenticated.
+    2. Read the rows from an uploaded "file" (JSON or CSV, by its "format" or file extension), or from the
+       "experiences" list of a JSON body.
+    3. Ensure there are no more rows than IMPORT_MAX_ROWS (larger imports go through the `import_experiences`
+       command).
+    4. Import the rows in batches.
+    5. Return the number of experiences created and the errors of the skipped rows.
+    """
+    # Step 1: Ensure the user is authenticated
+    user = request.user
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'You must be authenticated to perform this action.'}, status=401)
+
+    # Step 2: Read the rows
+    upload = request.FILES.get('file')
+    try:
+        if upload is not None:
+            file_format = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+            rows = list(read_rows(upload, file_format))
+        else:
+            rows = request.data.get('experiences')
+            if not isinstance(rows, list):
+                raise ImportFileError(
+                    f'Upload a file ({", ".join(IMPORT_FORMATS)}) or send an "experiences" list.'
+                )
+    except ImportFileError as error:
+        return JsonResponse({'error': str(error)}, status=HTTP_400_BAD_REQUEST)
+
+    # Step 3: Limit the size of the import
+    max_rows = getattr(settings, 'IMPORT_MAX_ROWS', 10000)
+    if len(rows) > max_rows:
+        return JsonResponse(
+            {'error': f'At most {max_rows} experiences can be imported at once.'}, status=HTTP_400_BAD_REQUEST
+        )
+
+    # Step 4: Import the rows
+    result = ExperienceImport(user).run(rows)
+
+    # Step 5: Return the result
+    return JsonResponse({'data': result})
+
 """--- GET REQUESTS ---"""
 
-@api_view(['GET'])
+@async_api_view(['GET'])
 @authentication_classes([])
 @permission_classes([AllowAny]) 
-def get_experiences(request):
+@cache_response('experience', 'rating', 'tag', 'location', 'user')
+async def get_experiences(request):
     """
-    Get all experiences from the database.
+    Get a page of experiences from the database, sorted by average rating and number of ratings, or by ranking score.
 
     Parameters:
-        request: Request object
+        request: Request object with optional query parameters "sort" ("rating" (default) or "ranking"),
+                 "cursor" (from a previous page's "next_cursor") and "page_size"
 
     Returns:
-        JsonResponse: JSON response with all experiences
+        JsonResponse: JSON response with a page of experiences and the cursor for the next page
     """
-    experiences = Experience.objects.all().order_by('-average_rating', '-number_of_ratings')
-    serializer = ExperienceSerializer(experiences, many=True)
-    return JsonResponse({'data': serializer.data})
+    try:
+        ordering = get_experience_ordering(request)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=HTTP_400_BAD_REQUEST)
+    paginator = KeysetPaginator(request, ordering)
+    return await apaginated_response(ExperienceSerializer, Experience.objects.all(), paginator)
+
+def get_experience_ordering(request, search=False):
+    """
+    Get the ordering selected by the "sort" query parameter: "rating" (default) for average rating then number of
+    ratings, or "ranking" for the ranking score (a Bayesian average of the ratings with time decay, see
+    wayfinder/ranking.py). Full-text search matches are sorted by relevance first.
+
+    Raises:
+        ValueError: When the sort order is unknown
+    """
+    sort = request.GET.get('sort', 'rating')
+    if sort == 'rating':
+        return EXPERIENCE_SEARCH_ORDERING if search else EXPERIENCE_ORDERING
+    if sort == 'ranking':
+        return EXPERIENCE_SEARCH_RANKING_ORDERING if search else EXPERIENCE_RANKING_ORDERING
+    raise ValueError('sort must be "rating" or "ranking".')
+
+def filter_experiences(request):
+    """
+    Get the experiences matching the "tags", "tag_mode", "price", "search_query" and "search_prefix" query
+    parameters. Full-text search matches are annotated with their relevance as `search_rank`.
+
+    Steps:
+    1. Get query parameters.
+    2. Filter by tags (if provided).
+    3. Filter by price (if provided).
+    4. Filter by full-text search query (if provided).
+
+    Raises:
+        ValueError: When a query parameter is invalid
+    """
+    # Step 1: Get query parameters
+    tags = request.GET.get('tags', None)
+    tag_mode = request.GET.get('tag_mode', 'all').lower()
+    price = request.GET.get('price', None)
+    search_query = request.GET.get('search_query', None)
+    search_prefix = request.GET.get('search_prefix', '').lower() == 'true'
+
+    # Start with all experiences
+    experiences = Experience.objects.all()
+
+    # Step 2: Filter by tags (if provided)
+    if tag_mode not in TAG_MATCH_MODES:
+        raise ValueError('tag_mode must be "all" or "any".')
+    if tags:
+        # Convert comma-separated string into a list, and keep experiences with all (or any) of the selected tags
+        experiences = experiences.with_tags(tags.split(','), match=tag_mode)
+
+    # Step 3: Filter by price (if provided)
+    if price:
+        prices = [value for value, _ in Experience._meta.get_field('price').choices]
+        if price not in prices:
+            raise ValueError(f'price must be one of: {", ".join(prices)}.')
+        experiences = experiences.filter(price=price)
+
+    # Step 4: Filter by full-text search query (if provided), annotating each match with its relevance
+    if search_query:
+        experiences = experiences.search(search_query, prefix=search_prefix)
+    return experiences
 
-@api_view(['GET'])
+@async_api_view(['GET'])
 @authentication_classes([])
 @permission_classes([AllowAny]) 
-def get_experiences_with_filters(request):
+async def get_experiences_with_filters(request):
     """
     Get all experiences from the database with filters.
 
     Parameters:
         request: Request object with query parameters for "tags" (comma-separated list of tag names),
-                 "search_query" (search query for title and description),
+                 "tag_mode" ("all" (default) to match experiences with every tag, "any" for at least one),
+                 "price" (e.g., "free", "cheap"),
+                 "search_query" (full-text search query for title and description),
+                 "search_prefix" ("true" to match search terms as prefixes, for search-as-you-type),
                  "location_type" (e.g., "country", "city"),
-                 and "location_id" (ID of the selected location)
+                 "location_id" (ID of the selected location),
+                 "sort" ("rating" (default) or "ranking", after relevance when searching),
+                 and "cursor" / "page_size" for pagination
 
     Returns:
-        JsonResponse: JSON response with filtered experiences
+        JsonResponse: JSON response with a page of filtered experiences and the cursor for the next page
     """
-    # Step 1: Get query parameters
-    tags = request.GET.get('tags', None)
-    search_query = request.GET.get('search_query', None)
+    # Step 1: Filter by tags, price and full-text search query (if provided), and get the sort order
+    try:
+        experiences = filter_experiences(request)
+        ordering = get_experience_ordering(request, search=bool(request.GET.get('search_query')))
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=HTTP_400_BAD_REQUEST)
+
+    # Step 2: Filter by location (if provided)
     location_type = request.GET.get('location_type', None)
     location_id = request.GET.get('location_id', None)
-    
-    # Start with all experiences
-    experiences = Experience.objects.all()
-    
-    # Step 2: Filter by tags (if provided)
-    if tags:
-        # Convert comma-separated string into a list
-        tag_list = tags.split(',')
-        
-        # Filter experiences to ensure they have all the selected tags
-        for tag_name in tag_list:
-            experiences = experiences.filter(tags__name=tag_name)
-            
-    # Step 3: Filter by search query (if provided)
-    if search_query:
-        experiences = experiences.filter(
-            Q(title__icontains=search_query) | Q(description__icontains=search_query)
-        )
-        
-    # Step 4: Filter by location (if provided)
     if location_type and location_id:
         if location_type == 'country':
             # Filter by country (match experiences where the location's country matches the location_id)
@@ -184,17 +296,76 @@ def get_experiences_with_filters(request):
             # Filter by city (match experiences where the location's city matches the location_id)
             experiences = experiences.filter(location__city_id=location_id)
         
-    # Step 5: Sort by average rating and number of ratings
-    experiences = experiences.order_by('-average_rating', '-number_of_ratings')
+    # Step 3: Sort by relevance when searching, then by rating or ranking score, and fetch the requested page
+    paginator = KeysetPaginator(request, ordering)
     
-    # Step 6: Serialize and return the response
-    serializer = ExperienceSerializer(experiences, many=True)
-    return JsonResponse({'data': serializer.data})
+    # Step 4: Serialize and return the response
+    return await apaginated_response(ExperienceSerializer, experiences, paginator)
 
-@api_view(['GET'])
+@async_api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+async def get_nearby_experiences(request):
+    """
+    Get the experiences within a distance of a point, nearest, best rated or best ranked first.
+
+    Steps:
+    1. Validate the point, radius and sort order.
+    2. Filter by tags, price and full-text search query (if provided).
+    3. Keep the experiences within the radius, narrowed by the coordinate index before computing distances.
+    4. Sort by distance, rating or ranking score, and fetch the requested page.
+
+    Parameters:
+        request: Request object with query parameters "latitude" and "longitude" (the point),
+                 "radius_km" (distance from the point, defaults to NEARBY_DEFAULT_RADIUS_KM and is at most
+                 NEARBY_MAX_RADIUS_KM), "sort" ("distance" (default), "rating" or "ranking"),
+                 the "tags", "tag_mode", "price", "search_query" and "search_prefix" filters of
+                 get_experiences_with_filters, and "cursor" / "page_size" for pagination
+
+    Returns:
+        JsonResponse: JSON response with a page of nearby experiences and the cursor for the next page
+    """
+    # Step 1: Validate the point, radius and sort order
+    max_radius = getattr(settings, 'NEARBY_MAX_RADIUS_KM', 100)
+    try:
+        latitude = float(request.GET['latitude'])
+        longitude = float(request.GET['longitude'])
+        radius = float(request.GET.get('radius_km') or getattr(settings, 'NEARBY_DEFAULT_RADIUS_KM', 10))
+    except KeyError:
+        return JsonResponse({'error': 'Latitude and longitude are required.'}, status=HTTP_400_BAD_REQUEST)
+    except ValueError:
+        return JsonResponse({'error': 'Latitude, longitude, and radius_km must be valid floating-point numbers.'},
+                            status=HTTP_400_BAD_REQUEST)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'error': 'Latitude and longitude are out of range.'}, status=HTTP_400_BAD_REQUEST)
+    if not 0 < radius <= max_radius:
+        return JsonResponse({'error': f'radius_km must be greater than 0 and at most {max_radius:g}.'},
+                            status=HTTP_400_BAD_REQUEST)
+    orderings = {
+        'distance': EXPERIENCE_DISTANCE_ORDERING, 'rating': EXPERIENCE_ORDERING, 'ranking': EXPERIENCE_RANKING_ORDERING,
+    }
+    ordering = orderings.get(request.GET.get('sort', 'distance'))
+    if ordering is None:
+        return JsonResponse({'error': 'sort must be "distance", "rating" or "ranking".'}, status=HTTP_400_BAD_REQUEST)
+
+    # Step 2: Filter by tags, price and full-text search query (if provided)
+    try:
+        experiences = filter_experiences(request)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=HTTP_400_BAD_REQUEST)
+
+    # Step 3: Keep the experiences within the radius, annotated with their distance
+    experiences = experiences.near(latitude, longitude, radius)
+
+    # Step 4: Sort by distance, rating or ranking score, and fetch the requested page
+    paginator = KeysetPaginator(request, ordering)
+    return await apaginated_response(ExperienceSerializer, experiences, paginator)
+
+@async_api_view(['GET'])
 @authentication_classes([])
 @permission_classes([AllowAny]) 
-def get_experience_by_id(request, experience_id):
+@cache_response('experience', 'rating', 'tag', 'location', 'user')
+async def get_experience_by_id(request, experience_id):
     """
     Gets an experience from the database by its experience_id.
 
@@ -205,24 +376,41 @@ def get_experience_by_id(request, experience_id):
     Returns:
         JsonResponse: JSON response with the experience
     """
-    experience = get_object_or_404(Experience, experience_id=experience_id)
+    experiences = ExperienceSerializer.setup_eager_loading(Experience.objects.all())
+    experience = await aget_object_or_404(experiences, experience_id=experience_id)
     serializer = ExperienceSerializer(experience)
     return JsonResponse({'data': serializer.data})
 
-@api_view(['GET'])
+@async_api_view(['GET'])
 @authentication_classes([])
 @permission_classes([AllowAny])
-def get_experiences_by_user_id(request, user_id):
+async def get_experiences_by_user_id(request, user_id):
     """
-    Get all experiences created by a specific user.
+    Get the experiences created by a specific user, newest first.
 
     Parameters:
-        request: Request object
+        request: Request object with optional "cursor" and "page_size" query parameters
         user_id: ID of the user
 
     Returns:
-        JsonResponse: JSON response with all experiences created by the user
+        JsonResponse: JSON response with a page of experiences created by the user and the cursor for the next page
+    """
+    paginator = KeysetPaginator(request, EXPERIENCE_DATE_ORDERING)
+    return await apaginated_response(ExperienceSerializer, Experience.objects.filter(creator=user_id), paginator)
+
+@async_api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+async def export_experiences(request):
+    """
+    Stream every experience as newline-delimited JSON, for consumers that need all of them (e.g. search indexing).
+    Rows are read through a server-side cursor and encoded a chunk at a time, so memory use does not grow
+    with the number of experiences.
+
+    Parameters:
+        request: Request object
+
+    Returns:
+        StreamingHttpResponse: One serialized experience per line, ordered by experience_id
     """
-    experiences = Experience.objects.filter(creator=user_id).order_by('-date_posted')
-    serializer = ExperienceSerializer(experiences, many=True)
-    return JsonResponse({'data': serializer.data})
\ No newline at end of file
+    return ndjson_response(ExperienceSerializer, Experience.objects.order_by('experience_id'), request)
\ No newline at end of file
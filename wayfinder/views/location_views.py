@@ -4,47 +4,55 @@ Email: mch2003@bu.edu
 Description: This module provides an API view for searching cities and countries. 
 The `city_search` function retrieves matching countries and cities based on a search 
 query and returns their details, including city name, region, and country, in a structured JSON response.
+Matches are served from an in-memory index of country and city names that is built once per worker. The view is
+async, and runs the index lookup (which may build or refresh the index from the database) in a worker thread.
 """
 
 from django.http import JsonResponse
-from rest_framework.decorators import api_view, authentication_classes, permission_classes
-from cities_light.models import Country, City
+from asgiref.sync import sync_to_async
+from rest_framework.decorators import authentication_classes, permission_classes
+from adrf.decorators import api_view
 from rest_framework.permissions import AllowAny
+from wayfinder.indexes.city_search import city_search_index
+from wayfinder.response_cache import cache_response
 
 @api_view(['GET'])
 @authentication_classes([])
 @permission_classes([AllowAny]) 
-def city_search(request):
+@cache_response('cities')
+async def city_search(request):
     """
     Search for cities and countries based on the provided query.
+    Names and alternate names are matched as case- and accent-insensitive substrings, names starting with the query
+    first, then most populous first.
     """
     query = request.GET.get('q', '')  # Get the search query
     
     data = [] # Declare initial data list
     
     # Match countries
-    countries = Country.objects.filter(name__icontains=query)[:5]
+    countries = await sync_to_async(city_search_index.search_countries)(query, limit=5)
     
     # Match cities with their associated regions and countries
-    cities = City.objects.filter(name__icontains=query).select_related('region', 'country')[:10]
+    cities = await sync_to_async(city_search_index.search_cities)(query, limit=10)
     
     # Combine Results
     for country in countries:
         data.append({
-            "city_id": country.id,
+            "city_id": country['id'],
             "type": "country",
             "name": None,
             "region": None,
-            "country": country.name,
+            "country": country['name'],
         })
 
     for city in cities:
         data.append({
-            "city_id": city.id,
+            "city_id": city['id'],
             "type": "city",
-            "name": city.name or None,
-            "region": city.region.name if city.region else None,
-            "country": city.country.name if city.country else None,
+            "name": city['name'] or None,
+            "region": city['region'],
+            "country": city['country'],
         })
 
     return JsonResponse({'data': data}, safe=False)
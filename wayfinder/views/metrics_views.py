@@ -0,0 +1,42 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module provides the API view that exposes the request metrics in the Prometheus text format.
+The `get_metrics` function returns the per-view latency, SQL and serialization histograms and the response cache
+counters. It requires the METRICS_TOKEN bearer token when one is configured, and is refused in production without
+one.
+"""
+
+import hmac
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from prometheus_client import CONTENT_TYPE_LATEST
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny
+from wayfinder.metrics import render_metrics
+
+"""--- GET REQUESTS ---"""
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def get_metrics(request):
+    """
+    Get the request metrics for a Prometheus scrape.
+
+    Parameters:
+        request: Request object, with an "Authorization: Bearer <METRICS_TOKEN>" header when a token is configured
+                 (required in production)
+
+    Returns:
+        HttpResponse: The metrics in the Prometheus text format
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        provided = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(provided.encode('utf-8'), token.encode('utf-8')):
+            return JsonResponse({'error': 'A valid metrics token is required.'}, status=401)
+    elif not getattr(settings, 'METRICS_OPEN_WITHOUT_TOKEN', False):
+        # Never expose the metrics of a production deployment that has no token configured
+        return JsonResponse({'error': 'Metrics are disabled until METRICS_TOKEN is configured.'}, status=403)
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
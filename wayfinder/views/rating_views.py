@@ -2,30 +2,35 @@
 Author: Matthew Hilliard
 Email: mch2003@bu.edu
 Description: This module provides API views for creating and retrieving ratings for experiences. 
-The `create_rating` function allows authenticated users to rate an experience and updates the 
-experience's average rating and number of ratings. The `get_experience_ratings` function retrieves 
-all ratings for a specific experience, sorted by the most recent date.
+The `create_rating` function allows authenticated users to rate an experience and queues the update of the 
+experience's rating aggregates (average, count, sum and histogram) as a background task. The `get_experience_ratings` function retrieves 
+all ratings for a specific experience, sorted by the most recent date, through Django's async ORM.
 """
 
 from django.http import JsonResponse
-from django.shortcuts import get_list_or_404
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from adrf.decorators import api_view as async_api_view
 from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_201_CREATED
-from django.db.models import F
+from django.db import transaction
 from wayfinder.models import Experience, Rating
 from wayfinder.serializers import RatingSerializer
+from wayfinder.tasks import record_rating
 from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from wayfinder.authentication import CachedJWTAuthentication
 from django.shortcuts import get_object_or_404
+from wayfinder.fast_serializers import apaginated_response
+from wayfinder.pagination import KeysetPaginator, RATING_ORDERING
+from wayfinder.conditional import conditional_list, queryset_state
+from django.core.exceptions import ValidationError
 
 """--- POST REQUESTS ---"""
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([])
 def create_rating(request):
     """
-    Create a new rating for an experience and update the average rating and number of ratings.
+    Create a new rating for an experience and queue the update of the experience's rating aggregates.
 
     Steps:
     1. Ensure the user is authenticated.
@@ -33,7 +38,7 @@ def create_rating(request):
     3. Validate required fields (experience_id, rating_value, comment).
     4. Get the experience or throw 404 if not found.
     5. Create a new Rating object.
-    6. Update the experience's average rating and number of ratings.
+    6. Queue the update of the experience's rating aggregates in the same transaction.
     7. Serialize and return the created Rating object.
     """
     # Step 1: Ensure the user is authenticated
@@ -74,25 +79,27 @@ def create_rating(request):
     # Step 4: Get the experience or throw 404 if not found
     experience = get_object_or_404(Experience, experience_id=experience_id)
 
-    # Step 5: Create a new Rating object
-    rating = Rating.objects.create(
-        user=user,
-        experience=experience,
-        rating_value=rating_value,
-        comment=comment
-    )
+    with transaction.atomic():
+        # Step 5: Create a new Rating object
+        rating = Rating.objects.create(
+            user=user,
+            experience=experience,
+            rating_value=rating_value,
+            comment=comment
+        )
 
-    # Step 6: Update the experience's average rating and number of ratings if a rating value was provided
+        # Step 6: Queue the update of the experience's rating aggregates if a rating value was provided, so
+        # requests rating a popular experience don't queue up behind each other's lock of its row
+        if rating_value is not None:
+            record_rating.enqueue(experience_id=str(experience.experience_id), rating_value=rating_value)
+
+    # Count the rating in the response's aggregates, as the task will
     if rating_value is not None:
-        total_ratings = experience.number_of_ratings
-        new_total_ratings = total_ratings + 1
-        new_average_rating = ((experience.average_rating * total_ratings) + rating_value) / new_total_ratings
-        experience.average_rating = new_average_rating
-    
-        # Update fields in the database for number of ratings
-        experience.number_of_ratings = new_total_ratings
-    
-    experience.save()
+        histogram_field = f'rating_{rating_value}_count'
+        experience.rating_sum += rating_value
+        experience.number_of_ratings += 1
+        experience.average_rating = experience.rating_sum / experience.number_of_ratings
+        setattr(experience, histogram_field, getattr(experience, histogram_field) + 1)
 
     # Step 7: Serialize and return the created rating
     serializer = RatingSerializer(rating)
@@ -100,23 +107,39 @@ def create_rating(request):
 
 """--- GET REQUESTS ---"""
 
-@api_view(['GET'])
+def experience_ratings_state(request, experience_id):
+    """
+    Fingerprint an experience's ratings by their count and newest date_posted, for ETag / Last-Modified, along with
+    the versions of the users and experience details embedded in them.
+    Returns None when there are no ratings (or the ID is malformed), so the view can respond as usual.
+    """
+    try:
+        state = queryset_state(
+            Rating.objects.filter(experience_id=experience_id), 'date_posted',
+            depends_on=('user', 'experience', 'location', 'tag', 'cities'),
+        )
+    except ValidationError:
+        return None
+    return state if state.last_modified is not None else None
+
+@async_api_view(['GET'])
 @authentication_classes([])
 @permission_classes([AllowAny]) 
-def get_experience_ratings(request, experience_id):
+@conditional_list(experience_ratings_state)
+async def get_experience_ratings(request, experience_id):
     """
-    Get all ratings for a specific experience, sorted by date (most recent first).
+    Get the ratings for a specific experience, sorted by date (most recent first).
 
     Parameters:
-        request: Request object
+        request: Request object with optional "cursor" and "page_size" query parameters
         experience_id: The ID of the experience to get ratings for
 
     Returns:
-        JsonResponse: JSON response with all ratings for the experience sorted by date
+        JsonResponse: JSON response with a page of ratings for the experience and the cursor for the next page
     """
-    # Get all ratings for the experience sorted by date, throw 404 if none found
-    ratings = get_list_or_404(Rating.objects.order_by('-date_posted'), experience_id=experience_id)
-    
-    # Serialize the ratings and return them in a JSON response
-    serializer = RatingSerializer(ratings, many=True)
-    return JsonResponse({'data': serializer.data}, status=200)
+    # Get a page of ratings for the experience sorted by date, throw 404 if none found,
+    # then serialize the ratings and return them in a JSON response
+    paginator = KeysetPaginator(request, RATING_ORDERING)
+    return await apaginated_response(
+        RatingSerializer, Rating.objects.filter(experience_id=experience_id), paginator, empty_404=True
+    )
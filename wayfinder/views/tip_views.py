@@ -3,24 +3,29 @@ Author: Matthew Hilliard
 Email: mch2003@bu.edu
 Description: This module provides API views for managing tips in the application. The `create_tip` 
 function allows authenticated users to create a new tip for a specified location. The `get_tips_with_filters` 
-function retrieves tips with optional filters for location type and ID, and the `get_tips_by_user_id` 
-function retrieves tips created by a specific user.
+function retrieves tips with optional filters for location type and ID, the `get_tips_by_user_id` 
+function retrieves tips created by a specific user, and the `export_tips` function streams every filtered tip.
+The read views are async and query through Django's async ORM.
 """
 
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
-from django.shortcuts import get_object_or_404
+from adrf.decorators import api_view as async_api_view
 from wayfinder.models import Tip
-from cities_light.models import Country, City
 from wayfinder.serializers import TipSerializer
 from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from wayfinder.authentication import CachedJWTAuthentication
+from wayfinder.helpers import location_instances, resolve_location_id
 from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_201_CREATED
+from wayfinder.response_cache import cache_response
+from wayfinder.conditional import conditional_list, queryset_state
+from wayfinder.fast_serializers import apaginated_response, ndjson_response
+from wayfinder.pagination import KeysetPaginator, TIP_ORDERING
 
 """--- POST REQUESTS ---"""
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([])
 def create_tip(request):
     """
@@ -58,15 +63,15 @@ def create_tip(request):
             status=HTTP_400_BAD_REQUEST
         )
 
-    # Step 4: Get the city/country or throw 404 if not found
+    # Step 4: Resolve the city/country from the in-memory location index or throw 404 if not found
     country = None
     city = None
 
-    if location_type == 'country':
-        country = get_object_or_404(Country, id=location_id)
-    elif location_type == 'city':
-        city = get_object_or_404(City, id=location_id)
-        country = city.country  # Assign the associated country from the city
+    if location_type in ('country', 'city'):
+        location = resolve_location_id(location_type, location_id)
+        if location is None:
+            raise Http404(f'No {location_type} matches the given query.')
+        country, _, city = location_instances(location)  # A city's country comes from the city
 
     # Step 5: Create a new Tip object
     tip = Tip.objects.create(
@@ -82,25 +87,18 @@ def create_tip(request):
 
 """--- GET REQUESTS ---"""
 
-@api_view(['GET'])
-@authentication_classes([])
-@permission_classes([AllowAny])
-def get_tips_with_filters(request):
+def filter_tips(request):
     """
-    Get all tips from the database with filters.
-
-    Parameters:
-        request: Request object with query parameters for "location_type" (e.g., "country", "city"),
-                 and "location_id" (ID of the selected location)
+    Get the tips matching the "location_type" and "location_id" query parameters.
 
-    Returns:
-        JsonResponse: JSON response with filtered tips
+    Steps:
+    1. Get query parameters.
+    2. Filter by location (if provided).
     """
     # Step 1: Get query parameters
     location_type = request.GET.get('location_type', None)
     location_id = request.GET.get('location_id', None)
     
-    # Start with all tips
     tips = Tip.objects.all()
     
     # Step 2: Filter by location (if provided)
@@ -111,28 +109,70 @@ def get_tips_with_filters(request):
         elif location_type == 'city':
             # Filter by city (match tips where the location's city matches the location_id)
             tips = tips.filter(city=location_id)
+    return tips
+
+def tips_state(request):
+    """
+    Fingerprint the filtered tips by their count and newest date_posted, for ETag / Last-Modified, along with the
+    versions of the creators and places embedded in them.
+    """
+    return queryset_state(filter_tips(request), 'date_posted', depends_on=('user', 'cities'))
+
+@async_api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+@conditional_list(tips_state)
+@cache_response('tip', 'user')
+async def get_tips_with_filters(request):
+    """
+    Get all tips from the database with filters.
+
+    Parameters:
+        request: Request object with query parameters for "location_type" (e.g., "country", "city"),
+                 "location_id" (ID of the selected location), and "cursor" / "page_size" for pagination
+
+    Returns:
+        JsonResponse: JSON response with a page of filtered tips and the cursor for the next page
+    """
+    # Steps 1-2: Get all tips matching the location filters
+    tips = filter_tips(request)
     
-    # Step 3: Sort tips by creation date (newest first)
-    tips = tips.order_by('-date_posted')
+    # Step 3: Sort tips by creation date (newest first) and fetch the requested page
+    paginator = KeysetPaginator(request, TIP_ORDERING)
     
     # Step 4: Serialize and return the response
-    serializer = TipSerializer(tips, many=True)
-    return JsonResponse({'data': serializer.data})
+    return await apaginated_response(TipSerializer, tips, paginator)
 
-@api_view(['GET'])
+@async_api_view(['GET'])
 @authentication_classes([])
 @permission_classes([AllowAny])
-def get_tips_by_user_id(request, user_id):
+async def get_tips_by_user_id(request, user_id):
     """
-    Get all tips created by a specific user.
+    Get the tips created by a specific user, newest first.
 
     Parameters:
-        request: Request object
+        request: Request object with optional "cursor" and "page_size" query parameters
         user_id: ID of the user
 
     Returns:
-        JsonResponse: JSON response with all tips created by the user
+        JsonResponse: JSON response with a page of tips created by the user and the cursor for the next page
+    """
+    paginator = KeysetPaginator(request, TIP_ORDERING)
+    return await apaginated_response(TipSerializer, Tip.objects.filter(creator=user_id), paginator)
+
+@async_api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+async def export_tips(request):
+    """
+    Stream every tip matching the filters as newline-delimited JSON, for consumers that need all of them.
+    Rows are read through a server-side cursor and encoded a chunk at a time, so memory use does not grow
+    with the number of tips.
+
+    Parameters:
+        request: Request object with optional query parameters "location_type" and "location_id"
+
+    Returns:
+        StreamingHttpResponse: One serialized tip per line, newest first
     """
-    tips = Tip.objects.filter(creator=user_id).order_by('-date_posted')
-    serializer = TipSerializer(tips, many=True)
-    return JsonResponse({'data': serializer.data})
+    return ndjson_response(TipSerializer, filter_tips(request).order_by(*TIP_ORDERING), request)
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+Author: Matthew Hilliard
+Email: mch2003@bu.edu
+Description: This module provides API views for uploading images straight to S3. The `create_upload` function
+issues a presigned POST for an experience image or a profile picture, which the client sends the file to directly,
+and the `confirm_upload` function attaches the uploaded object to the experience or the authenticated user once the
+upload is done. The image bytes never pass through the web workers.
+"""
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.status import HTTP_201_CREATED, HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN, HTTP_501_NOT_IMPLEMENTED
+from wayfinder.authentication import CachedJWTAuthentication
+from wayfinder.images import variants_field
+from wayfinder.models import Experience
+from wayfinder.serializers import ExperienceSerializer, UserSerializer
+from wayfinder.uploads import (
+    ALLOWED_CONTENT_TYPES, UPLOAD_TARGETS, create_presigned_upload, direct_uploads_enabled, load_upload_token,
+)
+
+"""--- POST REQUESTS ---"""
+
+@api_view(['POST'])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([])
+def create_upload(request):
+    """
+    Issue a presigned POST to upload an image straight to S3.
+
+    Steps:
+    1. Ensure the user is authenticated and files are stored in S3.
+    2. Validate the upload target ("experience_image" or "profile_picture") and content type.
+    3. Return the URL and form fields to POST the file with, and the token to confirm the upload with.
+    """
+    # Step 1: Ensure the user is authenticated and files are stored in S3
+    user = request.user
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'You must be authenticated to perform this action.'}, status=401)
+    if not direct_uploads_enabled():
+        return JsonResponse(
+            {'error': 'Direct uploads are only available with S3 storage.'}, status=HTTP_501_NOT_IMPLEMENTED
+        )
+
+    # Step 2: Validate the upload target and content type
+    target = request.data.get('target')
+    content_type = request.data.get('content_type')
+    if target not in UPLOAD_TARGETS:
+        return JsonResponse(
+            {'error': f'Target must be one of: {", ".join(UPLOAD_TARGETS)}.'}, status=HTTP_400_BAD_REQUEST
+        )
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        return JsonResponse(
+            {'error': f'Content type must be one of: {", ".join(ALLOWED_CONTENT_TYPES)}.'}, status=HTTP_400_BAD_REQUEST
+        )
+
+    # Step 3: Presign the upload
+    return JsonResponse({'data': create_presigned_upload(user, target, content_type)}, status=HTTP_201_CREATED)
+
+@api_view(['POST'])
+@authentication_classes([CachedJWTAuthentication])
+@permission_classes([])
+def confirm_upload(request):
+    """
+    Attach an uploaded image to its experience or to the authenticated user.
+
+    Steps:
+    1. Ensure the user is authenticated.
+    2. Validate the upload token and that it was issued to this user.
+    3. Ensure the upload reached S3.
+    4. Attach the object to the experience (which the user must have created) or to the user's profile picture.
+       Saving the image schedules its resized variants.
+    5. Serialize and return the experience or user.
+    """
+    # Step 1: Ensure the user is authenticated
+    user = request.user
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'You must be authenticated to perform this action.'}, status=401)
+
+    # Step 2: Validate the upload token
+    try:
+        upload = load_upload_token(request.data.get('upload_token') or '')
+    except signing.BadSignature:
+        return JsonResponse({'error': 'The upload token is invalid or has expired.'}, status=HTTP_400_BAD_REQUEST)
+    if upload['user'] != str(user.pk):
+        return JsonResponse({'error': 'You are not authorized to confirm this upload.'}, status=HTTP_403_FORBIDDEN)
+
+    # Step 3: Ensure the upload reached S3 (a HEAD request, the file itself is not read)
+    if not default_storage.exists(upload['name']):
+        return JsonResponse({'error': 'The file has not been uploaded yet.'}, status=HTTP_400_BAD_REQUEST)
+
+    # Step 4: Attach the object
+    _, field_name = UPLOAD_TARGETS[upload['target']]
+    if upload['target'] == 'experience_image':
+        try:
+            # Load the relations the response serializes along with the experience
+            experiences = ExperienceSerializer.setup_eager_loading(Experience.objects.all())
+            instance = get_object_or_404(experiences, pk=request.data.get('experience_id'))
+        except ValidationError:
+            return JsonResponse({'error': 'Experience ID must be a valid UUID.'}, status=HTTP_400_BAD_REQUEST)
+        if instance.creator_id != user.pk:
+            return JsonResponse({'error': 'You can only change your own experiences.'}, status=HTTP_403_FORBIDDEN)
+        serializer_class = ExperienceSerializer
+    else:
+        instance = user
+        serializer_class = UserSerializer
+    setattr(instance, field_name, upload['name'])
+    instance.save(update_fields=[field_name, variants_field(field_name)])
+
+    # Step 5: Serialize and return the updated object
+    serializer = serializer_class(instance)
+    return JsonResponse({'data': serializer.data})
@@ -1,23 +1,24 @@
 """
 Author: Matthew Hilliard
 Email: mch2003@bu.edu
-Description: This module provides API views for managing user data. The `get_user_by_id` function 
-retrieves a user's details by their ID, while the `update_user` function allows an authenticated user 
+Description: This module provides API views for managing user data. The async `get_user_by_id` function 
+retrieves a user's details by their ID through Django's async ORM, while the `update_user` function allows an authenticated user 
 to update their own profile information, including their name and profile picture.
 """
 
 from django.http import JsonResponse
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from adrf.decorators import api_view as async_api_view
 from wayfinder.models import User
-from django.shortcuts import get_object_or_404
+from django.shortcuts import aget_object_or_404
 from wayfinder.serializers import UserSerializer
 from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
-@api_view(['GET'])
+@async_api_view(['GET'])
 @authentication_classes([])
 @permission_classes([AllowAny]) 
-def get_user_by_id(request, user_id):
+async def get_user_by_id(request, user_id):
     """
     Gets an user from the database by its user_id.
 
@@ -28,7 +29,8 @@ def get_user_by_id(request, user_id):
     Returns:
         JsonResponse: JSON response with the user
     """
-    user = get_object_or_404(User, pk=user_id)
+    # Load the related objects up front, serializing must not query from the event loop
+    user = await aget_object_or_404(UserSerializer.setup_eager_loading(User.objects.all()), pk=user_id)
     serializer = UserSerializer(user)
     return JsonResponse({'data': serializer.data})
 
@@ -13,11 +13,14 @@ from django.http import JsonResponse
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from wayfinder.models import Experience, Wishlist, WishlistItem
 from wayfinder.serializers import WishlistSerializer, WishlistItemSerializer
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from wayfinder.authentication import CachedJWTAuthentication
 from django.shortcuts import get_object_or_404
+from wayfinder.fast_serializers import paginated_response
+from wayfinder.pagination import KeysetPaginator, WISHLIST_ITEM_ORDERING
+from wayfinder.conditional import conditional_list, queryset_state
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([])
 def create_wishlist(request):
     """
@@ -41,7 +44,7 @@ def create_wishlist(request):
     return JsonResponse({"data": serializer.data}, status=201)
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([])
 def create_wishlist_item(request, wishlist_id): 
     """
@@ -78,9 +81,26 @@ def create_wishlist_item(request, wishlist_id):
 
     return JsonResponse({"data": serializer.data}, status=201)
 
+def user_wishlists_state(request, user_id):
+    """
+    Fingerprint a user's wishlists by their count and newest created_date, for ETag / Last-Modified.
+    The embedded user info is part of the fingerprint too, since it can change without a new wishlist, and changes
+    to users and places move Last-Modified.
+    Returns None when the user may not see the wishlists, so the view can reject the request as usual.
+    """
+    user = request.user
+    if not user.is_authenticated or str(user.id) != str(user_id):
+        return None
+    return queryset_state(
+        Wishlist.objects.filter(user=user), 'created_date',
+        user.name, user.email, user.bio, user.country_id, user.city_id, user.profile_picture.name,
+        user.profile_picture_variants.get('source'), depends_on=('user', 'cities'),
+    )
+
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([]) 
+@conditional_list(user_wishlists_state)
 def get_user_wishlists(request, user_id):
     """
     Gets all wishlists for a specific user given their user_id.
@@ -92,21 +112,23 @@ def get_user_wishlists(request, user_id):
         return JsonResponse({'error': 'You are not authorized to access this resource.'}, status=403)
 
     # Fetch wishlists for the authenticated user
-    wishlists = Wishlist.objects.filter(user=user)
+    wishlists = WishlistSerializer.setup_eager_loading(Wishlist.objects.filter(user=user))
     serializer = WishlistSerializer(wishlists, many=True)
     return JsonResponse({"data": serializer.data}, status=200)
 
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication])
+@authentication_classes([CachedJWTAuthentication])
 @permission_classes([])
 def get_wishlist_items(request, wishlist_id):
+    """
+    Gets a page of the items in a specific wishlist, newest first, ensuring the wishlist belongs to the user.
+    Accepts optional "cursor" and "page_size" query parameters.
+    """
     user = request.user # Get the authenticated user
     
     # Fetch the wishlist
     wishlist = get_object_or_404(Wishlist, wishlist_id=wishlist_id, user=user)
 
-    # Fetch wishlists for the authenticated user
-    wishlist_items = WishlistItem.objects.filter(wishlist=wishlist)
-    serializer = WishlistItemSerializer(wishlist_items, many=True)
-    
-    return JsonResponse({"data": serializer.data}, status=200)
+    # Fetch the items in the wishlist
+    paginator = KeysetPaginator(request, WISHLIST_ITEM_ORDERING)
+    return paginated_response(WishlistItemSerializer, WishlistItem.objects.filter(wishlist=wishlist), paginator)